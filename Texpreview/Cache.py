@@ -0,0 +1,162 @@
+# -*- coding: utf-8 -*-
+############################################################################
+#    Copyright (C) 2008 by Michael Goerz                                   #
+#    http://www.physik.fu-berlin.de/~goerz                                 #
+#                                                                          #
+#    This program is free software; you can redistribute it and/or modify  #
+#    it under the terms of the GNU General Public License as published by  #
+#    the Free Software Foundation; either version 3 of the License, or     #
+#    (at your option) any later version.                                   #
+#                                                                          #
+#    This program is distributed in the hope that it will be useful,       #
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of        #
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the         #
+#    GNU General Public License for more details.                          #
+#                                                                          #
+#    You should have received a copy of the GNU General Public License     #
+#    along with this program; if not, write to the                         #
+#    Free Software Foundation, Inc.,                                       #
+#    59 Temple Place - Suite 330, Boston, MA  02111-1307, USA.             #
+############################################################################
+
+""" This module contains the Cache class, which keeps data that should
+    survive between sessions of texpreview, and functions to compute
+    fingerprints of files.
+
+    The cache lives in a hidden directory (CACHEDIR) next to the texfile.
+    Each entry is stored in its own file in that directory, and is written
+    atomically, so that an interrupted session never leaves a corrupt entry
+    behind. Entries that can't be read are treated as missing.
+
+    Entries are stored as JSON, so that loading the cache of a project
+    (e.g. one that was cloned together with its cache directory) can't
+    run any code. Byte strings are stored as latin-1, which round-trips
+    every byte; tuples come back as lists.
+"""
+
+import os
+import json
+import hashlib
+import TexpreviewPrinter as Out
+VERB_SILENT = Out.VERB_SILENT
+VERB_ERR    = Out.VERB_ERR
+VERB_WARN   = Out.VERB_WARN
+VERB_STATUS = Out.VERB_STATUS
+VERB_DEBUG  = Out.VERB_DEBUG
+
+
+# Name of the cache directory, relative to the directory of the texfile
+CACHEDIR = '.texpreview'
+
+# Block size for reading files that are digested
+BLOCKSIZE = 1024 * 1024
+
+# Encoding of the byte strings in the JSON entries
+ENCODING = 'latin-1'
+
+
+class Cache(object):
+    """ Persistent storage for data that belongs to one directory """
+
+    def __init__(self, directory):
+        """ Create a cache that stores its entries in 'directory'. The
+            directory is only created when the first entry is saved.
+        """
+        self.directory = directory
+
+    def path(self, name):
+        """ Return the filename of the entry 'name' """
+        return os.path.join(self.directory, name)
+
+    def load(self, name, default=None):
+        """ Return the data stored in the entry 'name', or default if the
+            entry does not exist or can't be read
+        """
+        try:
+            afile = open(self.path(name), 'rb')
+            try:
+                return _decode(json.load(afile))
+            finally:
+                afile.close()
+        except IOError:
+            return default
+        except Exception, data:
+            Out.write("Ignoring unreadable cache entry %s: %s\n", VERB_DEBUG,
+                      args=(self.path(name), data))
+            return default
+
+    def save(self, name, data):
+        """ Store data in the entry 'name'. Return True on success """
+        filename = self.path(name)
+        tempfilename = "%s.%s.tmp" % (filename, os.getpid())
+        try:
+            if not os.path.isdir(self.directory):
+                os.makedirs(self.directory)
+            afile = open(tempfilename, 'wb')
+            try:
+                json.dump(data, afile, encoding=ENCODING)
+            finally:
+                afile.close()
+            os.rename(tempfilename, filename)
+        except (IOError, OSError), data:
+            Out.write("Could not write cache entry %s: %s\n" \
+                      % (filename, data), VERB_WARN)
+            return False
+        except (TypeError, ValueError), data:
+            Out.write("Could not write cache entry %s: %s\n" \
+                      % (filename, data), VERB_WARN)
+            try:
+                os.remove(tempfilename)
+            except OSError:
+                pass
+            return False
+        return True
+
+
+def _decode(data):
+    """ Turn the unicode strings in data, as loaded from JSON, back into
+        byte strings
+    """
+    if isinstance(data, unicode):
+        return data.encode(ENCODING)
+    if isinstance(data, list):
+        return [_decode(item) for item in data]
+    if isinstance(data, dict):
+        result = {}
+        for key, value in data.items():
+            result[_decode(key)] = _decode(value)
+        return result
+    return data
+
+
+def digest(filename):
+    """ Return the hex digest of the content of filename, or None if the
+        file can't be read
+    """
+    hasher = hashlib.sha1()
+    try:
+        afile = open(filename, 'rb')
+        try:
+            while True:
+                block = afile.read(BLOCKSIZE)
+                if not block:
+                    break
+                hasher.update(block)
+        finally:
+            afile.close()
+    except IOError:
+        return None
+    return hasher.hexdigest()
+
+
+def fingerprint(filename, previous=None):
+    """ Return a tuple (size, mtime, digest) for filename. If previous is
+        a fingerprint with the same size and modification time, it is
+        returned without reading the file again. Raises OSError if the file
+        does not exist.
+    """
+    stat = os.stat(filename)
+    if previous is not None and previous[0] == stat.st_size \
+    and previous[1] == stat.st_mtime:
+        return tuple(previous)
+    return (stat.st_size, stat.st_mtime, digest(filename))
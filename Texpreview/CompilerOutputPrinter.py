@@ -29,7 +29,10 @@
 
 import re
 import os
+import time
 from struct import unpack
+from Diagnostics import DiagnosticParser, ERROR, WARNING
+import Trace
 import TexpreviewPrinter as Out
 VERB_SILENT = Out.VERB_SILENT
 VERB_ERR    = Out.VERB_ERR
@@ -40,56 +43,107 @@ VERB_DEBUG  = Out.VERB_DEBUG
 
 numRuns = 0
 
+# Number of bytes to read from the compiler output at once
+CHUNKSIZE = 65536
+
 class CompilerOutputPrinter(object):
     """Master Class for Parsing Tex Typesetting Streams"""
-    def __init__(self, input_stream):
+    def __init__(self, input_stream, callback=None):
+        """ Create a printer for input_stream. If callback is given, it is
+            called with each Diagnostic as soon as it appears in the output
+        """
         self.input_stream = input_stream
         self.done = False
         self.numErrs = 0
         self.numWarns = 0
         self.isFatal = False
-        self.warn_patterns = [( re.compile('warning', re.I),           False ),
-                              ( re.compile('^(over|under)full', re.I), False ) ]
-        self.err_patterns = [( re.compile('error', re.I), False ), 
-                             ( re.compile('^!', re.I),    True  ) ]
+        self.outputsize = 0
+        self.readtime = 0.0
+        self.diagnostics = []
+        self.parser = DiagnosticParser(callback)
 
     def parseStream(self):
-        """docstring for parseStream"""
-        line = self.input_stream.readline()
-
-        VERB_CURR = VERB_STATUS
-        keep_verb = False
-
-        while line and not self.done:
-            line = line
-
-            if (line.rstrip() == ''):
-                keep_verb = False
-                VERB_CURR = VERB_STATUS
-
-            # process matching patterns until we find one
-            for (pat, pat_keep_verb) in self.warn_patterns:
-                myMatch = pat.search(line)
-                if myMatch:
-                    self.numWarns += 1
-                    keep_verb = pat_keep_verb
-                    VERB_CURR = VERB_WARN
-                    break
-            for (pat, pat_keep_verb) in self.err_patterns:
-                myMatch = pat.search(line)
-                if myMatch:
-                    self.numErrs += 1
-                    keep_verb = pat_keep_verb
-                    VERB_CURR = VERB_ERR
-                    break
-
-            Out.write("DEBUG: writing %s line\n" % VERB_CURR, VERB_DEBUG, stream='sub')
-            Out.write(line, VERB_CURR, stream='sub')
-            if not keep_verb:
-                VERB_CURR = VERB_STATUS
-
-            line = self.input_stream.readline()
-
+        """ Print the output of the compiler while analyzing it with a
+            DiagnosticParser. Lines that belong to an error are printed at
+            VERB_ERR, lines that belong to a warning at VERB_WARN,
+            everything else at VERB_STATUS.
+
+            The output is read in chunks of CHUNKSIZE bytes (as much as is
+            available, for a pipe), and consecutive lines that are printed
+            at the same level are written in one piece.
+
+            Return a tuple (isFatal, numErrs, numWarns). The diagnostics
+            are in self.diagnostics afterwards, the number of bytes read
+            in self.outputsize, and the time spent waiting for the output
+            in self.readtime.
+        """
+        Trace.begin('parse', 'parse')
+        try:
+            return self._parseStream()
+        finally:
+            Trace.end('parse', 'parse', {'bytes'    : self.outputsize,
+                                         'readtime' : self.readtime})
+
+    def _parseStream(self):
+        """ Implementation of parseStream """
+        try:
+            fileno = self.input_stream.fileno()
+            read = lambda: os.read(fileno, CHUNKSIZE)
+        except (AttributeError, IOError, ValueError):
+            read = lambda: self.input_stream.read(CHUNKSIZE)
+        feed_line = self.parser.feed_line
+        parser = self.parser
+        remainder = ''
+        readstart = time.time()
+        chunk = read()
+        self.readtime += time.time() - readstart
+        while chunk and not self.done:
+            self.outputsize += len(chunk)
+            if '\r' in chunk:
+                chunk = chunk.replace('\r\n', '\n')
+            lines = (remainder + chunk).split('\n')
+            remainder = lines.pop()
+            batch = []
+            batchstate = None
+            for line in lines:
+                logicalline = feed_line(line)
+                if logicalline is None:
+                    continue
+                if parser.linestate != batchstate and batch:
+                    self._write(batch, batchstate)
+                    batch = []
+                batchstate = parser.linestate
+                batch.append(logicalline)
+            if batch:
+                self._write(batch, batchstate)
+            Out.flush()
+            readstart = time.time()
+            chunk = read()
+            self.readtime += time.time() - readstart
+        if remainder:
+            logicalline = feed_line(remainder)
+            if logicalline is not None:
+                self._write([logicalline], parser.linestate)
+        logicalline = parser.close()
+        if logicalline is not None:
+            self._write([logicalline], parser.linestate)
+        self.diagnostics = parser.diagnostics
+        for diagnostic in self.diagnostics:
+            if diagnostic.severity == ERROR:
+                self.numErrs += 1
+            else:
+                self.numWarns += 1
+        self.isFatal = parser.fatal
         return self.isFatal, self.numErrs, self.numWarns
 
-
+    def _write(self, lines, linestate):
+        """ Print lines at the verbosity level given by linestate """
+        if linestate == ERROR:
+            VERB_CURR = VERB_ERR
+        elif linestate == WARNING:
+            VERB_CURR = VERB_WARN
+        else:
+            VERB_CURR = VERB_STATUS
+        Out.write("DEBUG: writing %s lines at level %s\n", VERB_DEBUG,
+                  stream='sub', args=(len(lines), VERB_CURR))
+        Out.write('\n'.join(lines) + '\n', VERB_CURR, stream='sub')
@@ -0,0 +1,221 @@
+# -*- coding: utf-8 -*-
+############################################################################
+#    Copyright (C) 2008 by Michael Goerz                                   #
+#    http://www.physik.fu-berlin.de/~goerz                                 #
+#                                                                          #
+#    This program is free software; you can redistribute it and/or modify  #
+#    it under the terms of the GNU General Public License as published by  #
+#    the Free Software Foundation; either version 3 of the License, or     #
+#    (at your option) any later version.                                   #
+#                                                                          #
+#    This program is distributed in the hope that it will be useful,       #
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of        #
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the         #
+#    GNU General Public License for more details.                          #
+#                                                                          #
+#    You should have received a copy of the GNU General Public License     #
+#    along with this program; if not, write to the                         #
+#    Free Software Foundation, Inc.,                                       #
+#    59 Temple Place - Suite 330, Boston, MA  02111-1307, USA.             #
+############################################################################
+
+""" This module contains the DependencyGraph class, which keeps track of
+    all the files that a set of tex documents depend on.
+
+    A file depends on the files it loads with \\include, \\input,
+    \\inputTikZ, \\includegraphics, \\bibliography, \\addbibresource, and on
+    the local packages (\\usepackage, \\RequirePackage) and document classes
+    (\\documentclass, \\LoadClass), i.e. the ones that exist next to the
+    document and not in the tex system. Loaded text files are scanned
+    recursively. As in the tex compiler, filenames are relative to the
+    directory in which the compiler is run (the current directory).
+
+    Besides the dependencies of each file, the graph keeps a reverse index
+    from each file to the files that load it, so that it's easy to find
+    the documents that are affected by a change.
+"""
+
+import os
+import re
+from TexScanner import is_commented, is_escaped
+
+
+# File extensions of files that are never scanned for dependencies
+UNSCANNEDEXTENSIONS = ['.pdf', '.png', '.jpg', '.jpeg', '.eps', '.mps',
+                       '.tif', '.tiff', '.dvi', '.ps', '.bib', '.bst']
+
+# Extensions that the tex compiler tries for \includegraphics{name}
+GRAPHICSEXTENSIONS = ['.pdf', '.png', '.jpg', '.mps', '.jpeg', '.eps']
+
+_DEPENDENCY = re.compile(r"""
+    \\(?P<command>include|input|inputTikZ|includegraphics|bibliography
+                 |addbibresource|usepackage|RequirePackage|documentclass
+                 |LoadClass)(?![a-zA-Z])\*?
+    \s*(?:\[[^\]]*\]\s*)*
+    (?:\{(?P<argument>[^{}]*)\}|(?P<bare>[^\s{}\\%]+))
+""", re.X)
+
+
+def scan_dependencies(text):
+    """ Return the list of existing files that are loaded in text, in the
+        order in which they occur
+    """
+    result = []
+    for match in _DEPENDENCY.finditer(text):
+        start = match.start()
+        if is_escaped(text, start) or is_commented(text, start):
+            continue
+        command, argument = match.group('command', 'argument')
+        if argument is None:
+            if command != 'input': # only \input works without braces
+                continue
+            argument = match.group('bare')
+        for candidates in _candidates(command, argument):
+            for candidate in candidates:
+                filename = os.path.normpath(candidate)
+                if os.path.isfile(filename):
+                    if filename not in result:
+                        result.append(filename)
+                    break
+    return result
+
+
+def _candidates(command, argument):
+    """ Return a list of the files that are loaded by \\command{argument}.
+        Each file is given as a list of the names the tex compiler tries,
+        in order.
+    """
+    if command in ['bibliography', 'usepackage', 'RequirePackage']:
+        names = [name.strip() for name in argument.split(',')]
+    else:
+        names = [argument.strip()]
+    result = []
+    for name in names:
+        if name == '':
+            continue
+        if command == 'include':
+            result.append([name + '.tex'])
+        elif command in ['input', 'inputTikZ']:
+            result.append([name, name + '.tex'])
+        elif command == 'includegraphics':
+            result.append([name] + [name + extension
+                                    for extension in GRAPHICSEXTENSIONS])
+        elif command == 'bibliography':
+            result.append([name + '.bib', name])
+        elif command == 'addbibresource':
+            result.append([name])
+        elif command in ['usepackage', 'RequirePackage']:
+            result.append([name + '.sty'])
+        else: # documentclass, LoadClass
+            result.append([name + '.cls'])
+    return result
+
+
+def read_dependencies(filename):
+    """ Return the list of files that filename loads directly. Files that
+        can't be read, and binary files, have no dependencies.
+    """
+    for extension in UNSCANNEDEXTENSIONS:
+        if filename.lower().endswith(extension):
+            return []
+    try:
+        afile = open(filename)
+        try:
+            return scan_dependencies(afile.read())
+        finally:
+            afile.close()
+    except IOError:
+        return []
+
+
+class DependencyGraph(object):
+    """ The files that a set of documents depend on, recursively """
+
+    def __init__(self):
+        """ Create an empty graph """
+        self._documents = []
+        self._edges = {}   # file -> list of files it loads directly
+        self._reverse = {} # file -> list of files that load it directly
+
+    def add_document(self, filename):
+        """ Add the document filename and all files it depends on """
+        filename = os.path.normpath(filename)
+        if filename not in self._documents:
+            self._documents.append(filename)
+            if not self._edges.has_key(filename):
+                self._scan(filename)
+
+    def update(self, filename):
+        """ Scan filename again after it has changed. Return the list of
+            documents whose dependencies have changed.
+        """
+        filename = os.path.normpath(filename)
+        if not self._edges.has_key(filename):
+            return []
+        old = self._edges[filename][:]
+        self._scan(filename)
+        if sorted(old) == sorted(self._edges[filename]):
+            return []
+        documents = self.documents(filename)
+        self._prune()
+        return documents
+
+    def dependencies(self, document):
+        """ Return the set of all files that document depends on (not
+            including document itself)
+        """
+        return self._reachable([os.path.normpath(document)], self._edges) \
+               - set([os.path.normpath(document)])
+
+    def documents(self, filename):
+        """ Return the list of documents that depend on filename (including
+            filename itself, if it's a document)
+        """
+        files = self._reachable([os.path.normpath(filename)], self._reverse)
+        return [document for document in self._documents
+                if document in files]
+
+    def _scan(self, filename):
+        """ Read the dependencies of filename, and of all files that are
+            newly found
+        """
+        pending = [filename]
+        while len(pending) > 0:
+            current = pending.pop()
+            old = self._edges.get(current, [])
+            new = read_dependencies(current)
+            for dependency in old:
+                if dependency not in new:
+                    self._reverse[dependency].remove(current)
+            for dependency in new:
+                if dependency not in old:
+                    self._reverse.setdefault(dependency, []).append(current)
+                if not self._edges.has_key(dependency) \
+                and dependency not in pending:
+                    pending.append(dependency)
+            self._edges[current] = new
+
+    def _prune(self):
+        """ Remove all files that no document depends on anymore """
+        reachable = self._reachable(self._documents, self._edges)
+        for filename in self._edges.keys():
+            if filename not in reachable:
+                for dependency in self._edges[filename]:
+                    self._reverse[dependency].remove(filename)
+                del self._edges[filename]
+        for filename in self._reverse.keys():
+            if filename not in reachable:
+                del self._reverse[filename]
+
+    def _reachable(self, start, edges):
+        """ Return the set of files that can be reached from the files in
+            start by following edges
+        """
+        result = set(start)
+        pending = list(start)
+        while len(pending) > 0:
+            for filename in edges.get(pending.pop(), []):
+                if filename not in result:
+                    result.add(filename)
+                    pending.append(filename)
+        return result
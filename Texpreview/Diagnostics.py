@@ -0,0 +1,336 @@
+# -*- coding: utf-8 -*-
+############################################################################
+#    Copyright (C) 2008 by Michael Goerz                                   #
+#    http://www.physik.fu-berlin.de/~goerz                                 #
+#                                                                          #
+#    This program is free software; you can redistribute it and/or modify  #
+#    it under the terms of the GNU General Public License as published by  #
+#    the Free Software Foundation; either version 3 of the License, or     #
+#    (at your option) any later version.                                   #
+#                                                                          #
+#    This program is distributed in the hope that it will be useful,       #
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of        #
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the         #
+#    GNU General Public License for more details.                          #
+#                                                                          #
+#    You should have received a copy of the GNU General Public License     #
+#    along with this program; if not, write to the                         #
+#    Free Software Foundation, Inc.,                                       #
+#    59 Temple Place - Suite 330, Boston, MA  02111-1307, USA.             #
+############################################################################
+
+""" This module contains a streaming parser for the output of the tex
+    compilers, which turns it into structured Diagnostic records (errors,
+    warnings, and over/underfull boxes, with file, line, and package).
+
+    The parser is fed the output line by line, while the compiler is
+    running, and hands out each diagnostic as soon as it is complete. It
+    also understands the -file-line-error format, and the warnings and
+    errors of bibtex.
+
+    TeX wraps its output at 79 characters (max_print_line); the parser joins
+    such wrapped lines before it looks at them. Like the awk script in
+    material/latex-errorfilter, it follows the parentheses in the output to
+    know which file is being read: TeX prints '(' and the filename when it
+    opens a file, and ')' when it closes it.
+
+    >>> parser = DiagnosticParser()
+    >>> for line in ['(./main.tex', 'LaTeX Warning: Reference `a\\' on page 1 '
+    ...              'undefined on input line 3.', '', ') )']:
+    ...     logicalline = parser.feed(line + '\\n')
+    >>> parser.close()
+    >>> print parser.diagnostics[0]
+    ./main.tex:3: warning: LaTeX: Reference `a' on page 1 undefined on input line 3.
+"""
+
+import re
+
+
+# Severities of diagnostics
+ERROR = 'error'
+WARNING = 'warning'
+BADBOX = 'badbox'
+
+# Length at which TeX wraps lines of output
+MAXPRINTLINE = 79
+
+# Classifies a line by its beginning, in one pass. Only lines that match
+# are looked at more closely (with the patterns below).
+_CLASSIFY = re.compile(r"""
+      (?P<error>!)
+    | (?P<warning>(?:LaTeX|Package|Class|\w*TeX)\ )
+    | (?P<bibtexwarning>Warning--)
+    | (?P<badbox>(?:Over|Under)full\ )
+    | (?P<fatal>\*\*\*)
+    | (?P<fileline>[^:\s()]+:\d+:\ )
+""", re.X)
+
+_ERROR = re.compile(r'^! (?:(?P<package>LaTeX|Package \S+|Class \S+)'
+                    r' Error: )?(?P<message>.*)')
+_FILELINEERROR = re.compile(r'^(?P<file>[^:\s()]+):(?P<line>\d+): '
+                            r'(?:(?P<package>LaTeX|Package \S+|Class \S+)'
+                            r' Error: )?(?P<message>.*)')
+_ERRORLINE = re.compile(r'^l\.(?P<line>\d+)')
+_WARNING = re.compile(r'^(?P<package>LaTeX|LaTeX Font|Package \S+|Class \S+'
+                      r'|pdfTeX|\S+TeX)\s+warning\s*(?:\(.*?\))?:\s*'
+                      r'(?P<message>.*)', re.I)
+_BADBOX = re.compile(r'^(?:Over|Under)full \\[hv]box .*?'
+                     r'(?:at lines? (?P<line>\d+)|$)')
+_BIBTEXERROR = re.compile(r'^(?P<message>.*)---line (?P<line>\d+) '
+                          r'of file (?P<file>\S+)')
+_CONTINUATION = re.compile(r'^\((?P<package>[^\s()]+)\)\s+')
+_INPUTLINE = re.compile(r'on input line (?P<line>\d+)')
+_FATAL = re.compile(r'Emergency stop|Fatal error occurred|'
+                    r'job aborted|TeX capacity exceeded')
+_PARENTHESIS = re.compile(r'\((?P<file>[^\s()]*)|\)')
+_FILENAME = re.compile(r'^(?:[a-zA-Z]:)?[^\s()"]*\.[a-zA-Z0-9]+$')
+
+
+class Diagnostic(object):
+    """ A message of the tex compiler
+
+        A Diagnostic has the following attributes:
+        severity        ERROR, WARNING, or BADBOX
+        message         The text of the message
+        file            The file that was being read, None if unknown
+        line            The line number in the file, None if unknown
+        package         The package or class that issued the message,
+                        'LaTeX' for messages of the LaTeX kernel, None if
+                        not known
+    """
+
+    def __init__(self, severity, message, filename=None, line=None,
+                 package=None):
+        """ Create a diagnostic """
+        self.severity = severity
+        self.message = message
+        self.file = filename
+        self.line = line
+        self.package = package
+
+    def __str__(self):
+        """ Return the diagnostic in the 'file:line: severity: message'
+            format of compilers
+        """
+        location = ''
+        if self.file is not None:
+            location = self.file + ':'
+            if self.line is not None:
+                location += "%s:" % self.line
+            location += ' '
+        package = ''
+        if self.package is not None:
+            package = self.package + ': '
+        return "%s%s: %s%s" % (location, self.severity, package,
+                               self.message)
+
+
+class DiagnosticParser(object):
+    """ Parses the output of a tex compiler line by line
+
+        A DiagnosticParser has the following attributes:
+        diagnostics     List of all complete diagnostics so far
+        fatal           Was there a fatal error?
+        linestate       Severity of the last logical line: ERROR or WARNING
+                        if it belongs to an error or warning message, else
+                        None
+    """
+
+    def __init__(self, callback=None):
+        """ Create a parser. If callback is given, it is called with each
+            Diagnostic as soon as it is complete.
+        """
+        self.diagnostics = []
+        self.fatal = False
+        self.linestate = None
+        self._callback = callback
+        self._partial = '' # wrapped line that continues on the next line
+        self._files = [] # open files (None for other parentheses)
+        self._pending = None # diagnostic that may continue
+        self._inerror = False # in the context lines of an error?
+        self._errorcontext = False # next line is the rest of an error line?
+
+    def current_file(self):
+        """ Return the file that is currently being read, or None """
+        for filename in reversed(self._files):
+            if filename is not None:
+                return filename
+        return None
+
+    def feed(self, line):
+        """ Process one line of output. Return the logical line (the line
+            joined with the lines it wrapped from), or None if the line
+            is continued on the next line.
+        """
+        text = line.rstrip('\r\n')
+        if line == text: # no line break: can't be wrapped
+            text = self._partial + text
+            self._partial = ''
+            self._parse(text)
+            return text
+        text = self.feed_line(text)
+        if text is None:
+            return None
+        return text + line[len(line.rstrip('\r\n')):]
+
+    def feed_line(self, text):
+        """ Process one complete line of output, without the line break.
+            Return the logical line without line break, or None if the
+            line is continued on the next line.
+        """
+        if len(text) == MAXPRINTLINE:
+            self._partial += text
+            return None
+        if self._partial:
+            text = self._partial + text
+            self._partial = ''
+        self._parse(text)
+        return text
+
+    def close(self):
+        """ Process the remaining output, at the end of the stream. Return
+            the last logical line, or None.
+        """
+        text = None
+        if self._partial != '':
+            text = self._partial
+            self._partial = ''
+            self._parse(text)
+        self._flush()
+        return text
+
+    def _parse(self, text):
+        """ Process one logical line """
+        if self._errorcontext:
+            # the second half of the source line shown after 'l.<n>'
+            self._errorcontext = False
+            self.linestate = ERROR
+            return
+        if self._pending is not None:
+            match = _CONTINUATION.match(text)
+            if match and self._pending.package is not None \
+            and self._pending.package.split()[-1] == match.group('package'):
+                # continuation of a package message: '(hyperref)   ...'
+                self._pending.message += ' ' + text[match.end():]
+                self.linestate = self.linestate or WARNING
+                self._check_inputline(self._pending)
+                return
+            if self._inerror:
+                self.linestate = ERROR
+                match = _ERRORLINE.match(text)
+                if match:
+                    self._pending.line = int(match.group('line'))
+                    self._flush()
+                    self._errorcontext = True
+                elif _FATAL.search(text):
+                    self.fatal = True
+                return
+            self._flush()
+        self.linestate = None
+        match = _CLASSIFY.match(text)
+        if match is None:
+            # the common case: an ordinary line
+            if '---line ' in text and self._parse_bibtexerror(text):
+                return
+            if '(' in text or ')' in text:
+                self._follow_files(text)
+            return
+        kind = match.lastgroup
+        if kind == 'error':
+            match = _ERROR.match(text)
+            package = match.group('package')
+            message = match.group('message')
+            if _FATAL.search(message):
+                self.fatal = True
+            self._pending = Diagnostic(ERROR, message, self.current_file(),
+                                       package=package)
+            self._inerror = True
+            self.linestate = ERROR
+            return
+        if kind == 'fileline':
+            match = _FILELINEERROR.match(text)
+            self._pending = Diagnostic(ERROR, match.group('message'),
+                                       match.group('file'),
+                                       int(match.group('line')),
+                                       match.group('package'))
+            self._inerror = True
+            self.linestate = ERROR
+            return
+        if kind == 'warning':
+            match = _WARNING.match(text)
+            if match:
+                self._pending = Diagnostic(WARNING, match.group('message'),
+                                           self.current_file(),
+                                           package=match.group('package'))
+                self._check_inputline(self._pending)
+                self.linestate = WARNING
+                return
+        elif kind == 'bibtexwarning':
+            self._emit(Diagnostic(WARNING, text[len('Warning--'):],
+                                  package='BibTeX'))
+            self.linestate = WARNING
+            return
+        elif kind == 'badbox':
+            match = _BADBOX.match(text)
+            if match:
+                line = match.group('line')
+                if line is not None:
+                    line = int(line)
+                self._emit(Diagnostic(BADBOX, text, self.current_file(),
+                                      line))
+                self.linestate = WARNING
+                return
+        elif kind == 'fatal':
+            if _FATAL.search(text):
+                self.fatal = True
+        if '---line ' in text and self._parse_bibtexerror(text):
+            return
+        if '(' in text or ')' in text:
+            self._follow_files(text)
+
+    def _parse_bibtexerror(self, text):
+        """ Process a line that may be a bibtex error. Return True if it
+            was one.
+        """
+        match = _BIBTEXERROR.match(text)
+        if match:
+            self._emit(Diagnostic(ERROR, match.group('message'),
+                                  match.group('file'),
+                                  int(match.group('line')), 'BibTeX'))
+            self.linestate = ERROR
+            return True
+        return False
+
+    def _follow_files(self, text):
+        """ Update the stack of open files according to the parentheses in
+            text
+        """
+        for match in _PARENTHESIS.finditer(text):
+            if match.group() == ')':
+                if len(self._files) > 0:
+                    self._files.pop()
+            elif _FILENAME.match(match.group('file')):
+                self._files.append(match.group('file'))
+            else:
+                self._files.append(None)
+
+    def _check_inputline(self, diagnostic):
+        """ Take the line number of diagnostic from its message """
+        if diagnostic.line is None:
+            match = _INPUTLINE.search(diagnostic.message)
+            if match:
+                diagnostic.line = int(match.group('line'))
+
+    def _flush(self):
+        """ Emit the pending diagnostic, if any """
+        if self._pending is not None:
+            diagnostic = self._pending
+            self._pending = None
+            self._inerror = False
+            self._emit(diagnostic)
+
+    def _emit(self, diagnostic):
+        """ Store a complete diagnostic, and pass it to the callback """
+        self.diagnostics.append(diagnostic)
+        if self._callback is not None:
+            self._callback(diagnostic)
@@ -0,0 +1,266 @@
+# -*- coding: utf-8 -*-
+############################################################################
+#    Copyright (C) 2008 by Michael Goerz                                   #
+#    http://www.physik.fu-berlin.de/~goerz                                 #
+#                                                                          #
+#    This program is free software; you can redistribute it and/or modify  #
+#    it under the terms of the GNU General Public License as published by  #
+#    the Free Software Foundation; either version 3 of the License, or     #
+#    (at your option) any later version.                                   #
+#                                                                          #
+#    This program is distributed in the hope that it will be useful,       #
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of        #
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the         #
+#    GNU General Public License for more details.                          #
+#                                                                          #
+#    You should have received a copy of the GNU General Public License     #
+#    along with this program; if not, write to the                         #
+#    Free Software Foundation, Inc.,                                       #
+#    59 Temple Place - Suite 330, Boston, MA  02111-1307, USA.             #
+############################################################################
+
+""" This module contains the Executor class, which runs the external
+    programs (tex compiler, bibtex, makeindex, ...) for a Texfile.
+
+    Programs are started directly from an argument list, without a shell.
+    Their output (stdout and stderr) is passed through a
+    CompilerOutputPrinter while they are running, and the executor waits
+    for the process to exit as soon as its output ends. The outcome of each
+    run is returned as an ExecutionResult.
+
+    A running program can be stopped from another thread with cancel().
+    Once cancelled, the executor refuses to start any further program until
+    reset() is called, so that a whole chain of compiler runs is abandoned
+    quickly. terminate() only stops the running program; it can also be
+    called from the callback that receives the diagnostics, e.g. to stop
+    the compiler at the first error.
+"""
+
+import os
+import time
+import shlex
+import errno
+import signal
+import threading
+import subprocess
+from CompilerOutputPrinter import CompilerOutputPrinter
+import Trace
+import TexpreviewPrinter as Out
+VERB_SILENT = Out.VERB_SILENT
+VERB_ERR    = Out.VERB_ERR
+VERB_WARN   = Out.VERB_WARN
+VERB_STATUS = Out.VERB_STATUS
+VERB_DEBUG  = Out.VERB_DEBUG
+
+
+# Seconds to wait after asking a cancelled program to terminate before it
+# is killed
+CANCELTIMEOUT = 2.0
+
+class ExecutionResult(object):
+    """ Outcome of running an external program
+
+        An ExecutionResult has the following attributes:
+        argv            The argument list of the program
+        exitcode        Exit code of the program, negative if it was
+                        killed by a signal, None if it could not be
+                        started at all
+        error           Error message if the program could not be started
+        walltime        Elapsed time in seconds
+        cputime         CPU time (user + system) of the program in seconds,
+                        None if not available on this system
+        fatal           Did the output contain a fatal error?
+        errors          Number of errors in the output
+        warnings        Number of warnings in the output
+        outputsize      Size of the output in bytes
+        diagnostics     List of the Diagnostics (see Diagnostics.py) in
+                        the output
+        cancelled       Was the program cancelled (or not even started,
+                        because the executor had been cancelled)?
+        terminated      Was the program stopped with terminate()?
+    """
+
+    def __init__(self, argv):
+        """ Create an empty result for argv """
+        self.argv = argv
+        self.exitcode = None
+        self.error = None
+        self.walltime = 0.0
+        self.cputime = None
+        self.fatal = False
+        self.errors = 0
+        self.warnings = 0
+        self.outputsize = 0
+        self.diagnostics = []
+        self.cancelled = False
+        self.terminated = False
+
+    def succeeded(self):
+        """ Return True if the program ran and exited with code 0 """
+        return (self.exitcode == 0)
+
+
+class Executor(object):
+    """ Runs external programs and parses their output """
+
+    def __init__(self, cwd=None, env=None):
+        """ Create an executor that runs programs in the directory cwd with
+            the environment env (default: the current directory and
+            environment at the time of each run)
+        """
+        self.cwd = cwd
+        self.env = env
+        self.cancelled = False
+        self._terminated = False
+        self._process = None
+        self._killtimer = None
+        self._lock = threading.Lock()
+
+    def cancel(self):
+        """ Terminate the running program (if any), and don't start any
+            further programs until reset() is called
+        """
+        self._lock.acquire()
+        try:
+            self.cancelled = True
+            self._terminate()
+        finally:
+            self._lock.release()
+
+    def terminate(self):
+        """ Terminate the running program (if any), without cancelling the
+            executor
+        """
+        self._lock.acquire()
+        try:
+            self._terminate()
+        finally:
+            self._lock.release()
+
+    def _terminate(self):
+        """ Terminate the running program; self._lock must be held """
+        process = self._process
+        if process is not None and process.returncode is None:
+            Out.write("Terminating process %s\n", VERB_DEBUG,
+                      args=(process.pid,))
+            self._terminated = True
+            _signal(process, signal.SIGTERM)
+            self._killtimer = threading.Timer(CANCELTIMEOUT, _signal,
+                                              (process, signal.SIGKILL))
+            self._killtimer.setDaemon(True)
+            self._killtimer.start()
+
+    def reset(self):
+        """ Allow programs to be run again after cancel() """
+        self._lock.acquire()
+        self.cancelled = False
+        self._lock.release()
+
+    def run(self, argv, cwd=None, callback=None):
+        """ Run the program given by the argument list argv, print its
+            output, and return an ExecutionResult. If cwd is given, the
+            program is run in that directory instead of self.cwd. If
+            callback is given, it is called with each Diagnostic as soon as
+            it appears in the output.
+        """
+        if cwd is None:
+            cwd = self.cwd
+        result = ExecutionResult(argv)
+        Out.write("Executing %s\n", VERB_DEBUG, args=(argv,))
+        starttime = time.time()
+        self._lock.acquire()
+        try:
+            if self.cancelled:
+                result.cancelled = True
+                result.error = "cancelled"
+                return result
+            try:
+                devnull = open(os.devnull)
+                try:
+                    process = subprocess.Popen(argv,
+                            cwd=cwd,
+                            env=self.env,
+                            stdin=devnull,
+                            stdout=subprocess.PIPE,
+                            stderr=subprocess.STDOUT,
+                            # don't leak the pipes of programs that are
+                            # started at the same time from another thread
+                            close_fds=(os.name == 'posix')
+                        )
+                finally:
+                    devnull.close()
+            except OSError, data:
+                result.error = str(data)
+                result.walltime = time.time() - starttime
+                return result
+            self._process = process
+            self._terminated = False
+        finally:
+            self._lock.release()
+        Trace.begin(argv[0], 'process', {'argv' : argv, 'pid' : process.pid})
+        try:
+            parser = CompilerOutputPrinter(process.stdout, callback)
+            result.fatal, result.errors, result.warnings = \
+                                                          parser.parseStream()
+            result.diagnostics = parser.diagnostics
+            result.outputsize = parser.outputsize
+        finally:
+            process.stdout.close()
+            Trace.begin('wait', 'process')
+            result.exitcode, result.cputime = _wait(process)
+            Trace.end('wait', 'process')
+            result.walltime = time.time() - starttime
+            self._lock.acquire()
+            self._process = None
+            if self._killtimer is not None:
+                self._killtimer.cancel()
+                self._killtimer = None
+            result.cancelled = self.cancelled
+            result.terminated = self._terminated
+            self._lock.release()
+            Trace.end(argv[0], 'process', {'exitcode' : result.exitcode,
+                                           'cputime'  : result.cputime})
+        Out.write("%s exited with code %s after %.2f s\n", VERB_DEBUG,
+                  args=(argv[0], result.exitcode, result.walltime))
+        Out.flush()
+        return result
+
+
+def split_command(command, basename=None):
+    """ Split a command line into an argument list, using shell-like
+        quoting rules. If basename is given, the '%' wildcard is replaced
+        by basename in each argument.
+    """
+    argv = shlex.split(command)
+    if basename is not None:
+        argv = [argument.replace('%', basename) for argument in argv]
+    return argv
+
+
+def _signal(process, signalnumber):
+    """ Send a signal to process, unless it has already exited """
+    if process.returncode is None:
+        try:
+            os.kill(process.pid, signalnumber)
+        except OSError:
+            pass
+
+
+def _wait(process):
+    """ Wait for process to exit. Return a tuple of its exit code and the
+        CPU time it used (None if that is not available)
+    """
+    if not hasattr(os, 'wait4'):
+        return process.wait(), None
+    while True:
+        try:
+            pid, status, rusage = os.wait4(process.pid, 0)
+            break
+        except OSError, data:
+            if data.errno != errno.EINTR:
+                raise
+    if os.WIFSIGNALED(status):
+        process.returncode = -os.WTERMSIG(status)
+    else:
+        process.returncode = os.WEXITSTATUS(status)
+    return process.returncode, rusage.ru_utime + rusage.ru_stime
@@ -0,0 +1,259 @@
+# -*- coding: utf-8 -*-
+############################################################################
+#    Copyright (C) 2008 by Michael Goerz                                   #
+#    http://www.physik.fu-berlin.de/~goerz                                 #
+#                                                                          #
+#    This program is free software; you can redistribute it and/or modify  #
+#    it under the terms of the GNU General Public License as published by  #
+#    the Free Software Foundation; either version 3 of the License, or     #
+#    (at your option) any later version.                                   #
+#                                                                          #
+#    This program is distributed in the hope that it will be useful,       #
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of        #
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the         #
+#    GNU General Public License for more details.                          #
+#                                                                          #
+#    You should have received a copy of the GNU General Public License     #
+#    along with this program; if not, write to the                         #
+#    Free Software Foundation, Inc.,                                       #
+#    59 Temple Place - Suite 330, Boston, MA  02111-1307, USA.             #
+############################################################################
+
+
+""" This module contains the Metrics class, which records how long the
+    stages of each compilation take, for monitoring.
+
+    A stage is e.g. a run of the tex compiler, bibtex or makeindex, the
+    check of the watchfiles for changes, or the publishing of the preview.
+    For each stage, the wall time, the CPU time of the program that was run
+    (if any), its exit code and the size of its output are recorded. Stages
+    whose result was taken from the cache are marked as 'cached'. At the
+    end of each compilation, a record for the whole compilation is added,
+    with the latency from the detection of the change to the end of the
+    compilation (i.e. the published preview).
+
+    The records are appended to a file in the JSON lines format (one JSON
+    object per line). Additionally, the accumulated metrics can be written
+    to a textfile for the textfile collector of the Prometheus node
+    exporter. That file is rewritten atomically at the end of every
+    compilation. Durations are exported as histograms (with the upper
+    bounds in BUCKETS), so that quantiles can be computed from them.
+
+    A Metrics object without files does nothing, so that the stages can
+    always be recorded.
+"""
+
+import os
+import time
+import json
+import threading
+import TexpreviewPrinter as Out
+VERB_SILENT = Out.VERB_SILENT
+VERB_ERR    = Out.VERB_ERR
+VERB_WARN   = Out.VERB_WARN
+VERB_STATUS = Out.VERB_STATUS
+VERB_DEBUG  = Out.VERB_DEBUG
+
+
+# Upper bounds (in seconds) of the buckets of the duration histograms
+BUCKETS = [0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0]
+
+# The metrics in the Prometheus textfile: name, type, help text
+METRICS = [
+    ('texpreview_stage_duration_seconds', 'histogram',
+     'Wall time of the stages of the compilations'),
+    ('texpreview_stage_cpu_seconds_total', 'counter',
+     'CPU time of the programs run in the stages'),
+    ('texpreview_stage_output_bytes_total', 'counter',
+     'Size of the output of the programs run in the stages'),
+    ('texpreview_stage_failures_total', 'counter',
+     'Number of stages whose program exited with an error'),
+    ('texpreview_stage_cached_total', 'counter',
+     'Number of stages whose result was taken from the cache'),
+    ('texpreview_preview_latency_seconds', 'histogram',
+     'Time from the detection of a change to the end of the compilation')
+]
+
+
+class Metrics(object):
+    """ Records the stages of compilations to a JSON lines file and a
+        Prometheus textfile
+    """
+
+    def __init__(self, jsonfilename=None, textfilename=None):
+        """ Create a Metrics object that appends the records to the file
+            jsonfilename and writes the Prometheus metrics to the file
+            textfilename. Both files are optional.
+        """
+        self.jsonfilename = jsonfilename or None
+        self.textfilename = textfilename or None
+        self.enabled = (self.jsonfilename is not None
+                        or self.textfilename is not None)
+        self._jsonfile = None
+        self._values = {} # (name, labels) -> value, or Histogram
+        self._lock = threading.Lock()
+
+    def record(self, document, stage, walltime, cputime=None, exitcode=None,
+               outputsize=None, **fields):
+        """ Record a stage of the compilation of document. Additional
+            fields (e.g. cached=True) are stored in the JSON record.
+        """
+        if not self.enabled:
+            return
+        record = {'time'       : time.time(),
+                  'document'   : document,
+                  'stage'      : stage,
+                  'walltime'   : walltime,
+                  'cputime'    : cputime,
+                  'exitcode'   : exitcode,
+                  'outputsize' : outputsize}
+        record.update(fields)
+        labels = (('document', document), ('stage', stage))
+        self._lock.acquire()
+        try:
+            self._write_record(record)
+            self._observe('texpreview_stage_duration_seconds', labels,
+                          walltime)
+            if cputime is not None:
+                self._count('texpreview_stage_cpu_seconds_total', labels,
+                            cputime)
+            if outputsize is not None:
+                self._count('texpreview_stage_output_bytes_total', labels,
+                            outputsize)
+            if exitcode is not None and exitcode != 0:
+                self._count('texpreview_stage_failures_total', labels, 1)
+            if fields.get('cached'):
+                self._count('texpreview_stage_cached_total', labels, 1)
+        finally:
+            self._lock.release()
+
+    def record_execution(self, document, stage, result, **fields):
+        """ Record a stage of the compilation of document that ran a
+            program, given its ExecutionResult
+        """
+        self.record(document, stage, result.walltime, result.cputime,
+                    result.exitcode, result.outputsize, **fields)
+
+    def record_compilation(self, document, mode, walltime, success,
+                           latency=None):
+        """ Record a whole compilation of document ('full', 'smart' or
+            'simple' mode), and write the Prometheus textfile. latency is
+            the time since the change that caused the compilation was
+            detected, if known. It only counts towards the latency
+            histogram if the compilation was successful.
+        """
+        if not self.enabled:
+            return
+        self.record(document, 'compilation', walltime, mode=mode,
+                    success=success, latency=latency)
+        self._lock.acquire()
+        try:
+            if success and latency is not None:
+                self._observe('texpreview_preview_latency_seconds',
+                              (('document', document),), latency)
+            self._write_textfile()
+        finally:
+            self._lock.release()
+
+    def _count(self, name, labels, value):
+        """ Add value to the counter name with labels """
+        key = (name, labels)
+        self._values[key] = self._values.get(key, 0) + value
+
+    def _observe(self, name, labels, value):
+        """ Add value to the histogram name with labels """
+        key = (name, labels)
+        if not self._values.has_key(key):
+            self._values[key] = Histogram()
+        self._values[key].observe(value)
+
+    def _write_record(self, record):
+        """ Append record to the JSON lines file """
+        if self.jsonfilename is None:
+            return
+        try:
+            if self._jsonfile is None:
+                self._jsonfile = open(self.jsonfilename, 'a')
+            self._jsonfile.write(json.dumps(record, sort_keys=True) + "\n")
+            self._jsonfile.flush()
+        except IOError, data:
+            Out.write("Could not write metrics to %s: %s\n" \
+                      % (self.jsonfilename, data), VERB_WARN)
+            self.jsonfilename = None
+
+    def _write_textfile(self):
+        """ Write all metrics to the Prometheus textfile, atomically """
+        if self.textfilename is None:
+            return
+        lines = []
+        for name, metrictype, helptext in METRICS:
+            keys = [key for key in self._values.keys() if key[0] == name]
+            if len(keys) == 0:
+                continue
+            keys.sort()
+            lines.append("# HELP %s %s" % (name, helptext))
+            lines.append("# TYPE %s %s" % (name, metrictype))
+            for key in keys:
+                labels = key[1]
+                value = self._values[key]
+                if metrictype == 'histogram':
+                    for bound, count in value.buckets():
+                        lines.append("%s_bucket%s %d" % (name,
+                                   _format_labels(labels + (('le', bound),)),
+                                   count))
+                    lines.append("%s_sum%s %r" % (name,
+                                 _format_labels(labels), value.sum))
+                    lines.append("%s_count%s %d" % (name,
+                                 _format_labels(labels), value.count))
+                else:
+                    lines.append("%s%s %r" % (name, _format_labels(labels),
+                                              value))
+        tempfilename = "%s.%s.tmp" % (self.textfilename, os.getpid())
+        try:
+            afile = open(tempfilename, 'w')
+            try:
+                afile.write("\n".join(lines) + "\n")
+            finally:
+                afile.close()
+            os.rename(tempfilename, self.textfilename)
+        except (IOError, OSError), data:
+            Out.write("Could not write metrics to %s: %s\n" \
+                      % (self.textfilename, data), VERB_WARN)
+            self.textfilename = None
+
+
+class Histogram(object):
+    """ Distribution of observed values, in the buckets given by BUCKETS """
+
+    def __init__(self):
+        """ Create an empty histogram """
+        self.counts = [0] * len(BUCKETS)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        """ Add value to the histogram """
+        self.sum += value
+        self.count += 1
+        for index in range(len(BUCKETS)):
+            if value <= BUCKETS[index]:
+                self.counts[index] += 1
+
+    def buckets(self):
+        """ Return a list of (upper bound, cumulative count) tuples, with
+            the upper bounds formatted for Prometheus
+        """
+        result = [(repr(bound), count)
+                  for (bound, count) in zip(BUCKETS, self.counts)]
+        result.append(('+Inf', self.count))
+        return result
+
+
+def _format_labels(labels):
+    """ Return the tuple of (name, value) labels in the Prometheus format """
+    if len(labels) == 0:
+        return ''
+    return '{%s}' % ','.join(['%s="%s"' % (name, str(value)
+                              .replace('\\', '\\\\').replace('"', '\\"')
+                              .replace('\n', '\\n'))
+                              for (name, value) in labels])
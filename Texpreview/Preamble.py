@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+############################################################################
+#    Copyright (C) 2008 by Michael Goerz                                   #
+#    http://www.physik.fu-berlin.de/~goerz                                 #
+#                                                                          #
+#    This program is free software; you can redistribute it and/or modify  #
+#    it under the terms of the GNU General Public License as published by  #
+#    the Free Software Foundation; either version 3 of the License, or     #
+#    (at your option) any later version.                                   #
+#                                                                          #
+#    This program is distributed in the hope that it will be useful,       #
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of        #
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the         #
+#    GNU General Public License for more details.                          #
+#                                                                          #
+#    You should have received a copy of the GNU General Public License     #
+#    along with this program; if not, write to the                         #
+#    Free Software Foundation, Inc.,                                       #
+#    59 Temple Place - Suite 330, Boston, MA  02111-1307, USA.             #
+############################################################################
+
+""" This module contains functions to find the preamble of a tex file (the
+    part before \\begin{document}) and the local files it depends on.
+
+    Texfile uses them to precompile the preamble into a format file: the
+    format is dumped with the mylatexformat package, and a later run of
+    the tex compiler with -fmt skips the preamble of the texfile. The
+    format has to be rebuilt whenever the preamble or one of the local
+    packages it loads change, which is tracked by preamble_key().
+"""
+
+import re
+import hashlib
+from Cache import digest
+from TexScanner import is_commented
+from Dependencies import scan_dependencies
+
+
+_BEGINDOCUMENT = re.compile(r'\\begin\s*\{document\}')
+
+def split_preamble(text):
+    """ Return the preamble of the source text of a tex file, i.e.
+        everything before the first \\begin{document} that is not commented
+        out, or None if there is no \\begin{document}
+    """
+    for match in _BEGINDOCUMENT.finditer(text):
+        if not is_commented(text, match.start()):
+            return text[:match.start()]
+    return None
+
+
+def preamble_dependencies(preamble):
+    """ Return a sorted list of the local files that are loaded in the
+        preamble: packages, the document class, and input files. Packages
+        that are installed in the tex system are not returned.
+    """
+    result = scan_dependencies(preamble)
+    result.sort()
+    return result
+
+
+def preamble_key(preamble, dependencies, argv):
+    """ Return a hex digest that changes whenever the preamble, the content
+        of one of the files in dependencies, or the argument list argv used
+        to build the format changes
+    """
+    hasher = hashlib.sha1()
+    hasher.update(preamble)
+    for filename in dependencies:
+        hasher.update('\0%s\0%s' % (filename, digest(filename)))
+    for argument in argv:
+        hasher.update('\0' + argument)
+    return hasher.hexdigest()
@@ -0,0 +1,284 @@
+# -*- coding: utf-8 -*-
+############################################################################
+#    Copyright (C) 2008 by Michael Goerz                                   #
+#    http://www.physik.fu-berlin.de/~goerz                                 #
+#                                                                          #
+#    This program is free software; you can redistribute it and/or modify  #
+#    it under the terms of the GNU General Public License as published by  #
+#    the Free Software Foundation; either version 3 of the License, or     #
+#    (at your option) any later version.                                   #
+#                                                                          #
+#    This program is distributed in the hope that it will be useful,       #
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of        #
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the         #
+#    GNU General Public License for more details.                          #
+#                                                                          #
+#    You should have received a copy of the GNU General Public License     #
+#    along with this program; if not, write to the                         #
+#    Free Software Foundation, Inc.,                                       #
+#    59 Temple Place - Suite 330, Boston, MA  02111-1307, USA.             #
+############################################################################
+
+
+""" This module is the Profiler singleton, which profiles a running
+    texpreview session on request, without restarting it.
+
+    After install(), the profiler is controlled with signals:
+    SIGUSR1     Start profiling, or stop it if it is running
+    SIGUSR2     Write the profile and a snapshot of the memory usage
+
+    The sections of the program between begin() and end() are profiled
+    with cProfile: the iterations of the compile loop, and the compile
+    methods of a Texfile. Each thread has its own profiler, which is only
+    enabled within these sections; sections of one thread can be nested.
+    Starting or stopping the profiling takes effect when the next section
+    begins, a running section is always profiled to its end.
+
+    The signal handlers only count the requests, since a signal may arrive
+    while the main thread holds a lock (of the printer, or of the
+    profiler). The requests are carried out by poll(), which the compile
+    loop calls in every iteration (a signal wakes up the loop).
+
+    A dump consists of two files, named after the filename given to
+    install() and the number of the dump: filename.N.prof contains the
+    accumulated profile of all threads (for pstats, or tools like snakeviz)
+    and filename.N.txt a report with the functions that took the most
+    time, and the memory usage. The memory snapshot shows the top lines of
+    allocation if tracemalloc is available (Python 3; it is started with
+    the profiling), and otherwise the maximum resident set size and the
+    types with the most objects tracked by the garbage collector.
+
+    Before install() is called, begin(), end() and poll() return
+    immediately.
+"""
+
+import os
+import gc
+import time
+import signal
+import pstats
+import cProfile
+import threading
+import TexpreviewPrinter as Out
+VERB_SILENT = Out.VERB_SILENT
+VERB_ERR    = Out.VERB_ERR
+VERB_WARN   = Out.VERB_WARN
+VERB_STATUS = Out.VERB_STATUS
+VERB_DEBUG  = Out.VERB_DEBUG
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+# Number of functions, lines or types that are listed in the report
+TOPN = 40
+
+profiling = False # are new sections profiled?
+
+_filename = None
+_dumps = 0 # number of dumps written so far
+_togglerequests = 0 # number of SIGUSR1 received (set by the handler only)
+_dumprequests = 0 # number of SIGUSR2 received (set by the handler only)
+_toggles = 0 # number of toggle requests carried out by poll()
+_dumpshandled = 0 # number of dump requests carried out by poll()
+_profiles = {} # thread id -> cProfile.Profile
+_depths = {} # thread id -> number of open sections
+_lock = threading.Lock()
+
+
+def install(filename):
+    """ Install the signal handlers, and write the dumps to files starting
+        with filename. Return False if the signals are not available on
+        this system.
+    """
+    global _filename
+    if not hasattr(signal, 'SIGUSR1'):
+        return False
+    _filename = filename
+    for signalnumber, handler in [(signal.SIGUSR1, _request_toggle),
+                                  (signal.SIGUSR2, _request_dump)]:
+        signal.signal(signalnumber, handler)
+        # restart system calls (e.g. reading the compiler output in a
+        # worker thread) instead of failing with EINTR
+        signal.siginterrupt(signalnumber, False)
+    Out.write("Profiling hooks installed: send SIGUSR1 to process %s to "
+              "start or stop profiling, SIGUSR2 to write the profile\n",
+              args=(os.getpid(),))
+    return True
+
+
+def begin():
+    """ Begin a section of the current thread, which is profiled if
+        profiling is on
+    """
+    if not profiling:
+        return
+    ident = threading.currentThread().ident
+    _lock.acquire()
+    try:
+        depth = _depths.get(ident, 0)
+        _depths[ident] = depth + 1
+        if depth == 0:
+            if not _profiles.has_key(ident):
+                _profiles[ident] = cProfile.Profile()
+            profile = _profiles[ident]
+        else:
+            profile = None
+    finally:
+        _lock.release()
+    if profile is not None:
+        profile.enable()
+
+
+def end():
+    """ End a section of the current thread """
+    if _filename is None:
+        return
+    ident = threading.currentThread().ident
+    _lock.acquire()
+    try:
+        depth = _depths.get(ident, 0)
+        if depth == 0: # the section began before profiling was started
+            return
+        _depths[ident] = depth - 1
+        profile = _profiles[ident]
+    finally:
+        _lock.release()
+    if depth == 1:
+        profile.disable()
+
+
+def poll():
+    """ Carry out the requests that arrived by signal since the last call:
+        start or stop profiling, and write the profile. Must be called
+        from the main thread, outside of the sections.
+    """
+    global _toggles, _dumpshandled
+    if _filename is None:
+        return
+    requests = _togglerequests
+    while _toggles < requests:
+        _toggles += 1
+        _toggle()
+    requests = _dumprequests
+    if _dumpshandled < requests: # several requests give a single dump
+        _dumpshandled = requests
+        _dump()
+
+
+def _request_toggle(signalnumber, frame):
+    """ Signal handler for SIGUSR1: request to start or stop profiling """
+    global _togglerequests
+    _togglerequests += 1
+
+
+def _request_dump(signalnumber, frame):
+    """ Signal handler for SIGUSR2: request to write the profile """
+    global _dumprequests
+    _dumprequests += 1
+
+
+def _toggle():
+    """ Start or stop profiling """
+    global profiling
+    profiling = not profiling
+    if profiling:
+        if tracemalloc is not None and not tracemalloc.is_tracing():
+            tracemalloc.start()
+        Out.write("Profiling started\n")
+    else:
+        Out.write("Profiling stopped\n")
+    Out.flush()
+
+
+def _dump():
+    """ Write the profile and the memory snapshot """
+    global _dumps
+    _dumps += 1
+    basename = "%s.%d" % (_filename, _dumps)
+    try:
+        report = open(basename + '.txt', 'w')
+        try:
+            report.write("texpreview.py (process %d), dump %d at %s\n"
+                         % (os.getpid(), _dumps, time.ctime()))
+            report.write("Profiling is %s\n\n" % (profiling and "on" or "off"))
+            stats = _collect_stats(report)
+            if stats is None:
+                report.write("No profile recorded yet\n\n")
+            else:
+                stats.dump_stats(basename + '.prof')
+                stats.sort_stats('cumulative').print_stats(TOPN)
+            _write_memory(report)
+        finally:
+            report.close()
+        Out.write("Wrote the profile to %s.txt\n" % basename)
+    except IOError, data:
+        Out.write("Could not write the profile to %s: %s\n" \
+                  % (basename, data), VERB_WARN)
+    Out.flush()
+
+
+def _collect_stats(report):
+    """ Return the pstats.Stats of all threads (printing to report), or
+        None if nothing has been profiled yet
+    """
+    stats = None
+    _lock.acquire()
+    try:
+        profiles = _profiles.values()
+    finally:
+        _lock.release()
+    for profile in profiles:
+        # snapshot_stats, unlike create_stats, doesn't disable a profile
+        # that is running in another thread
+        profile.snapshot_stats()
+        if len(profile.stats) == 0:
+            continue
+        if stats is None:
+            stats = pstats.Stats(_Snapshot(profile.stats), stream=report)
+        else:
+            stats.add(_Snapshot(profile.stats))
+    return stats
+
+
+def _write_memory(report):
+    """ Write a snapshot of the memory usage to report """
+    report.write("\nMemory\n======\n")
+    if resource is not None:
+        report.write("Maximum resident set size: %d kB\n"
+                     % resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
+    if tracemalloc is not None and tracemalloc.is_tracing():
+        snapshot = tracemalloc.take_snapshot()
+        report.write("Top %d lines by allocated memory:\n" % TOPN)
+        for statistic in snapshot.statistics('lineno')[:TOPN]:
+            report.write("%s\n" % statistic)
+        return
+    counts = {}
+    for obj in gc.get_objects():
+        name = type(obj).__name__
+        counts[name] = counts.get(name, 0) + 1
+    types = counts.items()
+    types.sort(key=lambda item: item[1], reverse=True)
+    report.write("Objects tracked by the garbage collector: %d\n"
+                 % sum(counts.values()))
+    report.write("Top %d types by number of objects:\n" % TOPN)
+    for name, count in types[:TOPN]:
+        report.write("%10d  %s\n" % (count, name))
+
+
+class _Snapshot(object):
+    """ Stats of a profile, in the form that pstats.Stats accepts """
+
+    def __init__(self, stats):
+        """ Wrap the stats dict of a profile """
+        self.stats = stats
+
+    def create_stats(self):
+        """ The stats are already there """
+        pass
@@ -0,0 +1,144 @@
+# -*- coding: utf-8 -*-
+############################################################################
+#    Copyright (C) 2008 by Michael Goerz                                   #
+#    http://www.physik.fu-berlin.de/~goerz                                 #
+#                                                                          #
+#    This program is free software; you can redistribute it and/or modify  #
+#    it under the terms of the GNU General Public License as published by  #
+#    the Free Software Foundation; either version 3 of the License, or     #
+#    (at your option) any later version.                                   #
+#                                                                          #
+#    This program is distributed in the hope that it will be useful,       #
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of        #
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the         #
+#    GNU General Public License for more details.                          #
+#                                                                          #
+#    You should have received a copy of the GNU General Public License     #
+#    along with this program; if not, write to the                         #
+#    Free Software Foundation, Inc.,                                       #
+#    59 Temple Place - Suite 330, Boston, MA  02111-1307, USA.             #
+############################################################################
+
+""" This module contains the publish function, which puts a new version of
+    a file (the compiled pdf) in place of another one (the preview pdf that
+    the viewer shows).
+
+    The new version is first created under a temporary name in the
+    directory of the target, and then renamed to the target. The rename is
+    atomic, so a viewer never sees a half-written file. The temporary file
+    is created in the cheapest way the file system supports:
+    - a reflink (a copy-on-write clone of the file, on btrfs or xfs)
+    - a hardlink (the caller must make sure that the source is not
+      overwritten in place afterwards, see is_shared)
+    - a copy
+    If the target already has the same content as the source, nothing is
+    done, so that viewers don't reload the file.
+"""
+
+import os
+import errno
+import shutil
+try:
+    import fcntl
+except ImportError:
+    fcntl = None # not available on Windows
+import TexpreviewPrinter as Out
+VERB_SILENT = Out.VERB_SILENT
+VERB_ERR    = Out.VERB_ERR
+VERB_WARN   = Out.VERB_WARN
+VERB_STATUS = Out.VERB_STATUS
+VERB_DEBUG  = Out.VERB_DEBUG
+
+
+# ioctl request for cloning a file on Linux (FICLONE from linux/fs.h)
+FICLONE = 0x40049409
+
+# Block size for comparing files
+BLOCKSIZE = 1024 * 1024
+
+
+def publish(source, target):
+    """ Atomically replace target by a copy of source. Return the method
+        that was used ('reflink', 'hardlink', 'copy'), or None if target
+        already had the same content. Raises IOError or OSError if source
+        can't be published.
+    """
+    if os.path.exists(target) and same_content(source, target):
+        return None
+    temporary = os.path.join(os.path.dirname(target),
+                    ".%s.%s.tmp" % (os.path.basename(target), os.getpid()))
+    if os.path.exists(temporary):
+        os.remove(temporary)
+    try:
+        for method, function in [('reflink', _reflink),
+                                 ('hardlink', _hardlink),
+                                 ('copy', shutil.copyfile)]:
+            try:
+                function(source, temporary)
+                break
+            except (IOError, OSError), data:
+                if method == 'copy':
+                    raise
+                Out.write("Can't publish %s by %s: %s\n", VERB_DEBUG,
+                          args=(source, method, data))
+                if os.path.exists(temporary):
+                    os.remove(temporary)
+        if os.name == 'nt' and os.path.exists(target):
+            os.remove(target) # rename doesn't replace files on Windows
+        os.rename(temporary, target)
+    finally:
+        if os.path.exists(temporary):
+            os.remove(temporary)
+    return method
+
+
+def is_shared(filename):
+    """ Return True if filename exists and has more than one hardlink """
+    try:
+        return (os.stat(filename).st_nlink > 1)
+    except OSError:
+        return False
+
+
+def same_content(filename1, filename2):
+    """ Return True if the two files have the same content """
+    if hasattr(os.path, 'samefile') and os.path.samefile(filename1, filename2):
+        return True
+    if os.path.getsize(filename1) != os.path.getsize(filename2):
+        return False
+    file1 = open(filename1, 'rb')
+    try:
+        file2 = open(filename2, 'rb')
+        try:
+            while True:
+                block1 = file1.read(BLOCKSIZE)
+                if block1 != file2.read(BLOCKSIZE):
+                    return False
+                if not block1:
+                    return True
+        finally:
+            file2.close()
+    finally:
+        file1.close()
+
+
+def _reflink(source, target):
+    """ Create target as a copy-on-write clone of source """
+    if fcntl is None:
+        raise OSError(errno.EOPNOTSUPP, "reflinks are not supported")
+    sourcefile = open(source, 'rb')
+    try:
+        targetfile = open(target, 'wb')
+        try:
+            fcntl.ioctl(targetfile.fileno(), FICLONE, sourcefile.fileno())
+        finally:
+            targetfile.close()
+    finally:
+        sourcefile.close()
+
+
+def _hardlink(source, target):
+    """ Create target as a hardlink to source """
+    if not hasattr(os, 'link'):
+        raise OSError(errno.EOPNOTSUPP, "hardlinks are not supported")
+    os.link(source, target)
@@ -0,0 +1,169 @@
+# -*- coding: utf-8 -*-
+############################################################################
+#    Copyright (C) 2008 by Michael Goerz                                   #
+#    http://www.physik.fu-berlin.de/~goerz                                 #
+#                                                                          #
+#    This program is free software; you can redistribute it and/or modify  #
+#    it under the terms of the GNU General Public License as published by  #
+#    the Free Software Foundation; either version 3 of the License, or     #
+#    (at your option) any later version.                                   #
+#                                                                          #
+#    This program is distributed in the hope that it will be useful,       #
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of        #
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the         #
+#    GNU General Public License for more details.                          #
+#                                                                          #
+#    You should have received a copy of the GNU General Public License     #
+#    along with this program; if not, write to the                         #
+#    Free Software Foundation, Inc.,                                       #
+#    59 Temple Place - Suite 330, Boston, MA  02111-1307, USA.             #
+############################################################################
+
+""" This module contains a scanner that extracts the labels, references,
+    citations and index items from the source of a tex file in a single
+    pass.
+
+    The regular expression engine searches for the \\label, \\ref, \\index,
+    \\cite... and \\verb commands in one pass; everything in between is
+    skipped at C speed. Only at these commands, the scanner checks whether
+    they are commented out (there is an unescaped '%' earlier on the same
+    line, outside of a \\verb) or escaped. The contents of \\verb are
+    skipped. Optional arguments (e.g. \\cite[p.~5]{key}) are skipped, and
+    the keys of a citation like \\cite{a,b,c} are returned separately.
+
+    >>> result = scan_elements(r'\\label{a} % \\ref{b}' + '\\n' + r'\\cite{c, d}')
+    >>> result['labels'], result['references'], result['citations']
+    (['a'], [], ['c', 'd'])
+"""
+
+import re
+
+
+# The commands we are interested in, and the key in the result dict under
+# which their arguments are stored. All commands starting with 'cite' are
+# stored under 'citations'.
+ELEMENTS = {'label' : 'labels',
+            'ref'   : 'references',
+            'index' : 'index'}
+
+# Each alternative starts with a literal, which lets the regular expression
+# engine skip quickly to the next candidate. Arguments without nested braces
+# are captured directly in the 'argument' group.
+_TOKEN = re.compile(r"""
+      \\verb\*?(?![a-zA-Z])
+    | \\(?P<command>cite[a-zA-Z]{0,3}\*?(?![a-zA-Z])
+                   |label(?![a-zA-Z])|ref(?![a-zA-Z])|index(?![a-zA-Z]))
+      (?:\s*(?:\[[^\]]*\]\s*)*\{(?P<argument>[^{}\\]*)\})?
+""", re.X)
+
+_VERB = re.compile(r'\\verb\*?(?![a-zA-Z])')
+
+_OPTIONAL_ARGUMENTS = re.compile(r'\s*(?:\[[^\]]*\]\s*)*')
+
+_BRACE = re.compile(r'\\.|[{}]', re.S)
+
+
+def scan_elements(text):
+    """ Return a dict with the lists of 'labels', 'references', 'citations',
+        and 'index' items that occur in text
+    """
+    result = {'labels'    :[],
+              'references':[],
+              'citations' :[],
+              'index'     :[]}
+    citations = result['citations']
+    find = text.find
+    rfind = text.rfind
+    skipto = 0 # matches before this position are skipped
+    for match in _TOKEN.finditer(text):
+        start = match.start()
+        if start < skipto:
+            continue
+        if start > 0 and text[start-1] == '\\' and is_escaped(text, start):
+            continue
+        # only look closer if there is a '%' on the line before the command
+        linestart = rfind('\n', 0, start) + 1
+        if find('%', linestart, start) >= 0 and is_commented(text, start):
+            skipto = find('\n', start)
+            if skipto < 0:
+                break
+            continue
+        command, argument = match.group('command', 'argument')
+        if command is None:
+            # \verb|...|: skip to the next occurrence of the delimiter
+            end = match.end()
+            if end < len(text):
+                skipto = find(text[end], end + 1) + 1
+                if skipto == 0:
+                    break
+            continue
+        if argument is None:
+            argument, skipto = read_argument(text, match.end())
+            if argument is None:
+                continue
+        if command[0] == 'c': # \cite...
+            for key in argument.split(','):
+                key = key.strip()
+                if key != '':
+                    citations.append(key)
+        else:
+            result[ELEMENTS[command]].append(argument)
+    return result
+
+
+def is_escaped(text, position):
+    """ Return True if the character at position in text is preceded by an
+        odd number of backslashes
+    """
+    backslashes = 0
+    while position > backslashes \
+    and text[position - backslashes - 1] == '\\':
+        backslashes += 1
+    return (backslashes % 2 == 1)
+
+
+def is_commented(text, position):
+    """ Return True if there is an unescaped '%' between the start of the
+        line and position in text, which is not inside a \\verb
+
+        >>> is_commented(r'\\verb+%+ \\label{e}', 10)
+        False
+    """
+    start = text.rfind('\n', 0, position) + 1
+    while True:
+        percent = text.find('%', start, position)
+        if percent < 0:
+            return False
+        verb = _VERB.search(text, start, percent)
+        if verb is not None and not is_escaped(text, verb.start()):
+            # skip to the closing delimiter of the \verb
+            end = verb.end()
+            close = text.find(text[end], end + 1, position)
+            if close < 0:
+                return False # position is inside the \verb
+            start = close + 1
+        elif is_escaped(text, percent):
+            start = percent + 1
+        else:
+            return True
+
+
+def read_argument(text, position):
+    """ Return a tuple (argument, endposition) for the mandatory argument of
+        a command that ends at position in text. Optional arguments in
+        brackets are skipped. If there is no mandatory argument, or its
+        braces are unbalanced, argument is None.
+    """
+    position = _OPTIONAL_ARGUMENTS.match(text, position).end()
+    if text[position:position+1] != '{':
+        return None, position
+    open_brackets = 0
+    for brace in _BRACE.finditer(text, position):
+        character = brace.group()
+        if character == '{':
+            open_brackets += 1
+        elif character == '}':
+            open_brackets -= 1
+            if open_brackets == 0:
+                return text[position+1:brace.start()], brace.end()
+    return None, position + 1
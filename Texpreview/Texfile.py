@@ -24,11 +24,23 @@
 import os
 import sys
 import re
+import stat
 import subprocess
 import time
 import shutil
+import hashlib
+import tempfile
+import threading
 from glob import glob
-from CompilerOutputPrinter import CompilerOutputPrinter
+from Executor import Executor, split_command
+from Cache import Cache, CACHEDIR, fingerprint, digest
+from TexScanner import scan_elements
+from Preamble import split_preamble, preamble_dependencies, preamble_key
+from Publisher import publish, is_shared
+from Metrics import Metrics
+import Trace
+import Profiler
+from Diagnostics import ERROR, WARNING
 import TexpreviewPrinter as Out
 VERB_SILENT = Out.VERB_SILENT
 VERB_ERR    = Out.VERB_ERR
@@ -45,6 +57,69 @@ BINARYEXTENSIONS = ['.pdf', '.png', '.jpg', '.jpeg', '.eps',
 # treated like a changed citation
 BIBEXTENSIONS = ['.bib', '.bst']
 
+# Files written by the tex compiler that are read back in the next pass. As
+# long as a pass changes any of them, another pass is necessary. (The .idx
+# file is only read by makeindex; another pass is only necessary if the .ind
+# file that makeindex writes from it changes.)
+AUXEXTENSIONS = ['.aux', '.toc', '.lof', '.lot', '.out']
+
+# Files generated from the aux files by bibtex and makeindex. They are kept
+# in the cache together with the aux files, so that a new session can start
+# without compiling.
+GENERATEDEXTENSIONS = ['.bbl', '.ind']
+
+# Value of the 'outdir' option that puts the output directory on a tmpfs
+TMPFSOUTDIR = 'tmpfs'
+
+# Directory for TMPFSOUTDIR; the system's temporary directory is used if it
+# does not exist
+TMPFSDIR = '/dev/shm'
+
+# File that marks an output directory as created by texpreview. Only such a
+# directory is removed as a whole by the cleanup.
+OUTDIRMARKER = '.texpreview-outdir'
+
+# Suffix of a pdf file that is moved aside during a run, because it is
+# hardlinked to the preview (see Texfile._unshare_pdf)
+UNSHAREDSUFFIX = '.unshared'
+
+# Warnings of the tex compiler that ask for another pass. Requests for a
+# run of bibtex or biber ("Please (re)run Biber") are not among them, see
+# BIBRERUNPATTERN.
+RERUNPATTERN = re.compile(r'Rerun to get|Rerun LaTeX|Please rerun LaTeX|'
+                          r'Label\(s\) may have changed')
+
+# Pattern for the aux files of \include'd files, as referenced in the main
+# aux file
+AUXINPUTPATTERN = re.compile(r'\\@input\{(?P<filename>[^}]*)\}')
+
+# Lines in the aux files that bibtex reads, and the \@input of the aux files
+# of \include'd files
+BIBTEXAUXPATTERN = re.compile(r'^\\(?P<command>citation|bibdata|bibstyle)'
+                              r'\{(?P<argument>.*)\}[ \t]*$'
+                              r'|\\@input\{(?P<filename>[^}]*)\}', re.M)
+
+# The data sources (.bib files) in the .bcf control file that biblatex
+# writes for biber
+BCFDATASOURCEPATTERN = re.compile(r'<bcf:datasource[^>]*>'
+                                  r'(?P<filename>[^<]*)</bcf:datasource>')
+
+# Warnings of the tex compiler that ask for bibtex or biber to be run
+BIBRERUNPATTERN = re.compile(r'Please \(re\)run (?:Biber|BibTeX)|'
+                             r'Please rerun BibTeX')
+
+# Number of results of bibtex or biber (.bbl files) and of makeindex (.ind
+# files) that are kept in the cache, for different inputs
+MEMOSIZE = 8
+
+# Programs that are called through 'makeindexbin' whose input and output
+# files can be found from their command line, so that their results can be
+# kept in the cache
+MAKEINDEXPROGRAMS = ['makeindex', 'mendex', 'upmendex']
+
+# Options of MAKEINDEXPROGRAMS that take a value
+MAKEINDEXVALUEOPTIONS = ['-s', '-o', '-t', '-p']
+
 
 
 class Texfile:
@@ -63,27 +138,143 @@ class Texfile:
         texcompiler     [pdflatex]       Program used for compilation
         compileroptions []               Options passed to the compiler
         makeindex       [True]           Should makeindex be called?
-        bibtex          [True]           Should bibtex be called?
+        bibtex          [True]           Should bibtex (or biber) be
+                                         called?
         makeindexbin    [makeindex %]    path/name of makeindex program
         bibtexbin       [bibtex %]       path/name of bibtex program
+        biberbin        [biber %]        path/name of biber program
         extracompiler   []               additional compiler
+        maxpasses       [5]              Maximum number of consecutive
+                                         runs of the tex compiler
         dvi             [False]          Does compiler yield dvi?
         viewer          [kpdf]           PDF file viewer
         no_cleanup      [False]          Should temp files be kept?
         cleanup         [[]]             List of files to be deleted.
         color           [False]          Color output
+        cache           [True]           Keep file digests etc. in a
+                                         cache directory between sessions
+        precompile      [False]          Precompile the preamble into a
+                                         format file
+        recorder        [False]          Watch the files that the tex
+                                         compiler reads (-recorder)
+        outdir          []               Directory for the files written
+                                         by the compilers
+        failfast        [False]          Stop the tex compiler at the
+                                         first error
 
         The items of cleanupfiles are expanded with glob, and the '%'
         wildcard is replaced by filename (without extension)
 
         extracompiler is executed between two runs of the tex compiler.
 
+        The tex compiler is run again as long as a run changes one of the
+        files it reads back in the next run (the aux files, see
+        AUXEXTENSIONS), or its output asks for a rerun, but at most
+        'maxpasses' times in a row.
+
+        If 'precompile' is set, the preamble of the texfile is dumped into a
+        format file in the cache directory (using the mylatexformat
+        package), which the tex compiler loads instead of processing the
+        preamble in every run. The format is only rebuilt when the preamble,
+        a local package or class it loads, or the compiler options change.
+        If the format can't be built, or 'cache' is not set, the texfile is
+        compiled normally.
+
+        If 'recorder' is set, the tex compiler is run with -recorder, and
+        after each successful run the watchfiles are brought in line with
+        the files listed as INPUT in the .fls file (except for files in the
+        tex system and files generated by the compilation). Watchfiles that
+        were given explicitly are never removed.
+
+        If 'outdir' is set, all files written by the compilers go to that
+        directory instead of the directory of the texfile ('%' is replaced
+        by the name of the texfile without extension). The tex compiler is
+        run with -output-directory, bibtex, makeindex and the extracompiler
+        get the path in the output directory for '%', dvipdf is run in the
+        output directory, and TEXMFOUTPUT is set to the output directory.
+        Subdirectories of the watchfiles are mirrored in the output
+        directory, for the aux files of \\include'd files. With the value
+        TMPFSOUTDIR, the output directory is created in TMPFSDIR (RAM); an
+        existing directory of that name is only used if it is a private
+        directory of the current user. If texpreview has created the output
+        directory itself (it contains OUTDIRMARKER), the cleanup removes it
+        as a whole, unless it contains the current directory or any
+        watchfile. Otherwise, only the cleanup files are deleted from it.
+
+        Bibtex is only run if its input has changed: the \\citation,
+        \\bibdata and \\bibstyle lines of the aux files, or the content of
+        the .bib and .bst files. The .bbl files of the last MEMOSIZE
+        different inputs are kept in the cache, and restored from there
+        when the input matches (.bib and .bst files outside the current
+        directory are found with kpsewhich; if one of them can't be found,
+        bibtex is always run). A full compilation always runs bibtex. In
+        smart mode, the tex compiler is only run
+        again after bibtex if the .bbl file has changed. A changed .bib or
+        .bst file counts as a change of the citations.
+
+        If the aux files contain no \\bibdata, but the tex compiler wrote a
+        .bcf file (biblatex with the biber backend), biber is run instead
+        of bibtex. Its results are kept in the cache in the same way, under
+        the digest of the .bcf file and of the data sources it lists (not
+        if a data source is remote or can't be found). In
+        smart mode, the bibliography is also brought up to date when the
+        output of the tex compiler asks for a run of bibtex or biber.
+
+        'makeindexbin' may contain several commands, separated by ';', e.g.
+        for a glossary or nomenclature in addition to the index. Commands
+        that call makeindex (see MAKEINDEXPROGRAMS) are handled like
+        bibtex: their result is kept in the cache under the digest of the
+        input file (e.g. the .idx file) and the style file, and they are
+        skipped if their input file does not exist.
+
+        If 'failfast' is set, the tex compiler is run with -halt-on-error,
+        and it is terminated as soon as an error appears in its output. The
+        compilation then stops without running any further programs, and
+        the aux files are restored to their state before the failed run
+        (also if the tex compiler stopped at the error by itself), and the
+        partial pdf is removed.
+
+        Every run of an external program, every check for changes, and
+        every compilation as a whole is recorded in the Metrics object
+        given to set_metrics (by default, one that does nothing). Results
+        taken from the cache are recorded with 'cached'. The latency of a
+        compilation is measured from the detection of the first change
+        that it includes; if the compilation is cancelled, that change is
+        carried over to the next one. If tracing is on (see Trace.py), the
+        same stages also appear as spans in the trace. The compile methods
+        are sections of the Profiler.
+
+
+        A watchfile only counts as changed if its content has changed:
+        when its size or modification time differ from the last check,
+        the digest of the file is compared to the stored one. The
+        fingerprints (size, modification time, digest) of all watchfiles
+        are saved in the cache directory (CACHEDIR, next to the texfile),
+        so that files don't have to be digested again in the next
+        session.
+
+        Together with the fingerprints, the state file in the cache
+        contains the labels, references, citations and index items of all
+        watchfiles, the files found by the recorder, and, after a
+        successful compilation, the fingerprint of the pdf and the content
+        of the aux files (and of the files generated from them, see
+        GENERATEDEXTENSIONS). If on startup all watchfiles and the pdf
+        still match the stored state (and the compile options are the
+        same), firstcompile skips the initial compilation. Aux files that
+        have been deleted in the meantime are restored from the state.
 
         The 'changed' dict has the following keys:
         citations, labels, references, index
 
-        After has_changed is called. All the flags in 'changed' are
-        set.
+        has_changed sets the flags in 'changed' for every change it finds.
+        A compilation takes the flags (and clears them) when it starts; if
+        it fails or is cancelled, it puts them back, so that the next
+        compilation still knows what has to be done.
+
+        A running compilation can be cancelled from another thread with
+        cancel(). The running program is terminated, the aux files are
+        restored to their state before the interrupted run, and the
+        compilation returns False.
     """
 
     def __init__(self, filename):
@@ -98,6 +289,7 @@ class Texfile:
         self.options['compileroptions'] = ''
         self.options['bibtex'] = True
         self.options['bibtexbin'] = 'bibtex %'
+        self.options['biberbin'] = 'biber %'
         self.options['makeindexbin'] = 'makeindex %'
         self.options['extracompiler'] = ''
         self.options['color'] = False
@@ -106,6 +298,12 @@ class Texfile:
         self.options['no_cleanup'] = False
         self.options['viewer'] = 'kpdf'
         self.options['cleanup'] = []
+        self.options['cache'] = True
+        self.options['maxpasses'] = 5
+        self.options['precompile'] = False
+        self.options['recorder'] = False
+        self.options['outdir'] = ''
+        self.options['failfast'] = False
         self._basename = self.filename # filename without ending
         if self._basename.endswith('.tex'):
             self._basename = self._basename.replace('.tex', '')
@@ -116,20 +314,50 @@ class Texfile:
         self._labels = {}     # lists of references, labels,
         self._citations = {}  # citations, and index items that
         self._indexitems = {} # occur in these files.
-        self._watchfiletimes = {} # dict of filenames to change times
-        self._patterns = {
-            'citations'  : re.compile(r'\\cite[a-z*]{,3}\{'),
-            'labels'     : re.compile(r'\\label\{'),
-            'references' : re.compile(r'\\ref\{'),
-            'index'      : re.compile(r'\\index\{')
-        }
+        self._fingerprints = {} # dict of watchfiles to (size, mtime, digest)
+        self._cache = Cache(os.path.join(os.path.dirname(self._basename),
+                                         CACHEDIR))
+        self._statename = os.path.basename(self._basename) + '.state'
+        self._stable = False # did the last pass leave the aux files alone?
+        self._executor = Executor()
+        self._lock = threading.RLock() # protects self.changed, watchfiles
+        self._graph = None # DependencyGraph used for autowatch
+        self._autowatched = [] # watchfiles added by autowatch
+        self._recorded = [] # watchfiles added from the recorder file
+        self._formatkey = None # key of the precompiled preamble
+        self._memos = {} # 'bibtex', 'makeindex' -> list of (key, output)
+        self._inputfingerprints = {} # fingerprints of .bib, .bst, ... files
+        self._inputpaths = {} # .bib, .bst, ... files -> path found by
+                              # kpsewhich
+        self._bblchanged = False # did the last run_bibliography change
+                                 # the .bbl?
+        self._bibrequested = False # did the last pass ask for bibtex/biber?
+        self._indchanged = False # did the last run_makeindex change a .ind?
+        self._metrics = Metrics() # records the stages, see set_metrics
+        self._changetime = None # detection of the first uncompiled change
+        self._compilationchangetime = None # _changetime of the compilation
+        self._compilationstart = None # start time of the compilation
+        self._compilationmode = None # 'full', 'smart', or 'simple'
+        self._latexpass = 0 # number of runs of the tex compiler in the
+                            # running compilation
+        self._failedformatkey = None # key of a preamble that failed
+        self._outdir = None # absolute output directory, '' for none
+        self._outdircreated = False # was the output directory created by
+                                    # texpreview?
+        self._outputs = None # fingerprints of up-to-date output files
+        self._generation = 0 # incremented with every change of the sources
+        self._startgeneration = 0 # generation of the running compilation
+        # The state stored by the last session is only read on first use,
+        # once the options are set (see _stored_state)
+        self._storedstate = {}
         self.add_watchfile(self._basename + '.tex')
+        self._storedstate = None
 
     def _get_elements_from_file(self, filename):
         """ Return a dict with the following four elements:
             - a list of 'labels' defined in the file
             - a list of 'references' defined in the file
-            - a list of 'citations' defined in the file
+            - a list of 'citations' (the individual keys) used in the file
             - a list of 'index' items defined in the file
         """
         result = {'labels'    :[],
@@ -147,125 +375,474 @@ class Texfile:
             Out.write("Couldn't read %s for analysis:\n" % filename, VERB_WARN)
             Out.write(data + "\n", VERB_WARN)
             return None
-        for element in result.keys(): # elements are labels, references, ...
-            position = 0
-            while True:
-                element_match = \
-                         self._patterns[element].search(filecontents, position)
-                if element_match:
-                    position = element_match.start() + 1
-                    result[element].append( \
-                                       extract_element(filecontents, position))
-                else:
-                    break # next element
+        return scan_elements(filecontents)
+
+    def set_metrics(self, metrics):
+        """ Record the stages of all compilations in metrics (a Metrics
+            object, which may be shared with other Texfiles)
+        """
+        self._metrics = metrics
+
+    def _run(self, stage, argv, cwd=None, callback=None, **fields):
+        """ Run argv with the executor (see Executor.run), record it as
+            stage in the metrics, and return the ExecutionResult.
+            Additional fields are passed to the metrics.
+        """
+        Trace.begin(stage, 'stage', fields)
+        result = self._executor.run(argv, cwd, callback)
+        Trace.end(stage, 'stage')
+        self._metrics.record_execution(self.filename, stage, result,
+                                       **fields)
         return result
 
-    def run_bibtex(self):
-        """ Run bibtex on the texfile """
-        Out.write("Running bibtex %s\n" % self._basename)
-        bibtex_command = \
-                      self.options['bibtexbin'].replace('%', self._basename)
-        try:
-            bibtexprocess = subprocess.Popen( \
-                    bibtex_command + " 2>&1", \
-                    shell=True, \
-                    cwd=os.getcwd(), \
-                    env=os.environ, \
-                    stdout=subprocess.PIPE, \
-                    stdin=open(os.devnull)
-                )
-            parser = CompilerOutputPrinter(bibtexprocess.stdout)
-            fatal, error, warning = parser.parseStream()
-            # TODO: print out fatal, error, warning (for all the parsers, not
-            # just this one)
-            while True:
-                time.sleep(1)
-                exitcode = bibtexprocess.poll()
-                if exitcode is not None:
-                    break
-                Out.write("Waiting for bibtex to finish.\n", VERB_DEBUG)
-            if exitcode != 0:
-                Out.write("bibtex returned with error (exit code %s).\n" \
-                     % exitcode, VERB_WARN)
-                return False #Failure
+    def run_bibliography(self):
+        """ Create the .bbl file of the texfile: run bibtex if the aux files
+            contain a \\bibdata, or biber if there is a .bcf file. Afterwards,
+            self._bblchanged tells whether the .bbl file was changed.
+        """
+        self._bblchanged = False
+        lines = []
+        self._read_bibtex_lines(self._outputfile('.aux'), lines, [])
+        if 'bibdata' in [command for (command, argument) in lines]:
+            return self.run_bibtex(self._bibtex_key(lines))
+        bcf = _read_file(self._outputfile('.bcf'))
+        if bcf is not None:
+            return self.run_biber(self._biber_key(bcf))
+        Out.write("There is no \\bibdata in %s and no %s, skipping bibtex\n",
+                  VERB_DEBUG, args=(self._outputfile('.aux'),
+                                    self._outputfile('.bcf')))
+        return True
+
+    def run_bibtex(self, key):
+        """ Run bibtex on the texfile, unless the .bbl file for the current
+            bibtex input (key, see _bibtex_key) is in the cache already, in
+            which case it is restored from there (see _memo_lookup)
+        """
+        return self._run_bibliography_program('bibtex', key)
+
+    def run_biber(self, key):
+        """ Run biber on the texfile, unless the .bbl file for the current
+            biber input (key, see _biber_key) is in the cache already, in
+            which case it is restored from there
+        """
+        return self._run_bibliography_program('biber', key)
+
+    def _run_bibliography_program(self, program, key):
+        """ Implementation of run_bibtex and run_biber, for program
+            'bibtex' or 'biber'
+        """
+        starttime = time.time()
+        bblfilename = self._outputfile('.bbl')
+        oldbbl = _read_file(bblfilename)
+        bbl = self._memo_lookup(program, key)
+        if bbl is not None:
+            Out.write("Using the cached %s for the current " \
+                      % bblfilename + "citations and bibliography\n")
+            if bbl != oldbbl:
+                self._restore_auxfiles({bblfilename : bbl})
+                self._bblchanged = True
+            self._memoize(program, key, bbl)
+            self._metrics.record(self.filename, program,
+                                 time.time() - starttime, cached=True)
+            Trace.instant(program, 'stage', {'cached' : True})
             return True
-        except OSError, data:
-            Out.write("bibtex failed to run:\n", VERB_WARN)
-            Out.write(data + "\n", VERB_WARN)
+        Out.write("Running %s %s\n" % (program, self._outputfile('')))
+        result = self._run(program,
+                split_command(self.options[program + 'bin'],
+                              self._outputfile('')))
+        # TODO: print out fatal, error, warning (for all the parsers, not
+        # just this one)
+        if result.cancelled:
+            return False # Failure
+        if result.error is not None:
+            Out.write("%s failed to run:\n" % program, VERB_WARN)
+            Out.write(result.error + "\n", VERB_WARN)
+            return False # Failure
+        if not result.succeeded():
+            Out.write("%s returned with error (exit code %s).\n" \
+                 % (program, result.exitcode), VERB_WARN)
+            return False #Failure
+        bbl = _read_file(bblfilename)
+        self._bblchanged = (bbl != oldbbl)
+        if bbl is not None:
+            self._memoize(program, key, bbl)
+        return True
 
-    def get_includes(self):
-        """Return a list of all files that are included (with \include
-            or \input) in the texfile """
-        # TODO: move includepattern and inputtpattern to self._patterns
-        includepattern = re.compile(r'\\include\{(?P<filename>.*?)\}')
-        inputpattern = re.compile(r'\\input(TikZ)?\{(?P<filename>.*?)\}')
-        result = []
+    def _bibtex_key(self, lines):
+        """ Return a digest of everything that determines the output of
+            bibtex: the bibtex command, the \\citation, \\bibdata and
+            \\bibstyle lines of the aux files (lines, in the order bibtex
+            reads them, see _read_bibtex_lines), and the content of the .bib
+            and .bst files they refer to. Return None if one of these files
+            can't be found, so that the result of bibtex is not memoized.
+        """
+        bibfiles = []
+        for command, argument in lines:
+            if command == 'bibdata':
+                bibfiles += [(name.strip(), '.bib')
+                             for name in argument.split(',')]
+            elif command == 'bibstyle':
+                bibfiles.append((argument.strip(), '.bst'))
+        hasher = hashlib.sha1()
+        hasher.update(repr(self.options['bibtexbin']))
+        hasher.update(repr(lines))
+        for name, extension in bibfiles:
+            if not name.endswith(extension):
+                name += extension
+            inputdigest = self._input_digest(name)
+            if inputdigest is None:
+                return None
+            hasher.update(repr((name, inputdigest)))
+        return hasher.hexdigest()
+
+    def _biber_key(self, bcf):
+        """ Return a digest of everything that determines the output of
+            biber: the biber command, the content of the .bcf file (bcf,
+            the citations and options of all refsections), and the content
+            of the data sources listed in it. Return None if one of the
+            data sources is remote (a URL) or can't be found, so that the
+            result of biber is not memoized.
+        """
+        hasher = hashlib.sha1()
+        hasher.update(repr(self.options['biberbin']))
+        hasher.update(bcf)
+        for match in BCFDATASOURCEPATTERN.finditer(bcf):
+            name = match.group('filename').strip()
+            if '://' in name:
+                return None
+            inputdigest = self._input_digest(name)
+            if inputdigest is None:
+                return None
+            hasher.update(repr((name, inputdigest)))
+        return hasher.hexdigest()
+
+    def _read_bibtex_lines(self, auxfilename, lines, visited):
+        """ Append the (command, argument) tuples of the \\citation,
+            \\bibdata and \\bibstyle lines in auxfilename to lines,
+            following \\@input into the aux files of \\include'd files
+        """
+        if auxfilename in visited:
+            return
+        visited.append(auxfilename)
+        content = _read_file(auxfilename)
+        if content is None:
+            return
+        for match in BIBTEXAUXPATTERN.finditer(content):
+            if match.group('filename') is not None:
+                self._read_bibtex_lines(os.path.join(
+                            os.path.dirname(self._outputfile('')),
+                            match.group('filename')), lines, visited)
+            else:
+                lines.append(match.group('command', 'argument'))
+
+    def _input_digest(self, filename):
+        """ Return the digest of filename, an input file of bibtex, biber or
+            makeindex (e.g. a .bib or .bst file), or None if it can't be
+            found. Files that are not in the current directory are looked
+            up in the tex system (e.g. in BIBINPUTS) with kpsewhich.
+        """
+        path = filename
+        if not os.path.isfile(path):
+            if not self._inputpaths.has_key(filename):
+                self._inputpaths[filename] = _kpsewhich(filename)
+            path = self._inputpaths[filename]
+            if path is None:
+                return None
         try:
-            texfile = open(self._basename + ".tex")
-            for line in texfile:
-                includematch = includepattern.search(line)
-                inputmatch = inputpattern.search(line)
-                if includematch:
-                    filename = includematch.group('filename') + ".tex"
-                    if os.path.isfile(filename):
-                        result.append(filename)
-                if inputmatch:
-                    filename = inputmatch.group('filename')
-                    if os.path.isfile(filename):
-                        result.append(filename)
-            texfile.close()
-        except IOError, data:
-            Out.write("Couldn't get included files from %s:\n" \
-                                           % self._basename + ".tex", VERB_WARN)
-            Out.write(data + "\n", VERB_WARN)
+            self._inputfingerprints[path] = fingerprint(path,
+                                    self._inputfingerprints.get(path))
+        except OSError:
+            return None
+        return self._inputfingerprints[path][2]
+
+    def _memo(self, name):
+        """ Return the list of (key, output) tuples that is kept in the
+            cache for the program 'name' ('bibtex', 'biber' or
+            'makeindex'), most recent first. If the cache is disabled, the
+            list only lives for the session.
+        """
+        if not self._memos.has_key(name):
+            self._memos[name] = []
+            if self.options['cache']:
+                self._memos[name] = [tuple(entry) for entry in
+                    self._cache.load(os.path.basename(self._basename) + '.'
+                                     + name, [])]
+        return self._memos[name]
+
+    def _memo_lookup(self, name, key):
+        """ Return the output that is kept in the cache for the program
+            'name' and key, or None if there is none. Nothing is looked up
+            if key is None (the input of the program is not known
+            completely), or in a full compilation, which runs all programs
+            unconditionally.
+        """
+        if key is None or self._compilationmode == 'full':
+            return None
+        for memokey, output in self._memo(name):
+            if memokey == key:
+                return output
+        return None
+
+    def _memoize(self, name, key, output):
+        """ Store output as the result of the program 'name' for key, as
+            the most recent entry (unless key is None)
+        """
+        if key is None:
+            return
+        memo = self._memo(name)
+        newmemo = [(key, output)] + [(memokey, memooutput)
+                                     for (memokey, memooutput) in memo
+                                     if memokey != key]
+        newmemo = newmemo[:MEMOSIZE]
+        if newmemo != memo:
+            self._memos[name] = newmemo
+            if self.options['cache']:
+                self._cache.save(os.path.basename(self._basename) + '.' + name,
+                                 newmemo)
+
+    def set_dependency_graph(self, graph):
+        """ Add the texfile to the DependencyGraph graph (which may be
+            shared with other Texfiles), and watch all files it depends on
+            (autowatch). The watched files follow the changes of the
+            dependencies.
+        """
+        graph.add_document(self._basename + '.tex')
+        self._graph = graph
+        self.update_autowatch()
+
+    def update_autowatch(self):
+        """ Bring the automatically watched files in line with the
+            dependency graph: watch new dependencies, and stop watching
+            files that the texfile doesn't depend on anymore
+        """
+        if self._graph is None:
+            return
+        dependencies = self._graph.dependencies(self._basename + '.tex')
+        for watchfile in self._autowatched[:]:
+            if watchfile not in dependencies:
+                self._remove_dependency(watchfile, self._autowatched)
+        for watchfile in sorted(dependencies):
+            self._add_dependency(watchfile, self._autowatched)
+
+    def update_recorded(self):
+        """ Bring the watchfiles in line with the files that the tex
+            compiler has read in its last run, according to the .fls file
+            it writes with the -recorder option
+        """
+        recorded = self._read_recorder_file()
+        if recorded is None:
+            return
+        for watchfile in self._recorded[:]:
+            if watchfile not in recorded:
+                self._remove_dependency(watchfile, self._recorded)
+        for watchfile in recorded:
+            self._add_dependency(watchfile, self._recorded)
+
+    def _read_recorder_file(self):
+        """ Return the list of the files that the tex compiler has read
+            according to the .fls file, or None if there is no .fls file.
+
+            Files in the tex system (i.e. files that are given with an
+            absolute path outside the current directory), files that the
+            compiler also wrote, and files generated for the texfile (named
+            like the texfile, e.g. the .bbl file) are left out.
+        """
+        try:
+            flsfile = open(self._outputfile('.fls'))
+            lines = flsfile.readlines()
+            flsfile.close()
+        except IOError:
+            return None
+        currentdir = os.getcwd()
+        pwd = currentdir
+        inputs = []
+        outputs = []
+        for line in lines:
+            line = line.rstrip('\r\n')
+            if line.startswith('PWD '):
+                pwd = line[4:]
+            elif line.startswith('INPUT '):
+                inputs.append(line[6:])
+            elif line.startswith('OUTPUT '):
+                outputs.append(os.path.join(pwd, line[7:]))
+        outputs = [os.path.normpath(filename) for filename in outputs]
+        generatedprefixes = [os.path.abspath(self._basename) + '.',
+                             os.path.abspath(self._outputfile('.'))]
+        cachedir = os.path.abspath(self._cache.directory) + os.sep
+        result = []
+        for filename in inputs:
+            if os.path.isabs(filename) \
+            and not filename.startswith(currentdir + os.sep):
+                continue # tex system
+            filename = os.path.normpath(os.path.join(pwd, filename))
+            if filename in outputs \
+            or filename.startswith(cachedir) \
+            or (filename != generatedprefixes[0] + 'tex' and
+                [prefix for prefix in generatedprefixes
+                 if filename.startswith(prefix)]):
+                continue
+            filename = _relativepath(filename, currentdir)
+            if filename not in result and os.path.isfile(filename):
+                result.append(filename)
         return result
 
+    def _add_dependency(self, watchfile, owners):
+        """ Watch watchfile on behalf of owners (self._autowatched or
+            self._recorded). Files that were added as watchfiles explicitly
+            are left alone.
+        """
+        if watchfile in owners:
+            return
+        if self._fingerprints.has_key(watchfile):
+            if watchfile not in self._autowatched \
+            and watchfile not in self._recorded:
+                return # explicit watchfile
+        else:
+            Out.write("autowatch: Adding %s to %s watchfilelist\n",
+                      VERB_DEBUG, args=(watchfile, self.filename))
+            self.add_watchfile(watchfile)
+            if not self._fingerprints.has_key(watchfile):
+                return # watched already under another name
+            if self.options['smart'] \
+            and self._references.has_key(self._basename + '.tex'):
+                # the file was added after the first compilation
+                elements = self._read_elements(watchfile)
+                if elements['references']:
+                    self.changed['references'] = True
+                if elements['labels']:
+                    self.changed['labels'] = True
+                if elements['citations']:
+                    self.changed['citations'] = True
+                if elements['index']:
+                    self.changed['index'] = True
+        owners.append(watchfile)
+
+    def _remove_dependency(self, watchfile, owners):
+        """ Stop watching watchfile on behalf of owners (self._autowatched
+            or self._recorded), unless the other one still needs it
+        """
+        owners.remove(watchfile)
+        if watchfile not in self._autowatched \
+        and watchfile not in self._recorded:
+            Out.write("autowatch: Removing %s from %s watchfilelist\n",
+                      VERB_DEBUG, args=(watchfile, self.filename))
+            self.remove_watchfile(watchfile)
+
+    def _read_elements(self, watchfile):
+        """ Read the labels, references, citations and index items of
+            watchfile, store and return them
+        """
+        elements = self._get_elements_from_file(watchfile)
+        self._references[watchfile] = elements['references']
+        self._labels[watchfile] = elements['labels']
+        self._citations[watchfile] = elements['citations']
+        self._indexitems[watchfile] = elements['index']
+        return elements
 
     def run_makeindex(self):
-        """ Run makeindex on the texfile """
-        Out.write("Running makeindex %s\n" % self._basename)
-        makeindex_command = \
-                      self.options['makeindexbin'].replace('%', self._basename)
-        try:
-            makeindexprocess = subprocess.Popen( \
-                    makeindex_command + " 2>&1" , \
-                    shell=True, \
-                    cwd=os.getcwd(), \
-                    env=os.environ, \
-                    stdout=subprocess.PIPE, \
-                    stdin=open(os.devnull)
-                )
-            parser = CompilerOutputPrinter(makeindexprocess.stdout)
-            fatal, error, warning = parser.parseStream()
-            while True:
-                time.sleep(1)
-                exitcode = makeindexprocess.poll()
-                if exitcode is not None:
+        """ Run the makeindex commands (separated by ';' in makeindexbin)
+            on the texfile. Afterwards, self._indchanged tells whether any
+            of their output files was changed.
+        """
+        self._indchanged = False
+        success = True
+        for command in self.options['makeindexbin'].split(';'):
+            if command.strip() == '':
+                continue
+            if not self._run_makeindex_command(command):
+                success = False
+                if self._executor.cancelled:
                     break
-                print "Waiting for makeindex to finish"
-            if exitcode != 0:
-                Out.write("'%s' returned with error (exit code %s).\n" \
-                     % (makeindex_command, exitcode), VERB_WARN)
-                return False #Failure
-            return True
-        except OSError, data:
+        return success
+
+    def _run_makeindex_command(self, command):
+        """ Run one makeindex command. If it calls one of the
+            MAKEINDEXPROGRAMS, the output file is restored from the cache
+            instead if the input file and style are known already, and the
+            command is skipped if the input file does not exist.
+        """
+        starttime = time.time()
+        argv = split_command(command, self._outputfile(''))
+        makeindex_command = command.strip().replace('%', self._outputfile(''))
+        key = None
+        outputfile = None
+        if os.path.basename(argv[0]) in MAKEINDEXPROGRAMS:
+            inputfile, outputfile, stylefile = _makeindex_files(argv)
+            inputdigest = digest(inputfile)
+            if inputdigest is None:
+                Out.write("There is no %s, skipping '%s'\n", VERB_DEBUG,
+                          args=(inputfile, makeindex_command))
+                return True
+            styledigest = None
+            if stylefile is not None:
+                styledigest = self._input_digest(stylefile)
+            if stylefile is None or styledigest is not None:
+                key = hashlib.sha1(repr((argv, inputdigest,
+                                         styledigest))).hexdigest()
+            oldoutput = _read_file(outputfile)
+            output = self._memo_lookup('makeindex', key)
+            if output is not None:
+                Out.write("Using the cached %s for the current %s\n" \
+                          % (outputfile, inputfile))
+                if output != oldoutput:
+                    self._restore_auxfiles({outputfile : output})
+                    self._indchanged = True
+                self._memoize('makeindex', key, output)
+                self._metrics.record(self.filename, 'makeindex',
+                                     time.time() - starttime,
+                                     cached=True, command=argv[0])
+                Trace.instant('makeindex', 'stage',
+                              {'cached' : True, 'command' : argv[0]})
+                return True
+        Out.write("Running %s\n" % makeindex_command)
+        result = self._run('makeindex', argv, command=argv[0])
+        if result.cancelled:
+            return False # Failure
+        if result.error is not None:
             Out.write("makeindex failed to run:\n", VERB_WARN)
-            Out.write(data + "\n", VERB_WARN)
+            Out.write(result.error + "\n", VERB_WARN)
+            return False # Failure
+        if not result.succeeded():
+            Out.write("'%s' returned with error (exit code %s).\n" \
+                 % (makeindex_command, result.exitcode), VERB_WARN)
+            return False #Failure
+        if outputfile is None:
+            self._indchanged = True
+        else:
+            output = _read_file(outputfile)
+            if output != oldoutput:
+                self._indchanged = True
+            if output is not None:
+                self._memoize('makeindex', key, output)
+        return True
 
     def firstcompile(self):
-        """ Make the first complete compilation of the texfile """
+        """ Make the first complete compilation of the texfile, unless the
+            output of the last session is still up to date
+        """
+        Trace.begin('firstcompile', 'compile', {'document' : self.filename})
+        Profiler.begin()
+        try:
+            return self._firstcompile()
+        finally:
+            Profiler.end()
+            Trace.end('firstcompile', 'compile')
+
+    def _firstcompile(self):
+        """ Implementation of firstcompile """
+        if self._restore_state():
+            Out.write("%s.pdf is up to date, " % self._basename \
+                      + "skipping the initial compilation\n")
+            return self.create_previewfile()
         Out.write("Start Initial Compilation\n")
-        if os.path.isfile(self._basename + ".pdf"):
+        if os.path.isfile(self._outputfile(".pdf")):
             Out.write("There was an old pdf file %s. It will be deleted.\n" \
-                 % (self._basename + ".pdf"))
-            os.remove(self._basename + ".pdf")
+                 % (self._outputfile(".pdf")))
+            os.remove(self._outputfile(".pdf"))
         if self.options['smart']:
             for watchfile in self.watchfilelist():
-                elements = self._get_elements_from_file(watchfile)
-                self._references[watchfile] = elements['references']
-                self._labels[watchfile] = elements['labels']
-                self._citations[watchfile] = elements['citations']
-                self._indexitems[watchfile] = elements['index']
+                self._read_elements(watchfile)
+        self.save_state()
         return self.fullcompile()
 
     def fullcompile(self):
@@ -276,27 +853,34 @@ class Texfile:
             processed several times, the steps are:
             - compile (just pdflatex, or whatever is set as texcompiler)
             - bibtex (if bibtex attribute is set)
-            - recompile (like compile)
             - makeindex (if the makeindex attribute is set)
             - extracompiler (if set)
-            - recompile
+            - recompile until the aux files are stable
         """
         Out.write("Start Full Compilation.\n")
+        changes = self._start_compilation('full')
+        if self._fullcompile():
+            self._finish_compilation()
+            self._record_compilation(True)
+            return True # Success
+        self._abort_compilation(changes)
+        self._record_compilation(False)
+        return False # Failure
+
+    def _fullcompile(self):
+        """ Run all steps of fullcompile """
         if not self.run_latex():
             return False # Failure
         if self.options['bibtex']:
-            if not self.run_bibtex():
+            if not self.run_bibliography():
                 Out.write("bibtex failed.\n", VERB_WARN)
-            if not self.run_latex():
-                return False # Failure
         if self.options['makeindex']:
             if not self.run_makeindex():
                 Out.write("makeindex failed.\n", VERB_WARN)
-            self.run_latex()
         if not self.run_extracompiler():
             Out.write("'%s' failed.\n" % self.options['extracompiler'], \
                                                                       VERB_WARN)
-        if not self.run_latex():
+        if not self.converge():
             return False # Failure
         if self.options['dvi']:
             if not self.convert_dvi():
@@ -311,44 +895,428 @@ class Texfile:
 
             At a minimum, the texcompiler is run once. If an
             extracompiler is set, texompiler -> extracompiler
-            -> texcompiler is run at minimum.
+            -> texcompiler is run at minimum. Further runs of the
+            texcompiler only happen if the aux files have not settled.
 
             Bibtex and Makeindex are skipped if they are set to
             False in the options.
         """
         Out.write("Start Smart Compilation.\n")
+        changes = self._start_compilation('smart')
+        if self._smartcompile(changes):
+            self._finish_compilation()
+            self._record_compilation(True)
+            return True # Success
+        self._abort_compilation(changes)
+        self._record_compilation(False)
+        return False # Failure
+
+    def _smartcompile(self, changes):
+        """ Run all steps of smartcompile, for the given dict of changes """
         if not self.run_latex():
             return False # Failure
-        if self.changed['citations']:
+        need_rerun = not self._stable
+        if changes['citations'] or self._bibrequested:
             if self.options['bibtex']:
-                if not self.run_bibtex():
+                if not self.run_bibliography():
                     Out.write("bibtex failed.\n", VERB_WARN)
+                    need_rerun = True
+                elif self._bblchanged:
+                    need_rerun = True
             else:
                 Out.write("There were changes in the citations, but bibtex is "\
                      + "disabled. You should enable bibtex.\n", VERB_WARN)
-            if not self.run_latex():
-                return False # Failure
-        if self.changed['index']:
+        if changes['index']:
             if self.options['makeindex']:
                 if not self.run_makeindex():
                     Out.write("makeindex failed\n", VERB_WARN)
-                self.run_latex()
+                    need_rerun = True
+                elif self._indchanged:
+                    need_rerun = True
             else:
                 Out.write("There were changes in the index, but makeindex is "\
                      + "disabled. You should enable makeindex.\n", VERB_WARN)
         if not self.run_extracompiler():
             Out.write("'%s' failed.\n" % self.options['extracompiler'], \
                                                                       VERB_WARN)
-        if self.changed['citations'] or self.changed['labels'] \
-        or self.changed['references'] or self.changed['index'] \
-        or self.options['extracompiler'] != '':
-            if not self.run_latex():
+        if self.options['extracompiler'] != '':
+            need_rerun = True
+        if need_rerun:
+            if not self.converge():
+                return False # Failure
+        else:
+            Out.write("aux files are unchanged, no further run necessary.\n",
+                      VERB_DEBUG)
+        if self.options['dvi']:
+            if not self.convert_dvi():
+                return False # Failure
+        if not self.create_previewfile():
+            return False # Failure
+        return True # Success
+
+    def simplecompile(self):
+        """ Run the texcompiler only once, and create the preview file
+            ('stupid' mode)
+        """
+        Out.write("Recompiling in stupid mode\n")
+        changes = self._start_compilation('simple')
+        if not self.run_latex():
+            self._abort_compilation(changes)
+            if self._executor.cancelled or self.options['failfast']:
+                self._record_compilation(False)
                 return False # Failure
         if self.options['dvi']:
             self.convert_dvi()
-        self.create_previewfile()
+        success = self.create_previewfile()
+        self._record_compilation(success)
+        return success
+
+    def cancel(self):
+        """ Cancel a running compilation. This is meant to be called from
+            another thread than the one running the compilation.
+        """
+        Out.write("Sources of %s.tex changed, cancelling compilation\n" \
+                  % self._basename)
+        self._executor.cancel()
+
+    def _start_compilation(self, mode):
+        """ Prepare a new compilation in the given mode ('full', 'smart',
+            or 'simple'): return the current dict of changes and clear the
+            flags in self.changed
+        """
+        self._lock.acquire()
+        try:
+            changes = self.changed.copy()
+            for key in self.changed.keys():
+                self.changed[key] = False
+            self._startgeneration = self._generation
+            self._compilationchangetime = self._changetime
+            self._changetime = None
+        finally:
+            self._lock.release()
+        self._compilationmode = mode
+        self._compilationstart = time.time()
+        Trace.begin(mode + 'compile', 'compile', {'document' : self.filename})
+        Profiler.begin()
+        self._latexpass = 0
+        self._executor.reset()
+        return changes
+
+    def _record_compilation(self, success):
+        """ Record the compilation started by _start_compilation in the
+            metrics
+        """
+        endtime = time.time()
+        Profiler.end()
+        Trace.end(self._compilationmode + 'compile', 'compile',
+                  {'success' : success})
+        latency = None
+        if self._compilationchangetime is not None:
+            latency = endtime - self._compilationchangetime
+        self._metrics.record_compilation(self.filename,
+                                         self._compilationmode,
+                                         endtime - self._compilationstart,
+                                         success, latency)
+
+    def _finish_compilation(self):
+        """ Store the fingerprints of the output files after a successful
+            compilation, unless the sources have changed in the meantime
+        """
+        self._lock.acquire()
+        try:
+            if self._generation != self._startgeneration:
+                return
+            try:
+                pdffingerprint = fingerprint(self._outputfile('.pdf'))
+            except OSError:
+                return
+            files = self._read_auxfiles()
+            for extension in GENERATEDEXTENSIONS:
+                files[self._outputfile(extension)] = \
+                                       _read_file(self._outputfile(extension))
+            self._outputs = {'pdf' : pdffingerprint, 'files' : files}
+            self.save_state()
+        finally:
+            self._lock.release()
+
+    def _stored_state(self):
+        """ Return the state stored by the last session (see save_state),
+            or an empty dict if there is none or the cache is disabled
+        """
+        if not self.options['cache']:
+            return {}
+        if self._storedstate is None:
+            self._storedstate = self._cache.load(self._statename, {})
+        return self._storedstate
+
+    def _restore_state(self):
+        """ If the watchfiles and output files match the state stored by
+            the last session, take over that state and return True.
+            Otherwise, return False.
+        """
+        state = self._stored_state()
+        if state.get('outputs') is None:
+            return False
+        if state.get('options') != self._optionskey():
+            Out.write("The compile options have changed since the last " \
+                      + "session\n", VERB_DEBUG)
+            return False
+        storedfingerprints = state.get('fingerprints', {})
+        recorded = state.get('recorded', [])
+        for watchfile in recorded:
+            if os.path.isfile(watchfile):
+                self._add_dependency(watchfile, self._recorded)
+        for watchfile in self._fingerprints.keys():
+            if not storedfingerprints.has_key(watchfile) \
+            or storedfingerprints[watchfile][2] \
+                                          != self._fingerprints[watchfile][2]:
+                Out.write("%s has changed since the last session\n",
+                          VERB_DEBUG, args=(watchfile,))
+                return False
+        outputs = state['outputs']
+        try:
+            if fingerprint(self._outputfile('.pdf'), outputs['pdf'])[2] \
+            != outputs['pdf'][2]:
+                Out.write("The pdf file has changed since the last " \
+                          + "session\n", VERB_DEBUG)
+                return False
+        except OSError:
+            return False
+        missing = {}
+        for filename, content in outputs['files'].items():
+            if content is None:
+                continue
+            currentcontent = _read_file(filename)
+            if currentcontent is None:
+                missing[filename] = content
+            elif currentcontent != content:
+                Out.write("%s has changed since the last session\n",
+                          VERB_DEBUG, args=(filename,))
+                return False
+        # e.g. deleted by the cleanup at the end of the last session
+        self._restore_auxfiles(missing)
+        if self.options['smart']:
+            elements = state.get('elements', {})
+            for watchfile in self.watchfilelist():
+                try:
+                    self._references[watchfile] = \
+                                    elements['references'][watchfile]
+                    self._labels[watchfile] = elements['labels'][watchfile]
+                    self._citations[watchfile] = \
+                                    elements['citations'][watchfile]
+                    self._indexitems[watchfile] = elements['index'][watchfile]
+                except KeyError:
+                    self._read_elements(watchfile)
+        self._outputs = state['outputs']
+        self._stable = True
+        return True
+
+    def _optionskey(self):
+        """ Return the options that determine the output files """
+        return [self.options.get(key) for key in
+                ['texcompiler', 'compileroptions', 'dvi', 'dvipdf',
+                 'bibtex', 'bibtexbin', 'biberbin', 'makeindex',
+                 'makeindexbin',
+                 'extracompiler', 'precompile', 'recorder', 'outdir',
+                 'smart']]
+
+    def _abort_compilation(self, changes):
+        """ Put back the changes that a failed or cancelled compilation
+            has taken
+        """
+        self._lock.acquire()
+        try:
+            for key in changes.keys():
+                if changes[key]:
+                    self.changed[key] = True
+            # the change is still waiting for its preview
+            if self._compilationchangetime is not None \
+            and (self._changetime is None
+                 or self._compilationchangetime < self._changetime):
+                self._changetime = self._compilationchangetime
+        finally:
+            self._lock.release()
+        if self._executor.cancelled:
+            Out.write("Compilation of %s.tex was cancelled.\n" \
+                      % self._basename)
+
+    def converge(self):
+        """ Run the texcompiler until a run leaves the aux files unchanged
+            and the compiler does not ask for a rerun, but at most
+            'maxpasses' times. Return False if a run fails.
+        """
+        for passnumber in range(self.options['maxpasses']):
+            if not self.run_latex():
+                return False # Failure
+            if self._stable:
+                return True # Success
+        Out.write("The aux files of %s.tex are still changing after %i runs.\n"\
+                  % (self._basename, self.options['maxpasses']), VERB_WARN)
         return True # Success
 
+    def _outputfile(self, extension):
+        """ Return the name of the file with the given extension that the
+            compilers write for the texfile
+        """
+        outdir = self._outputdirectory()
+        if outdir == '':
+            return self._basename + extension
+        return os.path.join(outdir, os.path.basename(self._basename)
+                                    + extension)
+
+    def _outputdirectory(self):
+        """ Return the absolute path of the output directory, or '' if
+            the compilers write into the directory of the texfile
+        """
+        if self._outdir is None:
+            outdir = self.options['outdir']
+            if outdir is None or outdir.strip() == '':
+                self._outdir = ''
+            elif outdir.strip() == TMPFSOUTDIR:
+                self._outdir = self._tmpfs_outputdirectory()
+                self._outdircreated = True
+            else:
+                self._outdir = os.path.abspath(outdir.strip().replace('%',
+                                           os.path.basename(self._basename)))
+        return self._outdir
+
+    def _tmpfs_outputdirectory(self):
+        """ Create and return the output directory for TMPFSOUTDIR
+
+            The directory is the same in every session, but a different one
+            for every texfile and user. As TMPFSDIR is writable for
+            everyone, an existing directory is only used if it is a real
+            directory (not a symlink) that belongs to the current user, and
+            that nobody else has access to. Otherwise, a new directory with
+            a random name is created.
+        """
+        tmpfsdir = TMPFSDIR
+        if not os.path.isdir(tmpfsdir):
+            tmpfsdir = tempfile.gettempdir()
+        name = "texpreview-%s-%s" \
+               % (os.path.basename(self._basename),
+                  hashlib.sha1("%s:%s" % (os.path.abspath(self._basename),
+                                          getattr(os, 'getuid', lambda: '')())
+                              ).hexdigest()[:12])
+        directory = os.path.join(tmpfsdir, name)
+        try:
+            os.mkdir(directory, 0700)
+        except OSError:
+            pass # it exists already, check it below
+        if _is_private_directory(directory):
+            return directory
+        Out.write("%s is not a private directory of the current user, "
+                  "using a new output directory\n", VERB_WARN,
+                  args=(directory,))
+        return tempfile.mkdtemp(prefix=name + '-', dir=tmpfsdir)
+
+    def _outputdirectory_removable(self):
+        """ Return True if the output directory was created by texpreview
+            (it contains OUTDIRMARKER), and neither the current directory
+            nor any watchfile is inside it
+        """
+        outdir = self._outputdirectory()
+        if outdir == '' or not os.path.isfile(os.path.join(outdir,
+                                                           OUTDIRMARKER)):
+            return False
+        for path in [os.getcwd()] + self.watchfilelist():
+            path = os.path.abspath(path)
+            if path == outdir or path.startswith(os.path.join(outdir, '')):
+                return False
+        return True
+
+    def _prepare_outputdirectory(self):
+        """ Create the output directory with the subdirectories of all
+            watchfiles, and let the compilers write there
+        """
+        outdir = self._outputdirectory()
+        if outdir == '':
+            return
+        if not os.path.isdir(outdir):
+            self._outdircreated = True
+        directories = [outdir]
+        for watchfile in self._fingerprints.keys():
+            directory = os.path.dirname(os.path.normpath(watchfile))
+            if directory != '' and not os.path.isabs(directory) \
+            and not directory.startswith(os.pardir):
+                directories.append(os.path.join(outdir, directory))
+        for directory in directories:
+            if not os.path.isdir(directory):
+                try:
+                    os.makedirs(directory, 0700)
+                except OSError, data:
+                    Out.write("Could not create %s: %s\n" \
+                              % (directory, data), VERB_WARN)
+        marker = os.path.join(outdir, OUTDIRMARKER)
+        if self._outdircreated and not os.path.isfile(marker):
+            try:
+                markerfile = open(marker, 'w')
+                markerfile.write("%s\n" % os.path.abspath(self.filename))
+                markerfile.close()
+            except IOError, data:
+                Out.write("Could not create %s: %s\n" % (marker, data),
+                          VERB_WARN)
+        if self._executor.env is None:
+            self._executor.env = os.environ.copy()
+            self._executor.env['TEXMFOUTPUT'] = outdir
+
+    def _read_auxfiles(self):
+        """ Return a dict of the names of all the aux files that the
+            texcompiler reads back in the next run to their content (None
+            for files that don't exist)
+        """
+        result = {}
+        auxfilenames = [self._outputfile(extension)
+                        for extension in AUXEXTENSIONS]
+        while len(auxfilenames) > 0:
+            auxfilename = auxfilenames.pop(0)
+            result[auxfilename] = _read_file(auxfilename)
+            if result[auxfilename] is None:
+                continue
+            if auxfilename == self._outputfile('.aux'):
+                for inputmatch in \
+                            AUXINPUTPATTERN.finditer(result[auxfilename]):
+                    auxfilenames.append(os.path.join(
+                                        os.path.dirname(self._outputfile('')),
+                                        inputmatch.group('filename')))
+        return result
+
+    def _restore_auxfiles(self, auxfiles):
+        """ Restore the aux files to the content returned by an earlier
+            call of _read_auxfiles()
+        """
+        for auxfilename, content in auxfiles.items():
+            try:
+                if content is None:
+                    if os.path.isfile(auxfilename):
+                        os.remove(auxfilename)
+                else:
+                    auxfile = open(auxfilename, 'wb')
+                    auxfile.write(content)
+                    auxfile.close()
+            except (IOError, OSError), data:
+                Out.write("Could not restore %s: %s\n" % (auxfilename, data),
+                          VERB_WARN)
+
+    def _rerun_requested(self, result):
+        """ Return True if the output of the tex compiler, given as an
+            ExecutionResult, asks for a rerun
+        """
+        for diagnostic in result.diagnostics:
+            if diagnostic.severity == WARNING \
+            and RERUNPATTERN.search(diagnostic.message):
+                return True
+        return False
+
+    def _bibliography_requested(self, result):
+        """ Return True if the output of the tex compiler, given as an
+            ExecutionResult, asks for a run of bibtex or biber
+        """
+        for diagnostic in result.diagnostics:
+            if diagnostic.severity == WARNING \
+            and BIBRERUNPATTERN.search(diagnostic.message):
+                return True
+        return False
 
     def run_extracompiler(self):
         """ Run the compiler set in the extracompiler attribute """
@@ -359,34 +1327,21 @@ class Texfile:
             self.options['extracompiler'] = ''
         extracompiler = self.options['extracompiler']
         if extracompiler != '':
-            extracompiler = extracompiler.replace("%", self._basename)
-            try:
-                Out.write("Running extracompiler '%s'\n" % extracompiler)
-                extracompilerprocess = subprocess.Popen( \
-                        extracompiler + " 2>&1" , \
-                        shell=True, \
-                        cwd=os.getcwd(), \
-                        env=os.environ, \
-                        stdout=subprocess.PIPE, \
-                        stdin=open(os.devnull)
-                    )
-                parser = \
-                    CompilerOutputPrinter(extracompilerprocess.stdout)
-                fatal, error, warning = parser.parseStream()
-                while True:
-                    time.sleep(1)
-                    exitcode = extracompilerprocess.poll()
-                    if exitcode is not None:
-                        break
-                    print "Waiting for '%s' to finish" % extracompiler
-                if exitcode != 0:
-                    Out.write("'%s' returned with error (exit code %s).\n" \
-                         % (extracompiler, exitcode), VERB_WARN)
-                    return False #Failure
-                return True
-            except OSError, data:
+            extracompiler = extracompiler.replace("%", self._outputfile(''))
+            Out.write("Running extracompiler '%s'\n" % extracompiler)
+            result = self._run('extracompiler',
+                split_command(self.options['extracompiler'],
+                              self._outputfile('')))
+            if result.cancelled:
+                return False # Failure
+            if result.error is not None:
                 Out.write("'%s' failed to run:\n" % extracompiler, VERB_WARN)
-                Out.write(data + "\n", VERB_WARN)
+                Out.write(result.error + "\n", VERB_WARN)
+                return False # Failure
+            if not result.succeeded():
+                Out.write("'%s' returned with error (exit code %s).\n" \
+                     % (extracompiler, result.exitcode), VERB_WARN)
+                return False #Failure
         return True
 
     def run_latex(self):
@@ -394,41 +1349,144 @@ class Texfile:
             texcompiler). If dvi is set, it is assumed that the compiler
             produced a dvi file, which is then converted to pdf via
             'dvipdf'.
+
+            After a successful run, self._stable is True if the run did
+            not change any of the aux files and the compiler output does
+            not ask for a rerun.
         """
+        argv = [self.options['texcompiler']] \
+               + split_command(self.options['compileroptions'])
+        if self.options['recorder']:
+            argv.append('-recorder')
+        if self.options['failfast']:
+            argv.append('-halt-on-error')
+        if self._outputdirectory() != '':
+            argv.append('-output-directory=' + self._outputdirectory())
+        if self.options['precompile']:
+            formatname = self._precompile_preamble()
+            if formatname is not None:
+                argv.append('-fmt=' + formatname)
+        argv.append(self._basename)
         Out.write("Running %s %s on %s\n" % (self.options['texcompiler'],
                                        self.options['compileroptions'],
                                        self._basename + ".tex"))
-        try:
-            latexprocess = subprocess.Popen( \
-                    self.options['texcompiler'] + " " \
-                     + self.options['compileroptions'] + " " \
-                     + self._basename + " 2>&1", \
-                    shell=True, \
-                    cwd=os.getcwd(), \
-                    env=os.environ, \
-                    stdout=subprocess.PIPE, \
-                    stdin=open(os.devnull)
-                )
-            parser = CompilerOutputPrinter(latexprocess.stdout)
-            fatal, error, warning = parser.parseStream()
-            while True:
-                time.sleep(1)
-                exitcode = latexprocess.poll()
-                if exitcode is not None:
-                    break
-                print "Waiting for %s to finish" \
-                       % self.options['texcompiler']
-            if exitcode != 0:
-                Out.write(self._basename + \
-                     ".tex failed to compile (exit code %s).\n" \
-                     % exitcode, VERB_WARN)
-                return False #Failure
-        except OSError, data:
+        self._stable = False
+        self._bibrequested = False
+        self._prepare_outputdirectory()
+        auxfiles = self._read_auxfiles()
+        self._unshare_pdf()
+        callback = None
+        if self.options['failfast']:
+            callback = self._stop_at_error
+        self._latexpass += 1
+        result = self._run('latex', argv, callback=callback,
+                           passnumber=self._latexpass)
+        failed = result.cancelled or result.terminated \
+                 or result.error is not None or not result.succeeded()
+        if failed and (result.cancelled or self.options['failfast']):
+            # drop the partial output of the interrupted or failed run
+            # (with -halt-on-error, the compiler often stops by itself)
+            self._restore_auxfiles(auxfiles)
+            pdffile = self._outputfile('.pdf')
+            if os.path.isfile(pdffile):
+                os.remove(pdffile)
+        self._restore_unshared_pdf()
+        if result.cancelled:
+            return False # Failure
+        if result.error is not None:
             Out.write(self._basename + ".tex failed to compile:\n", VERB_WARN)
-            Out.write(data + "\n", VERB_WARN)
+            Out.write(result.error + "\n", VERB_WARN)
             return False # Failure
+        if failed and self.options['failfast']:
+            Out.write(self._basename + ".tex failed to compile, " \
+                      + "stopped at the first error.\n", VERB_WARN)
+            return False # Failure
+        if not result.succeeded():
+            Out.write(self._basename + \
+                 ".tex failed to compile (exit code %s).\n" \
+                 % result.exitcode, VERB_WARN)
+            return False #Failure
+        if self.options['recorder']:
+            self._lock.acquire()
+            try:
+                self.update_recorded()
+            finally:
+                self._lock.release()
+        self._bibrequested = self._bibliography_requested(result)
+        if self._read_auxfiles() != auxfiles:
+            Out.write("The aux files have changed.\n", VERB_DEBUG)
+        elif self._rerun_requested(result):
+            Out.write("The compiler asks for a rerun.\n", VERB_DEBUG)
+        else:
+            self._stable = True
         return True # Success
 
+    def _stop_at_error(self, diagnostic):
+        """ Terminate the tex compiler if diagnostic is an error (callback
+            for the Executor in 'failfast' mode)
+        """
+        if diagnostic.severity == ERROR:
+            self._executor.terminate()
+
+    def _precompile_preamble(self):
+        """ Return the name (without extension) of a format file that
+            contains the precompiled preamble of the texfile. The format is
+            built if it does not exist yet or the preamble has changed.
+            Return None if there is no usable format, or the cache is
+            disabled.
+        """
+        if not self.options['cache']:
+            Out.write("The preamble is not precompiled without the cache\n",
+                      VERB_DEBUG)
+            return None
+        try:
+            texfile = open(self._basename + '.tex')
+            preamble = split_preamble(texfile.read())
+            texfile.close()
+        except IOError:
+            return None
+        if preamble is None:
+            return None
+        texcompiler = self.options['texcompiler']
+        formatname = os.path.abspath(self._cache.path(
+                            os.path.basename(self._basename) + '-preamble'))
+        argv = [texcompiler, '-ini',
+                '-jobname=' + os.path.basename(formatname),
+                '-output-directory=' + os.path.dirname(formatname)] \
+               + split_command(self.options['compileroptions']) \
+               + ['&' + os.path.basename(texcompiler), 'mylatexformat.ltx',
+                  self._basename + '.tex']
+        dependencies = preamble_dependencies(preamble)
+        key = preamble_key(preamble, dependencies, argv)
+        if self._formatkey is None:
+            self._formatkey = self._cache.load(
+                            os.path.basename(self._basename) + '.format')
+        if key == self._formatkey and os.path.isfile(formatname + '.fmt'):
+            return formatname
+        if key == self._failedformatkey:
+            return None # don't try again until the preamble changes
+        Out.write("Precompiling the preamble of %s.tex\n" % self._basename)
+        try:
+            if not os.path.isdir(os.path.dirname(formatname)):
+                os.makedirs(os.path.dirname(formatname))
+        except OSError, data:
+            Out.write("Could not create %s: %s\n" \
+                      % (os.path.dirname(formatname), data), VERB_WARN)
+            return None
+        result = self._run('precompile', argv)
+        if result.cancelled:
+            return None
+        if result.error is not None or not result.succeeded() \
+        or not os.path.isfile(formatname + '.fmt'):
+            Out.write("Could not precompile the preamble of %s.tex, " \
+                      % self._basename + "compiling it normally.\n",
+                      VERB_WARN)
+            self._failedformatkey = key
+            return None
+        self._formatkey = key
+        self._cache.save(os.path.basename(self._basename) + '.format', key)
+        return formatname
+
     def launch_viewer(self):
         """ Launch the pdf viewer for the preview pdf
         """
@@ -446,129 +1504,249 @@ class Texfile:
         if not self.options['no_cleanup']:
             Out.write("Deleting temporary files for %s" \
                       % self._basename + '.tex\n')
+            outdir = self._outputdirectory()
+            if self._outputdirectory_removable():
+                Out.write("    Deleting %s\n" % outdir, VERB_DEBUG)
+                shutil.rmtree(outdir, ignore_errors=True)
+                previewpdf = self._basename + ".preview.pdf"
+                if os.path.isfile(previewpdf):
+                    os.remove(previewpdf)
+                return
             files_to_delete = []
             for element in self.options['cleanup']:
-                element = element.replace('%', self._basename)
+                # '%' stands for the files in the output directory
+                element = element.replace('%', self._outputfile(''))
                 files_to_delete += glob(element)
+            if outdir != '':
+                files_to_delete.append(self._basename + ".preview.pdf")
             for filename in files_to_delete:
                 if os.path.isfile(filename):
                     try:
-                        Out.write("    Deleting %s" % filename, VERB_DEBUG)
+                        Out.write("    Deleting %s", VERB_DEBUG,
+                                  args=(filename,))
                         os.remove(filename)
                     except OSError, data:
                         Out.write(data + "\n", VERB_WARN)
 
-    def has_changed(self):
+    def has_changed(self, candidates=None):
         """ Check if the texfile or any of the watchfiles have
             changed
+
+            If candidates is given, only the watchfiles that are in
+            candidates (e.g. the files reported by a watcher) are checked.
+
+            All watchfiles that changed since the last call set the
+            corresponding flags in self.changed
         """
+        starttime = time.time()
+        Trace.begin('has_changed', 'loop', {'document' : self.filename})
+        self._lock.acquire()
+        try:
+            changed = self._check_watchfiles(candidates)
+        finally:
+            self._lock.release()
+        Trace.end('has_changed', 'loop', {'changed' : changed})
+        self._metrics.record(self.filename, 'changes',
+                             time.time() - starttime, changed=changed)
+        return changed
+
+    def _check_watchfiles(self, candidates):
+        """ Implementation of has_changed """
         changed = False
-        for watchfile in self._watchfiletimes.keys():
+        elementtime = 0.0 # time spent reading the elements of watchfiles
+        elementfiles = 0
+        if candidates is None:
+            watchfiles = self._fingerprints.keys()
+        else:
+            watchfiles = [watchfile for watchfile in candidates
+                          if self._fingerprints.has_key(watchfile)]
+        for watchfile in watchfiles:
             trials = 0
             # check if file has been renewed: some editors delete the file
             # temporarily while it is being saved, so we make up to 10 trials
-            # to get the current modification time.
+            # to get the current fingerprint.
+            oldfingerprint = self._fingerprints[watchfile]
             while True:
                 trials += 1
                 try:
-                    newer = ( self._watchfiletimes[watchfile] < \
-                            os.path.getmtime(watchfile) )
+                    newfingerprint = fingerprint(watchfile, oldfingerprint)
                     break
                 except OSError, data:
                     Out.write(str(data) + "\n", VERB_WARN)
                     time.sleep(1)
                     if trials > 10:
                         raise
+            self._fingerprints[watchfile] = newfingerprint
+            newer = (newfingerprint[2] != oldfingerprint[2])
+            touched = (newfingerprint[:2] != tuple(oldfingerprint[:2]))
+            if touched and not newer:
+                Out.write("%s was touched, but its content is unchanged.\n",
+                          VERB_DEBUG, args=(watchfile,))
             if newer:
                 changed = True
                 Out.write("%s has changed.\n" % watchfile)
+                if self._graph is not None:
+                    self._graph.update(watchfile)
                 if self.options['smart']:
+                    starttime = time.time()
                     elements = self._get_elements_from_file(watchfile)
+                    elementtime += time.time() - starttime
+                    elementfiles += 1
                     # references
                     if self._references[watchfile] != elements['references']:
                         Out.write("Changed references in %s\n" % watchfile)
                         self.changed['references'] = True
                         self._references[watchfile] = elements['references']
-                    else:
-                        self.changed['references'] = False
                     # labels
                     if self._labels[watchfile] != elements['labels']:
                         Out.write("Changed labels in %s\n" % watchfile)
                         self.changed['labels'] = True
                         self._labels[watchfile] = elements['labels']
-                    else:
-                        self.changed['labels'] = False
                     # citations
-                    if self._citations[watchfile] != elements['citations']:
-                        Out.write("Changed citations in %s\n" % watchfile)
-                        self.changed['citations'] = True
-                        self._citations[watchfile] = elements['citations']
-                    else:
-                        self.changed['citations'] = False
+                    bibfile = False
                     for extension in BIBEXTENSIONS:
                         if (watchfile.lower()).endswith(extension):
                             Out.write("Bibliography file %s has changed\n" \
                                       % watchfile)
-                            self.changed['citations'] = False
+                            bibfile = True
+                            # bibtex decides from the digest of the file
+                            # whether it has to run
+                            self.changed['citations'] = True
+                    if self._citations[watchfile] != elements['citations']:
+                        self._citations[watchfile] = elements['citations']
+                        if not bibfile:
+                            Out.write("Changed citations in %s\n" % watchfile)
+                            self.changed['citations'] = True
                     # index
                     if self._indexitems[watchfile] != elements['index']:
                         Out.write("Changed index in %s\n" % watchfile)
                         self.changed['index'] = True
                         self._indexitems[watchfile] = elements['index']
-                    else:
-                        self.changed['index'] = False
-            self._watchfiletimes[watchfile] = os.path.getmtime(watchfile)
+        # the dependencies may also have been changed through another
+        # Texfile that shares the graph
+        self.update_autowatch()
+        if elementfiles > 0:
+            self._metrics.record(self.filename, 'elements', elementtime,
+                                 files=elementfiles)
+        if changed:
+            self._generation += 1
+            self._outputs = None
+            if self._changetime is None:
+                self._changetime = time.time()
+            self.save_state()
         return changed
 
+    def save_state(self):
+        """ Save the state of the texfile (fingerprints, elements, recorded
+            files, and the fingerprints of up-to-date output files) to the
+            cache, unless the cache is disabled
+        """
+        if self.options['cache']:
+            self._lock.acquire()
+            try:
+                state = {'fingerprints' : self._fingerprints,
+                         'elements'     : {'references' : self._references,
+                                           'labels'     : self._labels,
+                                           'citations'  : self._citations,
+                                           'index'      : self._indexitems},
+                         'recorded'     : self._recorded,
+                         'outputs'      : self._outputs,
+                         'options'      : self._optionskey()}
+                self._cache.save(self._statename, state)
+            finally:
+                self._lock.release()
+
     def convert_dvi(self):
         """ Convert file.dvi to file.pdf """
         # TODO: check if dvi file actually exists
-        dvipdf_command = \
-                     self.options['dvipdf'].replace('%', self._basename)
+        if self._outputdirectory() == '':
+            basename = self._basename
+            cwd = None
+        else:
+            # run in the output directory, so that the pdf is written there
+            basename = os.path.basename(self._basename)
+            cwd = self._outputdirectory()
+        dvipdf_command = self.options['dvipdf'].replace('%', basename)
         Out.write("Running '%s' to convert %s to %s\n" \
                                             % (dvipdf_command, \
-                                               self._basename + ".dvi", \
-                                               self._basename + ".pdf"))
-        try:
-            if subprocess.call( \
-                dvipdf_command + " 2>&1", \
-                cwd=os.getcwd(), \
-                env=os.environ, \
-                shell=True, \
-            ) != 0:
-                Out.write("Failed to convert " + self._basename \
-                          + ".dvi to pdf.\n", VERB_WARN)
-                self.cleanup()
-                Out.write("Is '%s' available?\n" % dvipdf_command, VERB_ERR)
-        except OSError, data:
+                                               self._outputfile(".dvi"), \
+                                               self._outputfile(".pdf")))
+        self._unshare_pdf()
+        result = self._run('dvipdf',
+                      split_command(self.options['dvipdf'], basename), cwd)
+        self._restore_unshared_pdf()
+        if result.cancelled:
+            return False # Failure
+        if result.error is not None:
             Out.write("'%s' failed:\n" % dvipdf_command, VERB_WARN)
-            Out.write(data + "\n", VERB_WARN)
+            Out.write(result.error + "\n", VERB_WARN)
             return False
+        if not result.succeeded():
+            Out.write("Failed to convert " + self._outputfile('') \
+                      + ".dvi to pdf.\n", VERB_WARN)
+            self.cleanup()
+            Out.write("Is '%s' available?\n" % dvipdf_command, VERB_ERR)
         return True
 
 
     def create_previewfile(self):
-        """ Copy the file.pdf resulting from a compilation to
-            file.preview.pdf
+        """ Publish the file.pdf resulting from a compilation as
+            file.preview.pdf (see Publisher.publish). Nothing happens if the
+            preview already has the same content. Return False if there is
+            no pdf or it can't be published.
         """
-        compiledpdf = self._basename + ".pdf"
+        starttime = time.time()
+        compiledpdf = self._outputfile(".pdf")
         previewpdf = self._basename + ".preview.pdf"
         if not os.path.isfile(compiledpdf):
             Out.write("pdf file %s does not exist.\n" % compiledpdf, VERB_ERR)
             if self.options['texcompiler'] != 'pdflatex':
                 self.cleanup()
                 Out.write("Did you forget to select --dvi?\n", VERB_ERR)
-            sys.exit(2)
+            return False # Failure
         try:
-            Out.write("Copying %s to %s\n" % (compiledpdf, previewpdf))
-            shutil.copy(compiledpdf, previewpdf)
-        except IOError, data:
-            Out.write(data + "\n", VERB_WARN)
+            method = publish(compiledpdf, previewpdf)
+        except (IOError, OSError), data:
+            Out.write(str(data) + "\n", VERB_WARN)
             Out.write("Could not copy %s to %s.\n" \
                       % (compiledpdf, previewpdf), VERB_WARN)
             return False
+        if method is None:
+            Out.write("%s is unchanged\n" % previewpdf)
+        else:
+            Out.write("Copying %s to %s (%s)\n" \
+                      % (compiledpdf, previewpdf, method))
+        self._metrics.record(self.filename, 'preview',
+                             time.time() - starttime, method=method)
         return True # Success
 
+    def _unshare_pdf(self):
+        """ If the pdf file is hardlinked to the preview, move it aside, so
+            that the compiler writes a new file instead of overwriting the
+            preview in place. After the run, _restore_unshared_pdf must be
+            called.
+        """
+        pdffile = self._outputfile('.pdf')
+        if is_shared(pdffile):
+            Out.write("Unlinking %s from the preview\n", VERB_DEBUG,
+                      args=(pdffile,))
+            os.rename(pdffile, pdffile + UNSHAREDSUFFIX)
+
+    def _restore_unshared_pdf(self):
+        """ After a run that followed _unshare_pdf, put the old pdf file
+            back if the run didn't write a new one (e.g. after an error),
+            and drop it otherwise
+        """
+        pdffile = self._outputfile('.pdf')
+        if not os.path.isfile(pdffile + UNSHAREDSUFFIX):
+            return
+        if os.path.isfile(pdffile):
+            os.remove(pdffile + UNSHAREDSUFFIX)
+        else:
+            Out.write("No new %s, keeping the old one\n", VERB_DEBUG,
+                      args=(pdffile,))
+            os.rename(pdffile + UNSHAREDSUFFIX, pdffile)
+
 
     def add_watchfile(self, watchfile_wc):
         """ Add a watchfile, wildcard expression, or shell backquote to the
@@ -596,11 +1774,12 @@ class Texfile:
         for watchfile in watchfilelist:
             try:
                 if os.path.isfile(watchfile):
-                    for existing_file in self._watchfiletimes.keys():
+                    for existing_file in self._fingerprints.keys():
                         if os.path.samefile(existing_file, watchfile):
                             raise WatchFileExistsException(watchfile)
-                    self._watchfiletimes[watchfile] = \
-                                                    os.path.getmtime(watchfile)
+                    self._fingerprints[watchfile] = fingerprint(watchfile,
+                        self._stored_state().get('fingerprints',
+                                                 {}).get(watchfile))
                 else:
                     Out.write("The file %s that you want " % watchfile \
                               + "to watch does not exist.\n", VERB_ERR)
@@ -609,34 +1788,104 @@ class Texfile:
                 Out.write("The file %s is already being watched" \
                           % data, VERB_DEBUG)
 
+    def remove_watchfile(self, watchfile):
+        """ Remove watchfile from the list of watchfiles """
+        for dictionary in [self._fingerprints, self._references,
+                           self._labels, self._citations, self._indexitems]:
+            if dictionary.has_key(watchfile):
+                del dictionary[watchfile]
+
     def clear_watchfilelist(self):
         """ Delete all watchfiles, except the texfile itself """
-        self._watchfiletimes = {}
+        self._fingerprints = {}
+        self._autowatched = []
+        self._recorded = []
         self.add_watchfile(self._basename + '.tex')
 
     def watchfilelist(self):
         """ Return the list of watchfiles """
-        return self._watchfiletimes.keys()
+        return self._fingerprints.keys()
 
 
-def extract_element(fullstring, position):
-    """ Extract the contents of the first {...} block found after
-        position in fullstring """
-    Out.write("Extracting element from fullstring at position %s\n" \
-              % position, VERB_DEBUG)
+def _kpsewhich(filename):
+    """ Return the path of filename in the tex system as found by
+        kpsewhich, or None if it is not found
+    """
+    try:
+        devnull = open(os.devnull, 'w')
+        try:
+            process = subprocess.Popen(['kpsewhich', filename],
+                                       stdout=subprocess.PIPE, stderr=devnull)
+            output = process.communicate()[0]
+        finally:
+            devnull.close()
+    except OSError:
+        return None
+    path = output.strip()
+    if process.returncode != 0 or path == '' or not os.path.isfile(path):
+        return None
+    return path
+
+
+def _is_private_directory(directory):
+    """ Return True if directory is a directory (not a symlink) that
+        belongs to the current user, and that nobody else has access to
+    """
+    try:
+        status = os.lstat(directory)
+    except OSError:
+        return False
+    if not stat.S_ISDIR(status.st_mode):
+        return False
+    if hasattr(os, 'getuid'):
+        return status.st_uid == os.getuid() \
+               and stat.S_IMODE(status.st_mode) & 077 == 0
+    return True
+
+
+def _read_file(filename):
+    """ Return the content of filename, or None if it can't be read """
     try:
-        startposition = fullstring.index("{", position) + 1
-        endposition = startposition
-        open_brackets = 1
-        while open_brackets > 0:
-            endposition += 1
-            if fullstring[endposition] == '{':
-                open_brackets += 1
-            elif fullstring[endposition] == '}':
-                open_brackets -= 1
-        return fullstring[startposition:endposition]
-    except (ValueError, IndexError):
-        Out.write("Internal Error extracting element: " \
-             + "string has invalid brackets.\n", VERB_WARN)
-    return None
+        afile = open(filename, 'rb')
+        try:
+            return afile.read()
+        finally:
+            afile.close()
+    except IOError:
+        return None
+
 
+def _makeindex_files(argv):
+    """ Return a tuple (inputfile, outputfile, stylefile) of the files
+        named in the command line argv of one of the MAKEINDEXPROGRAMS.
+        stylefile is None if no style is given.
+    """
+    inputfile = None
+    outputfile = None
+    stylefile = None
+    arguments = iter(argv[1:])
+    for argument in arguments:
+        if argument in MAKEINDEXVALUEOPTIONS:
+            value = arguments.next()
+            if argument == '-o':
+                outputfile = value
+            elif argument == '-s':
+                stylefile = value
+        elif not argument.startswith('-'):
+            inputfile = argument
+    if inputfile is None:
+        inputfile = ''
+    if os.path.splitext(inputfile)[1] == '':
+        inputfile += '.idx'
+    if outputfile is None:
+        outputfile = os.path.splitext(inputfile)[0] + '.ind'
+    return inputfile, outputfile, stylefile
+
+
+def _relativepath(filename, directory):
+    """ Return the absolute path filename relative to directory, if it is
+        inside directory. Otherwise, return filename unchanged.
+    """
+    if filename.startswith(directory + os.sep):
+        return filename[len(directory) + 1:]
+    return filename
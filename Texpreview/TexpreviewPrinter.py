@@ -75,6 +75,16 @@
     Additionally, there is on more constant:
     DEFAULT_VERBOSITY = VERB_STATUS
 
+    Use set_verbosity() to change the verbosity of a stream, so that the
+    threshold that write() checks is updated as well.
+
+    Messages are formatted lazily: if write() is given the format arguments
+    with 'args', the message is only formatted if it is actually printed.
+    Output is buffered, and written to the handles when flush() is called,
+    when the buffer is full, or when an error (VERB_ERR) is printed. The
+    program calls flush() at the end of each compilation phase, and before
+    it waits for changes.
+
     An example usage:
 
     >>> import TexpreviewPrinter as Out
@@ -88,12 +98,23 @@
     >>> Out.activate_color(color=False)
     >>> Out.write("Hello World without color on STDOUT", stream='sub', level=Out.VERB_ERR)
     Hello World without color on STDOUT
-    >>> Out.streams['direct']['verbosity'] = Out.VERB_ERR
-    >>> Out.write("Hello World, below threshold, no output", level=Out.VERB_ERR)
+    >>> Out.write("Hello %s, formatted lazily", level=Out.VERB_WARN, args=('World',))
+    >>> Out.flush()
+    Hello World, formatted lazily
+    >>> Out.set_verbosity('direct', Out.VERB_ERR)
+    >>> Out.write("Hello %s, below threshold, never formatted", level=Out.VERB_WARN, args=())
+
+    When several texfiles are compiled in parallel threads, each thread can
+    capture its output with start_capture() and stop_capture(), so that it
+    can be printed in one piece with write_captured() afterwards, instead
+    of being interleaved with the output of the other threads.
 """
 
 
 import sys
+import atexit
+import threading
+from collections import deque
 
 def nocolored(text, color=None, on_color=None, attrs=None):
     return text
@@ -108,10 +129,6 @@ except ImportError:
     termcolored = nocolored
     _colors_available = False
 
-colored = nocolored # the 'colored' function should point to either 
-                    # 'nocolored' or 'termcolored', depending on
-                    # whether or not color is activated.
-
 # Verbosity constants
 VERB_SILENT = 0
 VERB_ERR    = 1
@@ -121,62 +138,182 @@ VERB_DEBUG  = 4
 
 DEFAULT_VERBOSITY = VERB_STATUS
 
+# Number of buffered characters after which the buffer is flushed
+BUFFERSIZE = 8192
+
+# Colors (color, attributes) of the levels in each stream
+_COLORS = {
+    'direct' : { VERB_ERR  : ('red', ['bold']),
+                 VERB_WARN : ('blue', ['bold']) },
+    'sub'    : { VERB_ERR  : ('red', None),
+                 VERB_WARN : ('blue', None) }
+          }
+
+
+def _styles(streamname, color):
+    """ Return the 'styles' dict for streamname, with the colors resolved
+        once, for color output or not. Levels without a color map to None
+        (the text is printed as it is).
+    """
+    styles = {}
+    for level in (VERB_SILENT, VERB_ERR, VERB_WARN, VERB_STATUS, VERB_DEBUG):
+        if color and _COLORS[streamname].has_key(level):
+            textcolor, attrs = _COLORS[streamname][level]
+            styles[level] = (lambda text, textcolor=textcolor, attrs=attrs:
+                             termcolored(text, textcolor, attrs=attrs))
+        else:
+            styles[level] = None
+    return styles
 
 
 streams = {
-    'direct' : { 
+    'direct' : {
         'verbosity'  : DEFAULT_VERBOSITY,
         'handle' : sys.stderr,
-        'styles' : { 
-            VERB_SILENT : lambda text: nocolored(text),
-            VERB_ERR    : lambda text: colored(text, 'red', attrs=['bold']),
-            VERB_WARN   : lambda text: colored(text, 'blue', attrs=['bold']),
-            VERB_STATUS : lambda text: nocolored(text),
-            VERB_DEBUG  : lambda text: nocolored(text)
-                    }
+        'styles' : _styles('direct', False)
                 },
-    'sub'    : { 
+    'sub'    : {
         'verbosity'  : VERB_STATUS,
         'handle' : sys.stdout,
-        'styles' : { 
-            VERB_SILENT : lambda text: nocolored(text),
-            VERB_ERR    : lambda text: colored(text, 'red'),
-            VERB_WARN   : lambda text: colored(text, 'blue'),
-            VERB_STATUS : lambda text: nocolored(text),
-            VERB_DEBUG  : lambda text: nocolored(text)
-                    }
+        'styles' : _styles('sub', False)
                }
           }
 
 default_stream = 'direct'
 
+# Verbosity of each stream, as checked by write()
+_thresholds = dict([(name, stream['verbosity'])
+                    for (name, stream) in streams.items()])
+
+class _Local(threading.local):
+    """ Per-thread state: the list of captured output, if any (a class
+        attribute as the default, so that the lookup never fails, which
+        would be slow)
+    """
+    captured = None
+
+_local = _Local()
+_outputlock = threading.Lock() # serializes the writing to the handles
+# Output (handle, text) that has not been written. Appending to and popping
+# from a deque are atomic, so write() doesn't need a lock.
+_buffer = deque()
+_buffered = 0              # approximate number of characters in _buffer
 
 
-def write(text, level=DEFAULT_VERBOSITY, stream=None):
-    """ If VERB_STATUS is below the verbosity threshold, print text to the 
-        handle associated with stream, with the formatting belonging to 
-        VERB_STATUS.
+
+def write(text, level=DEFAULT_VERBOSITY, stream=None, args=None):
+    """ If level is not above the verbosity threshold of stream, print text
+        to the handle associated with stream, with the formatting belonging
+        to level. If args is given, text is a format string that is
+        formatted with args first.
     """
+    global _buffered
     if stream is None:
         stream = default_stream
-    if stream not in streams.keys():
+    try:
+        if level > _thresholds[stream]:
+            return
+    except KeyError:
         raise KeyError("%s is not a registered name for a stream" % stream)
-    verbosity = streams[stream]['verbosity']
-    if level <= verbosity:
-        streams[stream]['handle'].write(streams[stream]['styles'][level](text))
+    if args is not None:
+        text = text % args
+    stream = streams[stream]
+    handle = stream['handle']
+    style = stream['styles'][level]
+    if style is not None:
+        text = style(text)
+    captured = _local.captured
+    if captured is None:
+        _buffer.append((handle, text))
+        # not atomic, but only decides when to flush
+        _buffered += len(text)
+        if _buffered > BUFFERSIZE or level <= VERB_ERR:
+            flush()
+    else:
+        captured.append((handle, text))
+
+def enabled(level, stream=None):
+    """ Return True if a message at level would be printed to stream """
+    if stream is None:
+        stream = default_stream
+    return (level <= _thresholds[stream])
+
+def set_verbosity(stream, verbosity):
+    """ Set the verbosity of stream """
+    streams[stream]['verbosity'] = verbosity
+    _thresholds[stream] = verbosity
+
+def flush():
+    """ Write all buffered output to the handles """
+    _outputlock.acquire()
+    try:
+        _write(_take_buffer())
+    finally:
+        _outputlock.release()
+
+def _take_buffer():
+    """ Remove the buffered output from the buffer and return it. Output
+        that other threads write in the meantime stays in the buffer for
+        the next flush. Must be called with _outputlock held.
+    """
+    global _buffered
+    _buffered = 0
+    popleft = _buffer.popleft
+    return [popleft() for i in xrange(len(_buffer))]
+
+def _write(output):
+    """ Write a list of (handle, text) tuples, and flush the handles.
+        Consecutive texts for the same handle are written in one piece.
+    """
+    handles = []
+    texts = []
+    for handle, text in output:
+        if handles and handle is not handles[-1]:
+            handles[-1].write(''.join(texts))
+            texts = []
+        if not handles or handle is not handles[-1]:
+            handles.append(handle)
+        texts.append(text)
+    if texts:
+        handles[-1].write(''.join(texts))
+    for handle in set(handles):
+        handle.flush()
+
+def start_capture():
+    """ Collect all output of the current thread, instead of writing it """
+    _local.captured = []
+
+def stop_capture():
+    """ Stop collecting output for the current thread, and return the list
+        of collected output, suitable for write_captured()
+    """
+    captured = getattr(_local, 'captured', None)
+    _local.captured = None
+    if captured is None:
+        captured = []
+    return captured
+
+def write_captured(captured):
+    """ Write output collected with start_capture()/stop_capture() in one
+        piece, after the buffered output
+    """
+    _outputlock.acquire()
+    try:
+        _write(_take_buffer() + captured)
+    finally:
+        _outputlock.release()
 
 def activate_color(color=True):
     """ Turn color output on (or off)
         Turning color on means that formatting takes effect. Colors are
         done with ANSI codes. If your terminal sucks, don't turn on colors.
     """
-    global colored
-    if color:
-        if _colors_available:
-            colored = termcolored
-        else:
-            sys.stderr.write("Module 'termcolor' is missing, color " \
-                            + "capabilities are not available")
-            colored = nocolored
-    else:
-        colored = nocolored
+    if color and not _colors_available:
+        sys.stderr.write("Module 'termcolor' is missing, color " \
+                        + "capabilities are not available")
+        color = False
+    for name in streams.keys():
+        streams[name]['styles'] = _styles(name, color)
+
+
+atexit.register(flush)
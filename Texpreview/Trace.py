@@ -0,0 +1,199 @@
+# -*- coding: utf-8 -*-
+############################################################################
+#    Copyright (C) 2008 by Michael Goerz                                   #
+#    http://www.physik.fu-berlin.de/~goerz                                 #
+#                                                                          #
+#    This program is free software; you can redistribute it and/or modify  #
+#    it under the terms of the GNU General Public License as published by  #
+#    the Free Software Foundation; either version 3 of the License, or     #
+#    (at your option) any later version.                                   #
+#                                                                          #
+#    This program is distributed in the hope that it will be useful,       #
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of        #
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the         #
+#    GNU General Public License for more details.                          #
+#                                                                          #
+#    You should have received a copy of the GNU General Public License     #
+#    along with this program; if not, write to the                         #
+#    Free Software Foundation, Inc.,                                       #
+#    59 Temple Place - Suite 330, Boston, MA  02111-1307, USA.             #
+############################################################################
+
+
+""" This module is the Trace singleton, which writes a timeline of what the
+    texpreview program is doing to a file in the Chrome trace event format.
+    The file can be opened (offline) in chrome://tracing or in the Perfetto
+    UI (ui.perfetto.dev).
+
+    A span of time is recorded with a pair of begin() and end() calls with
+    the same name, which must happen in the same thread. Spans of one
+    thread can be nested, and are shown as stacked bars in the row of that
+    thread. end() can add further arguments to the span (e.g. the exit code
+    of a program), which are shown together with the arguments of begin().
+    A point in time is recorded with instant().
+
+    The categories that are used are:
+    loop        The compile loop: checking the texfiles for changes,
+                starting and cancelling compilations
+    wait        Waiting for changes of the watchfiles
+    compile     The compile methods of a Texfile
+    stage       The stages of a compilation (see Metrics.py)
+    process     A run of an external program
+    parse       Reading and parsing the output of an external program
+
+    Tracing is off until start() is called, and all functions return
+    immediately in that case. The events are buffered, and written to the
+    file when flush() is called (which the program does before it waits
+    for changes), when the buffer is full, and at exit.
+
+    An example usage:
+
+    >>> import os, tempfile, Trace
+    >>> tracefilename = os.path.join(tempfile.mkdtemp(), 'trace.json')
+    >>> Trace.start(tracefilename)
+    True
+    >>> Trace.begin('pdflatex', 'process', {'argv' : ['pdflatex', 'a.tex']})
+    >>> Trace.end('pdflatex', 'process', {'exitcode' : 0})
+    >>> Trace.close()
+"""
+
+import os
+import time
+import json
+import atexit
+import threading
+
+# Number of buffered events after which the buffer is written to the file
+BUFFERSIZE = 256
+
+enabled = False
+
+_tracefile = None
+_buffer = []
+_threadnames = {} # ids of the threads that have been named in the trace
+_pid = os.getpid()
+_lock = threading.Lock()
+
+
+def start(filename):
+    """ Start writing the trace to filename (overwriting it). Return True
+        on success, False if the file can't be written.
+    """
+    global enabled, _tracefile
+    close()
+    try:
+        _tracefile = open(filename, 'w')
+        _tracefile.write("[\n")
+    except IOError:
+        _tracefile = None
+        return False
+    enabled = True
+    return True
+
+
+def begin(name, category, args=None):
+    """ Begin the span name (in category) in the current thread """
+    if enabled:
+        _add('B', name, category, args)
+
+
+def end(name, category, args=None):
+    """ End the span name (in category) in the current thread. args are
+        added to the arguments of the span.
+    """
+    if enabled:
+        _add('E', name, category, args)
+
+
+def instant(name, category, args=None):
+    """ Record the event name (in category) in the current thread """
+    if enabled:
+        _add('i', name, category, args, {'s' : 't'})
+
+
+def flush():
+    """ Write the buffered events to the file """
+    if not enabled:
+        return
+    _lock.acquire()
+    try:
+        _write()
+    finally:
+        _lock.release()
+
+
+def close():
+    """ Write the buffered events and finish the file. Tracing is off
+        afterwards.
+    """
+    global enabled, _tracefile
+    if not enabled:
+        return
+    _lock.acquire()
+    try:
+        enabled = False
+        _write()
+        try:
+            # the last event has no trailing comma, so that the file is
+            # valid JSON
+            _tracefile.write(json.dumps({'name' : 'process_name',
+                                         'ph'   : 'M',
+                                         'pid'  : _pid,
+                                         'args' : {'name' : 'texpreview.py'}})
+                             + "]\n")
+            _tracefile.close()
+        except IOError:
+            pass
+        _tracefile = None
+        _threadnames.clear()
+    finally:
+        _lock.release()
+
+
+def _add(phase, name, category, args, extra=None):
+    """ Add an event to the buffer """
+    timestamp = time.time() * 1000000.0 # microseconds
+    thread = threading.currentThread()
+    threadid = thread.ident
+    event = {'name' : name,
+             'cat'  : category,
+             'ph'   : phase,
+             'ts'   : timestamp,
+             'pid'  : _pid,
+             'tid'  : threadid}
+    if args:
+        event['args'] = args
+    if extra is not None:
+        event.update(extra)
+    _lock.acquire()
+    try:
+        if not _threadnames.has_key(threadid):
+            _threadnames[threadid] = True
+            _buffer.append({'name' : 'thread_name',
+                            'ph'   : 'M',
+                            'pid'  : _pid,
+                            'tid'  : threadid,
+                            'args' : {'name' : thread.getName()}})
+        _buffer.append(event)
+        if len(_buffer) >= BUFFERSIZE:
+            _write()
+    finally:
+        _lock.release()
+
+
+def _write():
+    """ Write the buffer to the file; _lock must be held """
+    global enabled
+    if _tracefile is None or len(_buffer) == 0:
+        return
+    try:
+        _tracefile.write("".join([json.dumps(event, default=str) + ",\n"
+                                  for event in _buffer]))
+        _tracefile.flush()
+    except IOError:
+        # stop tracing instead of failing the compilation
+        enabled = False
+    del _buffer[:]
+
+
+atexit.register(close)
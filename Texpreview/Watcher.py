@@ -0,0 +1,273 @@
+# -*- coding: utf-8 -*-
+############################################################################
+#    Copyright (C) 2008 by Michael Goerz                                   #
+#    http://www.physik.fu-berlin.de/~goerz                                 #
+#                                                                          #
+#    This program is free software; you can redistribute it and/or modify  #
+#    it under the terms of the GNU General Public License as published by  #
+#    the Free Software Foundation; either version 3 of the License, or     #
+#    (at your option) any later version.                                   #
+#                                                                          #
+#    This program is distributed in the hope that it will be useful,       #
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of        #
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the         #
+#    GNU General Public License for more details.                          #
+#                                                                          #
+#    You should have received a copy of the GNU General Public License     #
+#    along with this program; if not, write to the                         #
+#    Free Software Foundation, Inc.,                                       #
+#    59 Temple Place - Suite 330, Boston, MA  02111-1307, USA.             #
+############################################################################
+
+""" This module contains the watchers that wake up the compile loop when a
+    watchfile changes.
+
+    There are two watchers with the same interface:
+
+    InotifyWatcher      Uses the Linux inotify interface (through ctypes) to
+                        get notified by the kernel as soon as a watched file,
+                        or the directory containing it, changes.
+    PollingWatcher      Compares modification times at a fixed interval. This
+                        is the fallback for systems without inotify.
+
+    Both watchers are given the list of files to watch with set_files(). The
+    wait() method blocks until at least one of these files may have changed
+    (or until the timeout runs out), and returns the set of affected
+    filenames, spelled in the same way as they were passed to set_files().
+    Use create_watcher() to get the best watcher available on this system.
+
+    The function collect_changes() waits for a burst of changes to settle
+    (e.g. an editor writing a backup and renaming it, or a 'git checkout'),
+    and returns all changes of that burst in one change set.
+"""
+
+import os
+import time
+import errno
+import select
+import struct
+import TexpreviewPrinter as Out
+VERB_SILENT = Out.VERB_SILENT
+VERB_ERR    = Out.VERB_ERR
+VERB_WARN   = Out.VERB_WARN
+VERB_STATUS = Out.VERB_STATUS
+VERB_DEBUG  = Out.VERB_DEBUG
+
+
+# Constants from <sys/inotify.h>
+IN_MODIFY      = 0x00000002
+IN_ATTRIB      = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM  = 0x00000040
+IN_MOVED_TO    = 0x00000080
+IN_CREATE      = 0x00000100
+IN_DELETE      = 0x00000200
+IN_Q_OVERFLOW  = 0x00004000
+IN_ONLYDIR     = 0x01000000
+IN_NONBLOCK    = 0x00000800
+IN_CLOEXEC     = 0x00080000
+
+# Directories are watched instead of the files themselves, so that we also
+# see editors that save by writing a new file and renaming it over the old
+# one.
+WATCHMASK = IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM \
+            | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_ONLYDIR
+
+EVENTHEADER = struct.Struct('iIII') # wd, mask, cookie, len
+
+# Interval in seconds at which the PollingWatcher checks the watchfiles
+POLLINTERVAL = 1.0
+
+# Default time in seconds without any further change after which a burst of
+# changes is considered to be over
+SETTLETIME = 0.3
+
+# A burst of changes is cut off after this many seconds, even if the files
+# keep changing
+MAXBURSTTIME = 10.0
+
+
+class PollingWatcher(object):
+    """ Watcher that detects changes by comparing modification times """
+
+    def __init__(self, interval=POLLINTERVAL):
+        """ Create a watcher that checks the files every 'interval'
+            seconds
+        """
+        self.interval = interval
+        self._mtimes = {} # filename => modification time
+
+    def set_files(self, filenames):
+        """ Set the list of files that should be watched """
+        mtimes = {}
+        for filename in filenames:
+            if self._mtimes.has_key(filename):
+                mtimes[filename] = self._mtimes[filename]
+            else:
+                mtimes[filename] = _getmtime(filename)
+        self._mtimes = mtimes
+
+    def wait(self, timeout=None):
+        """ Sleep for the polling interval (or timeout, if it is shorter),
+            and return the set of files whose modification time has
+            changed in the meantime.
+        """
+        if timeout is None or timeout > self.interval:
+            timeout = self.interval
+        if timeout > 0:
+            time.sleep(timeout)
+        result = set()
+        for filename in self._mtimes.keys():
+            mtime = _getmtime(filename)
+            if mtime != self._mtimes[filename]:
+                result.add(filename)
+                self._mtimes[filename] = mtime
+        return result
+
+    def close(self):
+        """ Release all resources held by the watcher """
+        self._mtimes = {}
+
+
+class InotifyWatcher(object):
+    """ Watcher that is notified by the Linux kernel through inotify """
+
+    def __init__(self):
+        """ Initialize inotify. Raises OSError if inotify is not
+            available on this system.
+        """
+        import ctypes
+        import ctypes.util
+        libcname = ctypes.util.find_library('c')
+        if libcname is None:
+            raise OSError(errno.ENOSYS, "libc not found")
+        self._libc = ctypes.CDLL(libcname, use_errno=True)
+        if not hasattr(self._libc, 'inotify_init1'):
+            raise OSError(errno.ENOSYS, "inotify is not available")
+        self._fd = self._libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self._fd < 0:
+            error = ctypes.get_errno()
+            raise OSError(error, os.strerror(error))
+        self._get_errno = ctypes.get_errno
+        self._dirs = {}    # wd => directory
+        self._wds = {}     # directory => wd
+        self._files = {}   # absolute path => set of filenames as given
+
+    def set_files(self, filenames):
+        """ Set the list of files that should be watched. The directories
+            containing these files are added to the inotify watch list as
+            necessary.
+        """
+        files = {}
+        for filename in filenames:
+            abspath = os.path.abspath(filename)
+            if not files.has_key(abspath):
+                files[abspath] = set()
+            files[abspath].add(filename)
+            directory = os.path.dirname(abspath)
+            if not self._wds.has_key(directory):
+                wd = self._libc.inotify_add_watch(self._fd, directory,
+                                                  WATCHMASK)
+                if wd < 0:
+                    error = self._get_errno()
+                    Out.write("Cannot watch directory %s: %s\n" \
+                              % (directory, os.strerror(error)), VERB_WARN)
+                    continue
+                Out.write("inotify: watching directory %s\n", VERB_DEBUG,
+                          args=(directory,))
+                self._wds[directory] = wd
+                self._dirs[wd] = directory
+        self._files = files
+
+    def wait(self, timeout=None):
+        """ Block until the kernel reports a change to one of the watched
+            files (or until timeout seconds have passed, if timeout is not
+            None). Return the set of changed files.
+        """
+        result = set()
+        try:
+            readable = select.select([self._fd], [], [], timeout)[0]
+        except select.error, data:
+            if data[0] == errno.EINTR:
+                return result
+            raise
+        if not readable:
+            return result
+        try:
+            buffer = os.read(self._fd, 65536)
+        except OSError, data:
+            if data.errno in (errno.EAGAIN, errno.EINTR):
+                return result
+            raise
+        position = 0
+        while position + EVENTHEADER.size <= len(buffer):
+            wd, mask, cookie, length = \
+                                  EVENTHEADER.unpack_from(buffer, position)
+            position += EVENTHEADER.size
+            name = buffer[position:position+length].rstrip('\0')
+            position += length
+            if mask & IN_Q_OVERFLOW:
+                # we have missed events, so everything might have changed
+                Out.write("inotify: event queue overflow\n", VERB_DEBUG)
+                for filenames in self._files.values():
+                    result.update(filenames)
+                continue
+            if not self._dirs.has_key(wd):
+                continue
+            abspath = os.path.join(self._dirs[wd], name)
+            if self._files.has_key(abspath):
+                result.update(self._files[abspath])
+        return result
+
+    def close(self):
+        """ Release the inotify file descriptor """
+        if self._fd >= 0:
+            os.close(self._fd)
+            self._fd = -1
+
+
+def create_watcher(use_inotify=True):
+    """ Return an InotifyWatcher if use_inotify is True and inotify is
+        available, or a PollingWatcher otherwise.
+    """
+    if use_inotify:
+        try:
+            watcher = InotifyWatcher()
+            Out.write("Using inotify to watch for changes.\n", VERB_DEBUG)
+            return watcher
+        except (OSError, ImportError, AttributeError), data:
+            Out.write("inotify is not available (%s), " % data \
+                      + "falling back to polling.\n", VERB_DEBUG)
+    Out.write("Polling for changes every %s seconds.\n" % POLLINTERVAL,
+              VERB_DEBUG)
+    return PollingWatcher()
+
+
+def collect_changes(watcher, settle=SETTLETIME, timeout=None):
+    """ Wait until the watcher reports a change, and then keep collecting
+        changes until no further change arrives within 'settle' seconds.
+        Return the set of all files changed during that burst (an empty set
+        if nothing changed before timeout).
+    """
+    result = watcher.wait(timeout)
+    if not result or settle <= 0:
+        return result
+    burststart = time.time()
+    while time.time() - burststart < MAXBURSTTIME:
+        changedfiles = watcher.wait(settle)
+        if not changedfiles:
+            break
+        Out.write("Collecting changes: %s\n", VERB_DEBUG,
+                  args=(", ".join(changedfiles),))
+        result.update(changedfiles)
+    return result
+
+
+def _getmtime(filename):
+    """ Return the modification time of filename, or None if the file does
+        not exist (e.g. because an editor is just replacing it)
+    """
+    try:
+        return os.path.getmtime(filename)
+    except OSError:
+        return None
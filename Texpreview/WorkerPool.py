@@ -0,0 +1,178 @@
+# -*- coding: utf-8 -*-
+############################################################################
+#    Copyright (C) 2008 by Michael Goerz                                   #
+#    http://www.physik.fu-berlin.de/~goerz                                 #
+#                                                                          #
+#    This program is free software; you can redistribute it and/or modify  #
+#    it under the terms of the GNU General Public License as published by  #
+#    the Free Software Foundation; either version 3 of the License, or     #
+#    (at your option) any later version.                                   #
+#                                                                          #
+#    This program is distributed in the hope that it will be useful,       #
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of        #
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the         #
+#    GNU General Public License for more details.                          #
+#                                                                          #
+#    You should have received a copy of the GNU General Public License     #
+#    along with this program; if not, write to the                         #
+#    Free Software Foundation, Inc.,                                       #
+#    59 Temple Place - Suite 330, Boston, MA  02111-1307, USA.             #
+############################################################################
+
+""" This module contains the WorkerPool class, which compiles several
+    texfiles at the same time.
+
+    Jobs are run in up to 'jobs' worker threads, so that the calling
+    thread stays free to watch for changes (and e.g. cancel a running
+    compilation). With more than one worker, the output each job produces
+    through TexpreviewPrinter is captured, and printed in one piece when the
+    job is collected with wait() or map(), so that the output of different
+    texfiles does not interleave. If a job raises an exception (including
+    SystemExit), it is re-raised in the thread that collects the job.
+"""
+
+import sys
+import Queue
+import threading
+import TexpreviewPrinter as Out
+VERB_SILENT = Out.VERB_SILENT
+VERB_ERR    = Out.VERB_ERR
+VERB_WARN   = Out.VERB_WARN
+VERB_STATUS = Out.VERB_STATUS
+VERB_DEBUG  = Out.VERB_DEBUG
+
+
+# Seconds between checks for KeyboardInterrupt while waiting for jobs
+WAITINTERVAL = 0.1
+
+
+class Job(object):
+    """ A function call that is run by a WorkerPool
+
+        A Job has the following attributes:
+        function, args  The function and its arguments
+        result          The return value of the function
+        output          Output captured while the function was running
+        done            Has the function finished?
+    """
+
+    def __init__(self, function, args):
+        """ Create a job for function(*args) """
+        self.function = function
+        self.args = args
+        self.result = None
+        self.output = []
+        self.done = False
+        self._exc_info = None
+
+    def run(self):
+        """ Run the function, storing its result or exception """
+        try:
+            self.result = self.function(*self.args)
+        except:
+            self._exc_info = sys.exc_info()
+        self.done = True
+
+    def collect(self):
+        """ Print the captured output and return the result. Re-raise the
+            exception of the function, if any.
+        """
+        Out.write_captured(self.output)
+        self.output = []
+        if self._exc_info is not None:
+            exc_info = self._exc_info
+            self._exc_info = None
+            raise exc_info[0], exc_info[1], exc_info[2]
+        return self.result
+
+
+class WorkerPool(object):
+    """ Runs jobs in a limited number of worker threads """
+
+    def __init__(self, jobs=1):
+        """ Create a pool that runs at most 'jobs' jobs at the same time """
+        self.jobs = max(1, int(jobs))
+        self._queue = Queue.Queue()
+        self._finished = Queue.Queue()
+        self._threads = []
+        self._pending = 0
+
+    def submit(self, function, *args):
+        """ Schedule function(*args) and return the Job """
+        job = Job(function, args)
+        self._pending += 1
+        if len(self._threads) < self.jobs:
+            thread = threading.Thread(target=self._work)
+            thread.setDaemon(True)
+            thread.start()
+            self._threads.append(thread)
+        self._queue.put(job)
+        return job
+
+    def pending(self):
+        """ Return the number of jobs that have not been collected yet """
+        return self._pending
+
+    def wait(self, timeout=None):
+        """ Wait until at least one job has finished (or timeout seconds
+            have passed), collect all finished jobs, and return them as a
+            list. With timeout 0, only the jobs that have already finished
+            are collected.
+        """
+        result = []
+        if self._pending == 0:
+            return result
+        waited = 0.0
+        while True:
+            try:
+                if timeout is not None and waited >= timeout:
+                    job = self._finished.get(False)
+                else:
+                    job = self._finished.get(True, WAITINTERVAL)
+                break
+            except Queue.Empty:
+                if timeout is not None and waited >= timeout:
+                    return result
+                waited += WAITINTERVAL
+        while True:
+            self._pending -= 1
+            result.append(job)
+            job.collect()
+            try:
+                job = self._finished.get(False)
+            except Queue.Empty:
+                break
+        return result
+
+    def wait_all(self):
+        """ Wait until all jobs have finished, collect them, and return
+            them as a list
+        """
+        result = []
+        while self._pending > 0:
+            result += self.wait()
+        return result
+
+    def map(self, function, items):
+        """ Run function(item) for each of the items and return the list
+            of results, in the order of items
+        """
+        jobs = [self.submit(function, item) for item in items]
+        self.wait_all()
+        return [job.result for job in jobs]
+
+    def _work(self):
+        """ Worker thread: run jobs from the queue. If there is more than
+            one worker, their output is captured.
+        """
+        capture = (self.jobs > 1)
+        while True:
+            job = self._queue.get()
+            if capture:
+                Out.start_capture()
+            try:
+                job.run()
+            finally:
+                if capture:
+                    job.output = Out.stop_capture()
+                self._finished.put(job)
@@ -0,0 +1,159 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+############################################################################
+#    Copyright (C) 2008 by Michael Goerz                                   #
+#    http://www.physik.fu-berlin.de/~goerz                                 #
+#                                                                          #
+#    This program is free software; you can redistribute it and/or modify  #
+#    it under the terms of the GNU General Public License as published by  #
+#    the Free Software Foundation; either version 3 of the License, or     #
+#    (at your option) any later version.                                   #
+#                                                                          #
+#    This program is distributed in the hope that it will be useful,       #
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of        #
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the         #
+#    GNU General Public License for more details.                          #
+#                                                                          #
+#    You should have received a copy of the GNU General Public License     #
+#    along with this program; if not, write to the                         #
+#    Free Software Foundation, Inc.,                                       #
+#    59 Temple Place - Suite 330, Boston, MA  02111-1307, USA.             #
+############################################################################
+
+"""
+Benchmark the extraction of labels, references, citations and index items
+from tex files: the single-pass scanner in Texpreview.TexScanner against the
+previous implementation (one regex search per element type, and brace
+matching one character at a time).
+
+Usage:
+bench_elements.py [file1.tex file2.tex ...]
+
+If no files are given, a synthetic table-heavy document of about 2 MB is
+generated and used.
+"""
+
+import os
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                os.pardir))
+from Texpreview.TexScanner import scan_elements
+import Texpreview.TexpreviewPrinter as Out
+
+REPEAT = 3
+
+LEGACY_PATTERNS = {
+    'citations'  : re.compile(r'\\cite[a-z*]{,3}\{'),
+    'labels'     : re.compile(r'\\label\{'),
+    'references' : re.compile(r'\\ref\{'),
+    'index'      : re.compile(r'\\index\{')
+}
+
+
+def legacy_extract_element(fullstring, position):
+    """ Brace matching as done before the single-pass scanner """
+    Out.write("Extracting element from fullstring at position %s\n" \
+              % position, Out.VERB_DEBUG)
+    try:
+        startposition = fullstring.index("{", position) + 1
+        endposition = startposition
+        open_brackets = 1
+        while open_brackets > 0:
+            endposition += 1
+            if fullstring[endposition] == '{':
+                open_brackets += 1
+            elif fullstring[endposition] == '}':
+                open_brackets -= 1
+        return fullstring[startposition:endposition]
+    except (ValueError, IndexError):
+        return None
+
+
+def legacy_scan_elements(filecontents):
+    """ Element extraction as done before the single-pass scanner """
+    result = {'labels'    :[],
+              'references':[],
+              'citations' :[],
+              'index'     :[]}
+    for element in result.keys():
+        position = 0
+        while True:
+            element_match = \
+                    LEGACY_PATTERNS[element].search(filecontents, position)
+            if element_match:
+                position = element_match.start() + 1
+                result[element].append( \
+                            legacy_extract_element(filecontents, position))
+            else:
+                break
+    return result
+
+
+def synthetic_document(size=2*1024*1024):
+    """ Return the source of a generated document of roughly 'size' bytes,
+        consisting of long tables with labels, references, citations and
+        index items, as produced by table generators (with a label for
+        every row, so that rows can be referenced)
+    """
+    chunks = ["\\documentclass{article}\n\\begin{document}\n"]
+    length = len(chunks[0])
+    row = 0
+    while length < size:
+        table = ["\\begin{table}\n\\centering\n\\begin{tabular}{lrrr}\n"]
+        for i in range(40):
+            row += 1
+            table.append("  entry %d\\label{row:%d} & %d.%03d & "
+                         "{\\bf %d} & $\\pm %d.%d$ \\\\ %% row %d\n"
+                         % (row, row, row, row % 997, row * 7, row % 13,
+                            row % 7, row))
+        table.append("\\end{tabular}\n")
+        table.append("\\caption{Results for set %d, see \\ref{tab:%d} and "
+                     "\\cite{ref%d,ref%d}.\\index{set %d}}\n"
+                     % (row, row - 40, row % 50, row % 77, row))
+        table.append("\\label{tab:%d}\n\\end{table}\n\n" % row)
+        chunk = "".join(table)
+        chunks.append(chunk)
+        length += len(chunk)
+    chunks.append("\\end{document}\n")
+    return "".join(chunks)
+
+
+def measure(function, text):
+    """ Return the best time out of REPEAT runs of function(text) """
+    best = None
+    for i in range(REPEAT):
+        start = time.time()
+        function(text)
+        elapsed = time.time() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+
+def main():
+    """ Run the benchmark and print the results """
+    if len(sys.argv) > 1:
+        texts = []
+        for filename in sys.argv[1:]:
+            afile = open(filename)
+            texts.append((filename, afile.read()))
+            afile.close()
+    else:
+        texts = [('synthetic document', synthetic_document())]
+    for name, text in texts:
+        megabytes = len(text) / (1024.0 * 1024.0)
+        legacy = measure(legacy_scan_elements, text)
+        scanner = measure(scan_elements, text)
+        print "%s (%.2f MB):" % (name, megabytes)
+        print "    legacy extraction:   %8.4f s  %8.2f MB/s" \
+              % (legacy, megabytes / legacy)
+        print "    single-pass scanner: %8.4f s  %8.2f MB/s" \
+              % (scanner, megabytes / scanner)
+        print "    speedup:             %8.1fx" % (legacy / scanner)
+
+
+if __name__ == "__main__":
+    main()
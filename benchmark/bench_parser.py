@@ -0,0 +1,171 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+############################################################################
+#    Copyright (C) 2008 by Michael Goerz                                   #
+#    http://www.physik.fu-berlin.de/~goerz                                 #
+#                                                                          #
+#    This program is free software; you can redistribute it and/or modify  #
+#    it under the terms of the GNU General Public License as published by  #
+#    the Free Software Foundation; either version 3 of the License, or     #
+#    (at your option) any later version.                                   #
+#                                                                          #
+#    This program is distributed in the hope that it will be useful,       #
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of        #
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the         #
+#    GNU General Public License for more details.                          #
+#                                                                          #
+#    You should have received a copy of the GNU General Public License     #
+#    along with this program; if not, write to the                         #
+#    Free Software Foundation, Inc.,                                       #
+#    59 Temple Place - Suite 330, Boston, MA  02111-1307, USA.             #
+############################################################################
+"""
+Benchmark the parsing and printing of compiler output: the
+CompilerOutputPrinter in Texpreview against the previous implementation
+(a case-insensitive search with each of four regexes, and two writes, for
+every line).
+
+Usage:
+bench_parser.py [file1.log file2.log ...]
+
+If no files are given, a synthetic log of a TikZ/pgfplots-heavy document
+with about 300000 lines is generated and used. The printed output is sent
+to /dev/null.
+"""
+
+import os
+import re
+import sys
+import time
+import cStringIO
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                os.pardir))
+from Texpreview.CompilerOutputPrinter import CompilerOutputPrinter
+import Texpreview.TexpreviewPrinter as Out
+
+REPEAT = 3
+
+
+class LegacyOutputPrinter(object):
+    """ The output parser as it was before the DiagnosticParser """
+
+    def __init__(self, input_stream):
+        self.input_stream = input_stream
+        self.done = False
+        self.numErrs = 0
+        self.numWarns = 0
+        self.isFatal = False
+        self.warn_patterns = [( re.compile('warning', re.I),           False ),
+                              ( re.compile('^(over|under)full', re.I), False ) ]
+        self.err_patterns = [( re.compile('error', re.I), False ),
+                             ( re.compile('^!', re.I),    True  ) ]
+
+    def parseStream(self):
+        line = self.input_stream.readline()
+        VERB_CURR = Out.VERB_STATUS
+        keep_verb = False
+        while line and not self.done:
+            if (line.rstrip() == ''):
+                keep_verb = False
+                VERB_CURR = Out.VERB_STATUS
+            for (pat, pat_keep_verb) in self.warn_patterns:
+                myMatch = pat.search(line)
+                if myMatch:
+                    self.numWarns += 1
+                    keep_verb = pat_keep_verb
+                    VERB_CURR = Out.VERB_WARN
+                    break
+            for (pat, pat_keep_verb) in self.err_patterns:
+                myMatch = pat.search(line)
+                if myMatch:
+                    self.numErrs += 1
+                    keep_verb = pat_keep_verb
+                    VERB_CURR = Out.VERB_ERR
+                    break
+            Out.write("DEBUG: writing %s line\n" % VERB_CURR, Out.VERB_DEBUG,
+                      stream='sub')
+            Out.write(line, VERB_CURR, stream='sub')
+            if not keep_verb:
+                VERB_CURR = Out.VERB_STATUS
+            line = self.input_stream.readline()
+        return self.isFatal, self.numErrs, self.numWarns
+
+
+def synthetic_log(lines=300000):
+    """ Return the output of the tex compiler for a generated document
+        with many TikZ pictures and pgfplots, with about 'lines' lines
+    """
+    chunks = ["This is pdfTeX, Version 3.14159265-2.6-1.40.21 "
+              "(TeX Live 2020) (preloaded format=pdflatex)\n",
+              "(./manual.tex\nLaTeX2e <2020-02-02> patch level 2\n",
+              "(/usr/share/texlive/texmf-dist/tex/latex/pgfplots/"
+              "pgfplots.sty\n"]
+    count = 3
+    page = 0
+    while count < lines:
+        page += 1
+        chunk = ["(./figures/plot%d.tikz\n" % page]
+        for i in range(20):
+            chunk.append("Package pgfplots notification 'compat/show "
+                         "suggested version=true': document has been "
+                         "generated with\n")
+            chunk.append("the most recent feature set (\\pgfplotsset"
+                         "{compat=1.17}).\n")
+            chunk.append("\n")
+            chunk.append("(/usr/share/texlive/texmf-dist/tex/generic/pgfplots/"
+                         "libs/tikzlibrarypgfplots.groupplots.code.\n"
+                         "tex)\n")
+        chunk.append("Overfull \\hbox (1.2345pt too wide) in paragraph at "
+                     "lines %d--%d\n[]\\OT1/cmr/m/n/10 text\n []\n\n"
+                     % (page, page + 2))
+        chunk.append("\nLaTeX Warning: Reference `fig:%d' on page %d "
+                     "undefined on input line %d.\n\n" % (page, page, page))
+        chunk.append(") [%d] " % page)
+        chunk.append("\n")
+        count += 88
+        chunks.append("".join(chunk))
+    chunks.append(") )\nOutput written on manual.pdf (%d pages).\n" % page)
+    return "".join(chunks)
+
+
+def measure(printerclass, text):
+    """ Return the best time out of REPEAT runs of printerclass over text """
+    best = None
+    for i in range(REPEAT):
+        stream = cStringIO.StringIO(text)
+        start = time.time()
+        printerclass(stream).parseStream()
+        elapsed = time.time() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+
+def main():
+    """ Run the benchmark and print the results """
+    if len(sys.argv) > 1:
+        texts = []
+        for filename in sys.argv[1:]:
+            afile = open(filename)
+            texts.append((filename, afile.read()))
+            afile.close()
+    else:
+        texts = [('synthetic log', synthetic_log())]
+    devnull = open(os.devnull, 'w')
+    Out.streams['sub']['handle'] = devnull
+    for name, text in texts:
+        lines = text.count('\n')
+        legacy = measure(LegacyOutputPrinter, text)
+        printer = measure(CompilerOutputPrinter, text)
+        print "%s (%d lines):" % (name, lines)
+        print "    legacy parser:          %8.4f s  %10.0f lines/s" \
+              % (legacy, lines / legacy)
+        print "    CompilerOutputPrinter:  %8.4f s  %10.0f lines/s" \
+              % (printer, lines / printer)
+        print "    speedup:                %8.1fx" % (legacy / printer)
+    devnull.close()
+
+
+if __name__ == "__main__":
+    main()
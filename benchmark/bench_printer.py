@@ -0,0 +1,119 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+############################################################################
+#    Copyright (C) 2008 by Michael Goerz                                   #
+#    http://www.physik.fu-berlin.de/~goerz                                 #
+#                                                                          #
+#    This program is free software; you can redistribute it and/or modify  #
+#    it under the terms of the GNU General Public License as published by  #
+#    the Free Software Foundation; either version 3 of the License, or     #
+#    (at your option) any later version.                                   #
+#                                                                          #
+#    This program is distributed in the hope that it will be useful,       #
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of        #
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the         #
+#    GNU General Public License for more details.                          #
+#                                                                          #
+#    You should have received a copy of the GNU General Public License     #
+#    along with this program; if not, write to the                         #
+#    Free Software Foundation, Inc.,                                       #
+#    59 Temple Place - Suite 330, Boston, MA  02111-1307, USA.             #
+############################################################################
+
+"""
+Benchmark the TexpreviewPrinter: the cost of messages that are dropped
+because of the verbosity (formatted lazily, and checked against a
+precomputed threshold), and of messages that are printed (buffered),
+against the previous implementation (stream lookup, eager formatting and
+an unbuffered write for every message).
+
+Usage:
+bench_printer.py [number of messages]
+
+The printed output is sent to /dev/null.
+"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                os.pardir))
+import Texpreview.TexpreviewPrinter as Out
+
+REPEAT = 3
+MESSAGES = 200000
+
+LEGACY_STYLES = {
+    Out.VERB_SILENT : lambda text: Out.nocolored(text),
+    Out.VERB_ERR    : lambda text: Out.nocolored(text, 'red'),
+    Out.VERB_WARN   : lambda text: Out.nocolored(text, 'blue'),
+    Out.VERB_STATUS : lambda text: Out.nocolored(text),
+    Out.VERB_DEBUG  : lambda text: Out.nocolored(text)
+}
+
+
+def legacy_write(text, level=Out.DEFAULT_VERBOSITY, stream=None):
+    """ TexpreviewPrinter.write as it was before the buffered backend """
+    if stream is None:
+        stream = Out.default_stream
+    if stream not in Out.streams.keys():
+        raise KeyError("%s is not a registered name for a stream" % stream)
+    verbosity = Out.streams[stream]['verbosity']
+    if level <= verbosity:
+        handle = Out.streams[stream]['handle']
+        text = LEGACY_STYLES[level](text)
+        handle.write(text)
+
+
+def legacy_messages(count, level):
+    """ Write count messages at level, formatted by the caller """
+    for i in xrange(count):
+        legacy_write("Processing %s in %s (%d)\n" % ('file.tex', 'main', i),
+                     level)
+
+
+def messages(count, level):
+    """ Write count messages at level, formatted lazily """
+    for i in xrange(count):
+        Out.write("Processing %s in %s (%d)\n", level,
+                  args=('file.tex', 'main', i))
+    Out.flush()
+
+
+def measure(function, count, level):
+    """ Return the best time out of REPEAT runs of function(count, level) """
+    best = None
+    for i in range(REPEAT):
+        start = time.time()
+        function(count, level)
+        elapsed = time.time() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+
+def main():
+    """ Run the benchmark and print the results """
+    count = MESSAGES
+    if len(sys.argv) > 1:
+        count = int(sys.argv[1])
+    # unbuffered, like a terminal that is written to line by line
+    devnull = open(os.devnull, 'w', 0)
+    Out.streams['direct']['handle'] = devnull
+    Out.set_verbosity('direct', Out.VERB_STATUS)
+    for name, level in (('dropped (debug)', Out.VERB_DEBUG),
+                        ('printed (status)', Out.VERB_STATUS)):
+        legacy = measure(legacy_messages, count, level)
+        printer = measure(messages, count, level)
+        print "%s messages (%d):" % (name, count)
+        print "    legacy printer:     %8.4f s  %10.0f messages/s" \
+              % (legacy, count / legacy)
+        print "    TexpreviewPrinter:  %8.4f s  %10.0f messages/s" \
+              % (printer, count / printer)
+        print "    speedup:            %8.1fx" % (legacy / printer)
+    devnull.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,381 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+############################################################################
+#    Copyright (C) 2008 by Michael Goerz                                   #
+#    http://www.physik.fu-berlin.de/~goerz                                 #
+#                                                                          #
+#    This program is free software; you can redistribute it and/or modify  #
+#    it under the terms of the GNU General Public License as published by  #
+#    the Free Software Foundation; either version 3 of the License, or     #
+#    (at your option) any later version.                                   #
+#                                                                          #
+#    This program is distributed in the hope that it will be useful,       #
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of        #
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the         #
+#    GNU General Public License for more details.                          #
+#                                                                          #
+#    You should have received a copy of the GNU General Public License     #
+#    along with this program; if not, write to the                         #
+#    Free Software Foundation, Inc.,                                       #
+#    59 Temple Place - Suite 330, Boston, MA  02111-1307, USA.             #
+############################################################################
+"""
+End-to-end benchmark suite of texpreview, which runs without a TeX
+installation: a synthetic project is generated with corpus.py, and compiled
+with the stub compilers in stubtex.py.
+
+The scenarios are:
+elements    Throughput of the extraction of labels, references, citations
+            and index items from the sources (Texfile._get_elements_from_file)
+parser      Throughput of the parsing of compiler output
+            (CompilerOutputPrinter.parseStream), for the output of the stub
+            pdflatex on the project
+idle        CPU usage of texpreview.py while it is waiting for changes
+latency     Time from saving a change to a chapter to the updated preview
+            pdf, for edits of the text and for new labels (which need a
+            second run of the compiler)
+
+The corpus and the stub compilers are created in a temporary directory,
+which is removed at the end (unless --keep is given). The results can be
+written to a JSON file, for comparing them between versions (e.g. in CI).
+The exit status is 1 if a scenario failed (e.g. the initial compilation, or
+a preview that didn't arrive in time).
+bench_elements.py, bench_parser.py and bench_printer.py compare the
+current implementation of single components against the previous one.
+
+Usage:
+bench_suite.py [options] [scenario ...]
+
+Options:
+--chapters=8        Number of chapters of the corpus (see corpus.py)
+--size=20           Size of each chapter, in kilobytes
+--labels=2          Number of labels (and references) per kilobyte
+--citations=1       Number of citations per kilobyte
+--figures=16        Total number of figures
+--delay=0.2         Time each run of the stub pdflatex takes, in seconds
+--edits=10          Number of edits of each kind in the latency scenario
+--idle=5            Duration of the idle scenario, in seconds
+--settle=0.3        Value of --settle for texpreview.py
+--json=file         Write the results to this file
+--keep              Keep the temporary directory
+"""
+
+import os
+import sys
+import time
+import json
+import getopt
+import signal
+import shutil
+import tempfile
+import cStringIO
+import subprocess
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                os.pardir))
+from Texpreview.Texfile import Texfile
+from Texpreview.CompilerOutputPrinter import CompilerOutputPrinter
+import Texpreview.TexpreviewPrinter as Out
+import corpus
+import stubtex
+
+SCENARIOS = ['elements', 'parser', 'idle', 'latency']
+
+REPEAT = 3
+
+# Minimum number of lines of compiler output in the parser scenario
+PARSERLINES = 200000
+
+# Seconds to wait for the initial compilation, and for the preview after
+# an edit
+STARTTIMEOUT = 120.0
+EDITTIMEOUT = 60.0
+
+# Seconds between checks of the preview pdf
+POLLINTERVAL = 0.01
+
+# Seconds to wait after the preview was updated, before the next edit
+QUIET = 0.5
+
+TEXPREVIEW = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                          os.pardir, 'texpreview.py')
+
+
+def best_time(function, *args):
+    """ Return the best time out of REPEAT runs of function(*args) """
+    best = None
+    for i in range(REPEAT):
+        start = time.time()
+        function(*args)
+        elapsed = time.time() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+
+def percentile(values, fraction):
+    """ Return the percentile (nearest rank) of the list of values """
+    values = sorted(values)
+    index = int(round(fraction * len(values) + 0.5)) - 1
+    return values[max(0, min(index, len(values) - 1))]
+
+
+def texfiles(directory):
+    """ Return the list of all tex files in directory """
+    result = []
+    for dirpath, dirnames, filenames in os.walk(directory):
+        for filename in filenames:
+            if filename.endswith('.tex'):
+                result.append(os.path.join(dirpath, filename))
+    result.sort()
+    return result
+
+
+def run_elements(project, results):
+    """ Measure the throughput of Texfile._get_elements_from_file """
+    texfile = Texfile(project)
+    filenames = texfiles(os.path.dirname(project))
+    megabytes = sum([os.path.getsize(filename) for filename in filenames]) \
+                / (1024.0 * 1024.0)
+    def extract():
+        for filename in filenames:
+            texfile._get_elements_from_file(filename)
+    elapsed = best_time(extract)
+    print "elements: %d files (%.2f MB) in %.4f s, %.2f MB/s" \
+          % (len(filenames), megabytes, elapsed, megabytes / elapsed)
+    results['elements_mb_per_s'] = megabytes / elapsed
+
+
+def run_parser(project, stubs, results):
+    """ Measure the throughput of CompilerOutputPrinter.parseStream on the
+        output of the stub pdflatex for the project
+    """
+    directory = os.path.dirname(project)
+    environment = stub_environment(stubs, 0.0)
+    process = subprocess.Popen(['pdflatex', '-interaction=nonstopmode',
+                                os.path.basename(project)],
+                               cwd=directory, env=environment,
+                               stdout=subprocess.PIPE,
+                               stderr=subprocess.STDOUT)
+    output = process.communicate()[0]
+    for extension in ['.aux', '.idx', '.log', '.pdf']:
+        filename = os.path.splitext(project)[0] + extension
+        if os.path.isfile(filename):
+            os.remove(filename)
+    text = output * (PARSERLINES // max(1, output.count('\n')) + 1)
+    lines = text.count('\n')
+    megabytes = len(text) / (1024.0 * 1024.0)
+    devnull = open(os.devnull, 'w')
+    handle = Out.streams['sub']['handle']
+    Out.streams['sub']['handle'] = devnull
+    try:
+        elapsed = best_time(lambda: CompilerOutputPrinter(
+                                cStringIO.StringIO(text)).parseStream())
+        Out.flush()
+    finally:
+        Out.streams['sub']['handle'] = handle
+        devnull.close()
+    print "parser: %d lines (%.2f MB) in %.4f s, %.0f lines/s" \
+          % (lines, megabytes, elapsed, lines / elapsed)
+    results['parser_lines_per_s'] = lines / elapsed
+
+
+def stub_environment(stubs, delay):
+    """ Return the environment for running the stub compilers in the
+        directory stubs, with the given delay of pdflatex
+    """
+    environment = os.environ.copy()
+    environment['PATH'] = stubs + os.pathsep + environment.get('PATH', '')
+    environment['STUBTEX_DELAY'] = str(delay)
+    return environment
+
+
+def preview_fingerprint(previewfile):
+    """ Return a tuple that changes whenever the preview is published """
+    try:
+        status = os.stat(previewfile)
+    except OSError:
+        return None
+    return (status.st_ino, status.st_mtime, status.st_size)
+
+
+def wait_for_change(previewfile, fingerprint, timeout):
+    """ Wait until the fingerprint of previewfile differs from fingerprint.
+        Return the new fingerprint, or None after timeout seconds.
+    """
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        current = preview_fingerprint(previewfile)
+        if current is not None and current != fingerprint:
+            return current
+        time.sleep(POLLINTERVAL)
+    return None
+
+
+def cputime(pid):
+    """ Return the CPU time (user + system) of the process pid in seconds,
+        or None if it is not available (i.e. not on Linux)
+    """
+    try:
+        statfile = open('/proc/%d/stat' % pid)
+        try:
+            fields = statfile.read().rsplit(')', 1)[1].split()
+        finally:
+            statfile.close()
+    except (IOError, IndexError):
+        return None
+    # utime and stime are the 14th and 15th fields (after pid and comm)
+    return (int(fields[11]) + int(fields[12])) \
+           / float(os.sysconf('SC_CLK_TCK'))
+
+
+def run_session(project, stubs, scenarios, parameters, results):
+    """ Run texpreview.py on the project, and measure the idle and latency
+        scenarios. Return False if the session failed.
+    """
+    directory = os.path.dirname(project)
+    previewfile = os.path.splitext(project)[0] + '.preview.pdf'
+    logfilename = os.path.join(os.path.dirname(directory), 'texpreview.log')
+    logfile = open(logfilename, 'w')
+    process = subprocess.Popen([sys.executable, TEXPREVIEW, '--noconfig',
+                                '--viewer=', '--nocache',
+                                '--settle=%s' % parameters['settle'],
+                                os.path.basename(project)],
+                               cwd=directory,
+                               env=stub_environment(stubs,
+                                                    parameters['delay']),
+                               stdout=logfile, stderr=subprocess.STDOUT)
+    try:
+        fingerprint = wait_for_change(previewfile, None, STARTTIMEOUT)
+        if fingerprint is None:
+            print "The initial compilation failed, see %s" % logfilename
+            return False
+        time.sleep(QUIET)
+        if 'idle' in scenarios:
+            start = cputime(process.pid)
+            if start is None:
+                print "idle: CPU time not available on this system"
+            else:
+                time.sleep(parameters['idle'])
+                used = cputime(process.pid) - start
+                percent = 100.0 * used / parameters['idle']
+                print "idle: %.3f s CPU in %.1f s (%.2f%%)" \
+                      % (used, parameters['idle'], percent)
+                results['idle_cpu_percent'] = percent
+        if 'latency' in scenarios:
+            chapters = [filename for filename in texfiles(directory)
+                        if filename != project]
+            for kind in ['text', 'label']:
+                latencies = []
+                for edit in range(parameters['edits']):
+                    chapter = chapters[edit % len(chapters)]
+                    # no new lines, so that the page numbers don't change
+                    if kind == 'text':
+                        addition = " An edit of the text, number %d." % edit
+                    else:
+                        addition = " A new label\\label{bench:%d}." % edit
+                    afile = open(chapter, 'a')
+                    start = time.time()
+                    afile.write(addition)
+                    afile.close()
+                    fingerprint = wait_for_change(previewfile, fingerprint,
+                                                  EDITTIMEOUT)
+                    if fingerprint is None:
+                        print "latency: no new preview after %d s, see %s" \
+                              % (EDITTIMEOUT, logfilename)
+                        return False
+                    latencies.append(time.time() - start)
+                    time.sleep(QUIET)
+                p50 = percentile(latencies, 0.5)
+                p95 = percentile(latencies, 0.95)
+                print "latency (%s edits): min %.3f s, p50 %.3f s, " \
+                      "p95 %.3f s, max %.3f s" % (kind, min(latencies), p50,
+                                                  p95, max(latencies))
+                results['latency_%s_p50' % kind] = p50
+                results['latency_%s_p95' % kind] = p95
+        return True
+    finally:
+        stop(process)
+        logfile.close()
+
+
+def stop(process):
+    """ Stop texpreview.py (with Ctrl+C twice, as a user would) """
+    for i in range(2):
+        if process.poll() is None:
+            os.kill(process.pid, signal.SIGINT)
+            time.sleep(0.5)
+    deadline = time.time() + 10.0
+    while process.poll() is None and time.time() < deadline:
+        time.sleep(0.1)
+    if process.poll() is None:
+        os.kill(process.pid, signal.SIGKILL)
+        process.wait()
+
+
+def main():
+    """ Run the benchmark suite and print the results """
+    try:
+        opts, args = getopt.getopt(sys.argv[1:], "h",
+                                   ["help", "chapters=", "size=", "labels=",
+                                    "citations=", "figures=", "delay=",
+                                    "edits=", "idle=", "settle=", "json=",
+                                    "keep"])
+    except getopt.GetoptError, details:
+        print details
+        return 2
+    corpusparameters = {}
+    parameters = {'delay' : 0.2, 'edits' : 10, 'idle' : 5.0, 'settle' : 0.3,
+                  'json' : None, 'keep' : False}
+    for opt, value in opts:
+        key = opt[2:]
+        if opt in ('-h', '--help'):
+            print __doc__
+            return 0
+        elif corpus.DEFAULTS.has_key(key):
+            corpusparameters[key] = type(corpus.DEFAULTS[key])(value)
+        elif key == 'json':
+            parameters['json'] = value
+        elif key == 'keep':
+            parameters['keep'] = True
+        else:
+            parameters[key] = type(parameters[key])(value)
+    scenarios = args or SCENARIOS
+    for scenario in scenarios:
+        if scenario not in SCENARIOS:
+            print "Unknown scenario %s, choose from %s" \
+                  % (scenario, ", ".join(SCENARIOS))
+            return 2
+    workdir = tempfile.mkdtemp(prefix='texpreview-bench-')
+    results = {}
+    success = True
+    try:
+        project = corpus.generate(os.path.join(workdir, 'corpus'),
+                                  **corpusparameters)
+        stubs = os.path.join(workdir, 'bin')
+        stubtex.install(stubs)
+        if 'elements' in scenarios:
+            run_elements(project, results)
+        if 'parser' in scenarios:
+            run_parser(project, stubs, results)
+        if 'idle' in scenarios or 'latency' in scenarios:
+            success = run_session(project, stubs, scenarios, parameters,
+                                  results)
+    finally:
+        if parameters['keep']:
+            print "The corpus and logs are in %s" % workdir
+        else:
+            shutil.rmtree(workdir, True)
+    if parameters['json'] is not None:
+        afile = open(parameters['json'], 'w')
+        try:
+            json.dump(results, afile, indent=1, sort_keys=True)
+        finally:
+            afile.close()
+    if not success:
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
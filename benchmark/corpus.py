@@ -0,0 +1,211 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+############################################################################
+#    Copyright (C) 2008 by Michael Goerz                                   #
+#    http://www.physik.fu-berlin.de/~goerz                                 #
+#                                                                          #
+#    This program is free software; you can redistribute it and/or modify  #
+#    it under the terms of the GNU General Public License as published by  #
+#    the Free Software Foundation; either version 3 of the License, or     #
+#    (at your option) any later version.                                   #
+#                                                                          #
+#    This program is distributed in the hope that it will be useful,       #
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of        #
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the         #
+#    GNU General Public License for more details.                          #
+#                                                                          #
+#    You should have received a copy of the GNU General Public License     #
+#    along with this program; if not, write to the                         #
+#    Free Software Foundation, Inc.,                                       #
+#    59 Temple Place - Suite 330, Boston, MA  02111-1307, USA.             #
+############################################################################
+"""
+Generator of synthetic LaTeX projects for the benchmarks.
+
+A project consists of main.tex, which \\input's one file per chapter from
+the chapters/ subdirectory, a bibliography refs.bib, and figures in the
+figures/ subdirectory. The chapters consist of paragraphs of filler text
+with sections, labels, references to earlier labels, citations, index
+items, and figures. The generated projects are reproducible: the same
+parameters (and seed) give the same files.
+
+Usage:
+corpus.py [options] directory
+
+Options:
+--chapters=8        Number of chapters
+--size=20           Size of each chapter, in kilobytes
+--labels=2          Number of labels (and references) per kilobyte
+--citations=1       Number of citations per kilobyte
+--figures=16        Total number of figures
+--seed=0            Seed of the random number generator
+"""
+
+import os
+import sys
+import random
+import getopt
+
+WORDS = ("lorem ipsum dolor sit amet consectetur adipiscing elit sed do "
+         "eiusmod tempor incididunt ut labore et dolore magna aliqua enim "
+         "ad minim veniam quis nostrud exercitation ullamco laboris nisi "
+         "aliquip ex ea commodo consequat duis aute irure in reprehenderit "
+         "voluptate velit esse cillum fugiat nulla pariatur").split()
+
+# Default parameters of a project
+DEFAULTS = {'chapters'  : 8,
+            'size'      : 20,
+            'labels'    : 2.0,
+            'citations' : 1.0,
+            'figures'   : 16,
+            'seed'      : 0}
+
+# Number of distinct entries in the bibliography
+BIBENTRIES = 200
+
+
+def generate(directory, chapters=DEFAULTS['chapters'], size=DEFAULTS['size'],
+             labels=DEFAULTS['labels'], citations=DEFAULTS['citations'],
+             figures=DEFAULTS['figures'], seed=DEFAULTS['seed']):
+    """ Write a project into directory (which is created if necessary), and
+        return the name of its main file. size is the size of each chapter
+        in kilobytes, labels and citations are the number of labels and
+        citations per kilobyte, and figures is the total number of figures.
+    """
+    generator = random.Random(seed)
+    for subdirectory in ['chapters', 'figures']:
+        path = os.path.join(directory, subdirectory)
+        if not os.path.isdir(path):
+            os.makedirs(path)
+    main = ["\\documentclass{book}\n",
+            "\\usepackage{graphicx}\n",
+            "\\usepackage{makeidx}\n",
+            "\\makeindex\n",
+            "\\begin{document}\n"]
+    knownlabels = []
+    figurenumber = 0
+    for chapter in range(1, chapters + 1):
+        chaptername = "chap%02d" % chapter
+        main.append("\\input{chapters/%s}\n" % chaptername)
+        # figures are distributed evenly over the chapters
+        chapterfigures = figures * chapter // chapters \
+                         - figures * (chapter - 1) // chapters
+        text = chapter_text(generator, chapter, size, labels, citations,
+                            chapterfigures, figurenumber, knownlabels)
+        figurenumber += chapterfigures
+        write_file(os.path.join(directory, 'chapters', chaptername + '.tex'),
+                   text)
+    main += ["\\bibliographystyle{plain}\n",
+             "\\bibliography{refs}\n",
+             "\\printindex\n",
+             "\\end{document}\n"]
+    write_file(os.path.join(directory, 'main.tex'), "".join(main))
+    bib = []
+    for number in range(BIBENTRIES):
+        bib.append("@article{ref%d,\n  author = {Author, A. and Other, B.},\n"
+                   "  title = {%s},\n  journal = {Journal of %s},\n"
+                   "  year = {%d}\n}\n\n"
+                   % (number, sentence(generator, 6), WORDS[number % len(WORDS)],
+                      1950 + number % 70))
+    write_file(os.path.join(directory, 'refs.bib'), "".join(bib))
+    for number in range(1, figures + 1):
+        write_file(os.path.join(directory, 'figures', 'fig%02d.pdf' % number),
+                   "%%PDF-1.4\n%% figure %d\n%%%%EOF\n" % number)
+    return os.path.join(directory, 'main.tex')
+
+
+def chapter_text(generator, chapter, size, labels, citations, figures,
+                 firstfigure, knownlabels):
+    """ Return the source of a chapter of about 'size' kilobytes. The
+        labels that are defined are appended to knownlabels, and references
+        point to earlier labels.
+    """
+    chunks = ["\\chapter{%s}\\label{ch:%d}\n\n" % (sentence(generator, 3),
+                                                  chapter)]
+    knownlabels.append("ch:%d" % chapter)
+    length = len(chunks[0])
+    target = size * 1024
+    paragraph = 0
+    # the figures are placed at regular intervals in the chapter
+    figurepositions = [target * (index + 1) // (figures + 1)
+                       for index in range(figures)]
+    figurenumber = firstfigure
+    while length < target:
+        paragraph += 1
+        lines = []
+        if paragraph % 6 == 1:
+            label = "sec:%d:%d" % (chapter, paragraph)
+            lines.append("\\section{%s}\\label{%s}\n"
+                         % (sentence(generator, 4), label))
+            knownlabels.append(label)
+        for index in range(8):
+            line = sentence(generator, 12)
+            budget = len(line) / 1024.0
+            if generator.random() < labels * budget:
+                label = "eq:%d:%d:%d" % (chapter, paragraph, index)
+                line += " \\begin{equation}x_{%d} = %d\\label{%s}" \
+                        "\\end{equation}" % (index, paragraph, label)
+                knownlabels.append(label)
+            if generator.random() < labels * budget:
+                line += " see \\ref{%s}" % generator.choice(knownlabels)
+            if generator.random() < citations * budget:
+                line += " \\cite{ref%d}" % generator.randrange(BIBENTRIES)
+            if generator.random() < 0.2:
+                line += " \\index{%s}" % generator.choice(WORDS)
+            lines.append(line + ".\n")
+        lines.append("\n")
+        if figurepositions and length >= figurepositions[0]:
+            del figurepositions[0]
+            figurenumber += 1
+            lines.append("\\begin{figure}\n\\centering\n"
+                         "\\includegraphics[width=0.8\\textwidth]"
+                         "{figures/fig%02d}\n\\caption{%s}\\label{fig:%d}\n"
+                         "\\end{figure}\n\n"
+                         % (figurenumber, sentence(generator, 8),
+                            figurenumber))
+            knownlabels.append("fig:%d" % figurenumber)
+        chunk = "".join(lines)
+        chunks.append(chunk)
+        length += len(chunk)
+    return "".join(chunks)
+
+
+def sentence(generator, words):
+    """ Return a string of random words """
+    return " ".join([generator.choice(WORDS) for index in range(words)])
+
+
+def write_file(filename, content):
+    """ Write content to filename """
+    afile = open(filename, 'w')
+    try:
+        afile.write(content)
+    finally:
+        afile.close()
+
+
+def main():
+    """ Generate the project given on the command line """
+    try:
+        opts, args = getopt.getopt(sys.argv[1:], "h",
+                                   ["help", "chapters=", "size=", "labels=",
+                                    "citations=", "figures=", "seed="])
+    except getopt.GetoptError, details:
+        print details
+        return 2
+    parameters = {}
+    for opt, value in opts:
+        if opt in ('-h', '--help'):
+            print __doc__
+            return 0
+        key = opt[2:]
+        parameters[key] = type(DEFAULTS[key])(value)
+    if len(args) != 1:
+        print __doc__
+        return 2
+    print generate(args[0], **parameters)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,427 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+############################################################################
+#    Copyright (C) 2008 by Michael Goerz                                   #
+#    http://www.physik.fu-berlin.de/~goerz                                 #
+#                                                                          #
+#    This program is free software; you can redistribute it and/or modify  #
+#    it under the terms of the GNU General Public License as published by  #
+#    the Free Software Foundation; either version 3 of the License, or     #
+#    (at your option) any later version.                                   #
+#                                                                          #
+#    This program is distributed in the hope that it will be useful,       #
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of        #
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the         #
+#    GNU General Public License for more details.                          #
+#                                                                          #
+#    You should have received a copy of the GNU General Public License     #
+#    along with this program; if not, write to the                         #
+#    Free Software Foundation, Inc.,                                       #
+#    59 Temple Place - Suite 330, Boston, MA  02111-1307, USA.             #
+############################################################################
+"""
+Stub versions of pdflatex, bibtex and makeindex, for benchmarking texpreview
+without a TeX installation.
+
+The stubs read and write the same files as the real programs, with
+simplified content, and print realistic output: pdflatex follows \\input
+and \\include, and prints the files it opens, the included figures, the
+pages, overfull boxes, undefined references and citations, and the request
+to rerun when the labels have changed. It writes the .aux, .idx, .log and
+.pdf files (and the .fls file with -recorder) and understands the options
+that texpreview passes (-output-directory, -jobname, -halt-on-error,
+-recorder, -ini). A line containing \\stuberror produces an error. bibtex
+writes the .bbl for the citations in the .aux file and the entries of the
+.bib files, makeindex the sorted .ind file.
+
+The time the programs take is set in the environment, in seconds:
+STUBTEX_DELAY               fixed delay of each run of pdflatex (0.2)
+STUBTEX_DELAY_PER_KB        additional delay of pdflatex per kilobyte of
+                            source (0.001)
+STUBTEX_BIBTEX_DELAY        delay of each run of bibtex (0.05)
+STUBTEX_MAKEINDEX_DELAY     delay of each run of makeindex (0.05)
+
+Usage:
+stubtex.py pdflatex|bibtex|makeindex [arguments]
+stubtex.py --install directory
+
+With --install, the scripts pdflatex, bibtex and makeindex are created in
+directory. They run the stubs with the current python interpreter, so
+that the directory can be put in front of PATH.
+"""
+
+import os
+import re
+import sys
+import time
+import hashlib
+
+PROGRAMS = ['pdflatex', 'bibtex', 'makeindex']
+
+# Number of source lines on a page
+PAGELINES = 45
+
+_INPUT = re.compile(r'\\(?:input|include)\{([^}]*)\}')
+_LABEL = re.compile(r'\\label\{([^}]*)\}')
+_REF = re.compile(r'\\(?:eq|page)?ref\{([^}]*)\}')
+_CITE = re.compile(r'\\cite[a-z]*\*?(?:\[[^\]]*\])*\{([^}]*)\}')
+_INDEX = re.compile(r'\\index\{([^}]*)\}')
+_GRAPHICS = re.compile(r'\\includegraphics(?:\[[^\]]*\])?\{([^}]*)\}')
+_BIBLIOGRAPHY = re.compile(r'\\bibliography\{([^}]*)\}')
+_BIBSTYLE = re.compile(r'\\bibliographystyle\{([^}]*)\}')
+_BIBITEM = re.compile(r'\\bibitem\{([^}]*)\}')
+_NEWLABEL = re.compile(r'\\newlabel\{([^}]*)\}')
+_CITATION = re.compile(r'\\citation\{([^}]*)\}')
+_BIBDATA = re.compile(r'\\bibdata\{([^}]*)\}')
+_BIBENTRY = re.compile(r'@\w+\s*\{\s*([^,\s]+)\s*,')
+_INDEXENTRY = re.compile(r'\\indexentry\{(.*)\}\{(\d+)\}')
+
+
+def install(directory):
+    """ Create the scripts for all PROGRAMS in directory """
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    for program in PROGRAMS:
+        filename = os.path.join(directory, program)
+        script = open(filename, 'w')
+        script.write("#!/bin/sh\nexec '%s' '%s' %s \"$@\"\n"
+                     % (sys.executable, os.path.abspath(__file__), program))
+        script.close()
+        os.chmod(filename, 0755)
+
+
+def delay(name, default):
+    """ Return the delay in seconds set in the environment variable name """
+    try:
+        return float(os.environ.get(name, default))
+    except ValueError:
+        return default
+
+
+def read_file(filename):
+    """ Return the content of filename, or None if it can't be read """
+    try:
+        afile = open(filename)
+        try:
+            return afile.read()
+        finally:
+            afile.close()
+    except IOError:
+        return None
+
+
+def write_file(filename, content):
+    """ Write content to filename """
+    afile = open(filename, 'w')
+    try:
+        afile.write(content)
+    finally:
+        afile.close()
+
+
+def say(text):
+    """ Print text immediately, as the real programs do """
+    sys.stdout.write(text)
+    sys.stdout.flush()
+
+
+def texfile(name):
+    """ Return the filename for \\input{name} """
+    if os.path.splitext(name)[1] == '':
+        return name + '.tex'
+    return name
+
+
+def pdflatex(argv):
+    """ Stub of pdflatex; return the exit code """
+    outdir = '.'
+    jobname = None
+    recorder = False
+    halt = False
+    ini = False
+    files = []
+    for argument in argv:
+        if argument.startswith('-output-directory='):
+            outdir = argument.split('=', 1)[1]
+        elif argument.startswith('-jobname='):
+            jobname = argument.split('=', 1)[1]
+        elif argument == '-recorder':
+            recorder = True
+        elif argument == '-halt-on-error':
+            halt = True
+        elif argument == '-ini':
+            ini = True
+        elif not argument.startswith('-') and not argument.startswith('&'):
+            files.append(argument)
+    say("This is pdfTeX, Version 3.141592653-2.6-1.40.22 (TeX Live 2022) "
+        "(preloaded format=pdflatex)\n restricted \\write18 enabled.\n"
+        "entering extended mode\n")
+    if len(files) == 0:
+        say("! Emergency stop.\n<*> \n\nNo pages of output.\n")
+        return 1
+    mainfile = texfile(files[-1])
+    if jobname is None:
+        jobname = os.path.splitext(os.path.basename(mainfile))[0]
+    job = os.path.join(outdir, jobname)
+    if ini:
+        # dump a "format" of the preamble (see Preamble.py)
+        time.sleep(delay('STUBTEX_DELAY', 0.2))
+        write_file(job + '.fmt', 'stub format of %s\n' % mainfile)
+        say("Beginning to dump on file %s.fmt\n" % jobname)
+        return 0
+    oldaux = read_file(job + '.aux') or ''
+    knownlabels = set(_NEWLABEL.findall(oldaux))
+    knowncitations = set(_BIBITEM.findall(read_file(job + '.bbl') or ''))
+    perkb = delay('STUBTEX_DELAY_PER_KB', 0.001)
+    time.sleep(delay('STUBTEX_DELAY', 0.2))
+    inputs = []
+    labels = []
+    citations = []
+    indexitems = []
+    state = {'line' : 0, 'page' : 1, 'digest' : hashlib.md5(),
+             'bibliography' : None, 'bibstyle' : None, 'makeindex' : False}
+    log = []
+
+    def process(filename, depth):
+        """ Typeset filename; return False on an error """
+        source = read_file(filename)
+        if source is None:
+            say("! LaTeX Error: File `%s' not found.\n\n" % filename)
+            return False
+        inputs.append(filename)
+        state['digest'].update(source)
+        say("(./%s" % filename + (depth == 0 and "\nLaTeX2e <2021-11-15>\n"
+            "(/usr/share/texlive/texmf-dist/tex/latex/base/book.cls\n"
+            "Document Class: book 2021/10/04 v1.4n Standard LaTeX document "
+            "class\n(/usr/share/texlive/texmf-dist/tex/latex/base/bk10.clo))"
+            "\n(/usr/share/texlive/texmf-dist/tex/latex/graphics/graphicx.sty"
+            ")\n" or "\n"))
+        time.sleep(perkb * len(source) / 1024.0)
+        linenumber = 0
+        for line in source.split('\n'):
+            linenumber += 1
+            comment = line.find('%')
+            while comment > 0 and line[comment-1] == '\\':
+                comment = line.find('%', comment + 1)
+            if comment >= 0:
+                line = line[:comment]
+            if '\\stuberror' in line:
+                say("! Undefined control sequence.\nl.%d \\stuberror\n\n"
+                    % linenumber)
+                log.append("! Undefined control sequence.\n")
+                if halt:
+                    return False
+            if '\\makeindex' in line:
+                state['makeindex'] = True
+            for match in _BIBLIOGRAPHY.finditer(line):
+                state['bibliography'] = match.group(1)
+            for match in _BIBSTYLE.finditer(line):
+                state['bibstyle'] = match.group(1)
+            for label in _LABEL.findall(line):
+                labels.append((label, state['page']))
+            for reference in _REF.findall(line):
+                if reference not in knownlabels:
+                    say("\nLaTeX Warning: Reference `%s' on page %d undefined "
+                        "on input line %d.\n\n"
+                        % (reference, state['page'], linenumber))
+            for keys in _CITE.findall(line):
+                for key in keys.split(','):
+                    key = key.strip()
+                    citations.append(key)
+                    if key not in knowncitations:
+                        say("\nLaTeX Warning: Citation `%s' on page %d "
+                            "undefined on input line %d.\n\n"
+                            % (key, state['page'], linenumber))
+            for item in _INDEX.findall(line):
+                indexitems.append((item, state['page']))
+            for graphic in _GRAPHICS.findall(line):
+                say("<%s, id=%d, 433.62pt x 289.08pt>\nFile: %s Graphic "
+                    "file (type pdf)\n<use %s>\n"
+                    % (graphic, len(inputs) + linenumber, graphic, graphic))
+            if len(line) > 75 and linenumber % 17 == 0:
+                say("\nOverfull \\hbox (%d.%02dpt too wide) in paragraph at "
+                    "lines %d--%d\n[]\\T1/cmr/m/n/10 %s\n []\n\n"
+                    % (linenumber % 23, linenumber % 100, linenumber - 2,
+                       linenumber, line[:40]))
+            for name in _INPUT.findall(line):
+                if not process(texfile(name), depth + 1):
+                    return False
+            state['line'] += 1
+            if state['line'] % PAGELINES == 0:
+                say("[%d] " % state['page'])
+                state['page'] += 1
+        say(")")
+        return True
+
+    success = process(mainfile, 0)
+    say("\n")
+    if not success and halt:
+        say("! ==> Fatal error occurred, no output PDF file produced!\n"
+            "Transcript written on %s.log.\n" % job)
+        write_file(job + '.log', "".join(log))
+        return 1
+    aux = ["\\relax \n"]
+    for key in citations:
+        aux.append("\\citation{%s}\n" % key)
+    number = 0
+    for label, page in labels:
+        number += 1
+        aux.append("\\newlabel{%s}{{%d}{%d}}\n" % (label, number, page))
+    if state['bibliography'] is not None:
+        aux.append("\\bibstyle{%s}\n" % (state['bibstyle'] or 'plain'))
+        aux.append("\\bibdata{%s}\n" % state['bibliography'])
+    aux.append("\\gdef \\@abspage@last{%d}\n" % state['page'])
+    aux = "".join(aux)
+    write_file(job + '.aux', aux)
+    if state['makeindex']:
+        write_file(job + '.idx', "".join(["\\indexentry{%s}{%d}\n" % entry
+                                          for entry in indexitems]))
+    if set(_NEWLABEL.findall(aux)) != knownlabels:
+        message = "LaTeX Warning: Label(s) may have changed. Rerun to get " \
+                  "cross-references right.\n"
+        say("\n" + message + "\n")
+        log.append(message)
+    state['digest'].update(aux)
+    state['digest'].update(read_file(job + '.bbl') or '')
+    state['digest'].update(read_file(job + '.ind') or '')
+    pdf = "%%PDF-1.5\n%% stub %s\n%%%%EOF\n" % state['digest'].hexdigest()
+    write_file(job + '.pdf', pdf)
+    if recorder:
+        fls = ["PWD %s\n" % os.getcwd(),
+               "INPUT /usr/share/texlive/texmf-dist/web2c/texmf.cnf\n",
+               "INPUT /usr/share/texlive/texmf-dist/tex/latex/base/"
+               "book.cls\n"]
+        fls += ["INPUT %s\n" % filename for filename in inputs]
+        for extension in ['.aux', '.bbl', '.ind']:
+            if os.path.isfile(job + extension):
+                fls.append("INPUT %s%s\n" % (job, extension))
+        fls += ["OUTPUT %s%s\n" % (job, extension)
+                for extension in ['.aux', '.log', '.pdf']]
+        write_file(job + '.fls', "".join(fls))
+    say("Output written on %s.pdf (%d pages, %d bytes).\n"
+        "Transcript written on %s.log.\n"
+        % (job, state['page'], len(pdf), job))
+    write_file(job + '.log', "".join(log))
+    if not success:
+        return 1
+    return 0
+
+
+def bibtex(argv):
+    """ Stub of bibtex; return the exit code """
+    arguments = [argument for argument in argv if not argument.startswith('-')]
+    if len(arguments) == 0:
+        say("Usage: bibtex [OPTION]... AUXFILE[.aux]\n")
+        return 1
+    job = arguments[-1]
+    if job.endswith('.aux'):
+        job = job[:-4]
+    say("This is BibTeX, Version 0.99d (TeX Live 2022)\n"
+        "The top-level auxiliary file: %s.aux\n" % job)
+    aux = read_file(job + '.aux')
+    if aux is None:
+        say("I couldn't open file name `%s.aux'\n" % job)
+        return 1
+    time.sleep(delay('STUBTEX_BIBTEX_DELAY', 0.05))
+    entries = {}
+    for bibdata in _BIBDATA.findall(aux):
+        for name in bibdata.split(','):
+            name = name.strip()
+            if not name.endswith('.bib'):
+                name = name + '.bib'
+            say("Database file #%d: %s\n" % (len(entries) + 1, name))
+            content = read_file(name)
+            if content is None:
+                content = read_file(os.path.join(os.path.dirname(job), name))
+            if content is None:
+                say("I couldn't open database file %s\n" % name)
+                return 2
+            for key in _BIBENTRY.findall(content):
+                entries[key] = name
+    cited = []
+    warnings = 0
+    for key in _CITATION.findall(aux):
+        if key in cited:
+            continue
+        cited.append(key)
+        if not entries.has_key(key):
+            say("Warning--I didn't find a database entry for \"%s\"\n" % key)
+            warnings += 1
+    bbl = ["\\begin{thebibliography}{%d}\n\n" % len(cited)]
+    for key in cited:
+        if entries.has_key(key):
+            bbl.append("\\bibitem{%s}\nA.~Author.\n\\newblock Title of %s.\n"
+                       "\\newblock {\\em Journal}, 2022.\n\n" % (key, key))
+    bbl.append("\\end{thebibliography}\n")
+    write_file(job + '.bbl', "".join(bbl))
+    write_file(job + '.blg', "This is BibTeX stub\n")
+    if warnings > 0:
+        say("(There were %d warnings)\n" % warnings)
+    return 0
+
+
+def makeindex(argv):
+    """ Stub of makeindex; return the exit code """
+    inputfile = None
+    outputfile = None
+    index = 0
+    while index < len(argv):
+        if argv[index] in ['-s', '-o', '-t', '-p']:
+            if argv[index] == '-o' and index + 1 < len(argv):
+                outputfile = argv[index + 1]
+            index += 2
+            continue
+        if not argv[index].startswith('-'):
+            inputfile = argv[index]
+        index += 1
+    if inputfile is None:
+        say("Usage: makeindex [-ilqrcgLT] [-s sty] [-o ind] [idx0 ...]\n")
+        return 1
+    base, extension = os.path.splitext(inputfile)
+    if extension == '':
+        inputfile = inputfile + '.idx'
+    if outputfile is None:
+        outputfile = base + '.ind'
+    say("This is makeindex, version 2.16 [TeX Live 2022] "
+        "(kpathsea + Thai support).\n")
+    content = read_file(inputfile)
+    if content is None:
+        say("Index file %s not found.\n" % inputfile)
+        return 1
+    time.sleep(delay('STUBTEX_MAKEINDEX_DELAY', 0.05))
+    pages = {}
+    for item, page in _INDEXENTRY.findall(content):
+        pages.setdefault(item, []).append(int(page))
+    say("Scanning input file %s....done (%d entries accepted, 0 rejected).\n"
+        % (inputfile, sum([len(value) for value in pages.values()])))
+    items = pages.keys()
+    items.sort()
+    ind = ["\\begin{theindex}\n\n"]
+    for item in items:
+        numbers = sorted(set(pages[item]))
+        ind.append("  \\item %s, %s\n"
+                   % (item, ", ".join([str(number) for number in numbers])))
+    ind.append("\n\\end{theindex}\n")
+    write_file(outputfile, "".join(ind))
+    say("Sorting entries....done.\nGenerating output file %s....done "
+        "(%d lines written, 0 warnings).\nOutput written in %s.\n"
+        % (outputfile, len(ind) + 2, outputfile))
+    return 0
+
+
+def main():
+    """ Run the stub given on the command line """
+    if len(sys.argv) == 3 and sys.argv[1] == '--install':
+        install(sys.argv[2])
+        return 0
+    if len(sys.argv) < 2 or sys.argv[1] not in PROGRAMS:
+        print __doc__
+        return 2
+    program = {'pdflatex'  : pdflatex,
+               'bibtex'    : bibtex,
+               'makeindex' : makeindex}[sys.argv[1]]
+    return program(sys.argv[2:])
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -117,10 +117,31 @@ Options are:
                                   makeindex. (Default in stupid mode)
 
 
-  --makeindexbin='makindex %'     Set makindex command
+  --maxpasses=5                   Maximum number of consecutive runs of
+                                  the tex compiler. The compiler is run
+                                  again as long as a run changes the aux
+                                  files (.aux, .toc, .lof, .lot, .out)
+                                  or its output asks for a rerun.
+
+  --makeindexbin='makeindex %'    Set makeindex command. Several
+                                  commands can be given, separated by
+                                  ';', e.g. 'makeindex %; makeindex -s
+                                  nomencl.ist -o %.nls %.nlo' for a
+                                  nomenclature. The results of makeindex
+                                  are cached, and makeindex is only run
+                                  if its input file has changed.
 
   --bibtexbin='bibtex %'          Set bibtex command
 
+  --biberbin='biber %'            Set biber command. Biber is run instead
+                                  of bibtex for documents that use
+                                  biblatex with the biber backend (i.e.
+                                  for which the tex compiler writes a
+                                  .bcf file). The results of bibtex and
+                                  biber are cached, and they are only run
+                                  if the citations or the bibliography
+                                  files have changed.
+
   -e                              Compile only once and then exit, don't
   --exit                          launch viewer.
 
@@ -138,6 +159,105 @@ Options are:
   --autowatch                     Override 'autowatch = false' in conf
                                   file
 
+  --noinotify                     Don't use inotify to watch for changes,
+                                  but check the modification times of all
+                                  watchfiles every second.
+
+  --inotify                       Override 'inotify = false' in conf
+                                  file. If inotify is not available on
+                                  your system, the program falls back to
+                                  checking modification times.
+
+  --nocache                       Don't keep a cache of file digests etc.
+                                  in the '.texpreview' directory next to
+                                  the tex-file between sessions. With the
+                                  cache, the initial compilation is
+                                  skipped if the pdf of the last session
+                                  is still up to date.
+
+  --cache                         Override 'cache = false' in conf file
+
+  --precompile                    Precompile the preamble (everything
+                                  before \\begin{document}) into a format
+                                  file in the cache directory, so that
+                                  the packages don't have to be loaded in
+                                  every run of the tex compiler. The
+                                  format is rebuilt when the preamble or a
+                                  local package changes. Needs the
+                                  mylatexformat package and the cache.
+
+  --noprecompile                  Override 'precompile = true' in conf
+                                  file
+
+  --recorder                      Run the tex compiler with -recorder,
+                                  and watch exactly the files it reads
+                                  (except for the files of the tex
+                                  system). The watchlist is updated after
+                                  every run of the compiler.
+
+  --norecorder                    Override 'recorder = true' in conf file
+
+  --failfast                      Stop the tex compiler as soon as there
+                                  is an error in its output (and run it
+                                  with -halt-on-error). No further
+                                  programs are run after a failed run.
+
+  --nofailfast                    Override 'failfast = true' in conf file
+
+  --metrics=file                  Append a record (in JSON, one per line)
+                                  for every stage of every compilation
+                                  to this file: wall time, CPU time,
+                                  exit code and output size of each run
+                                  of the tex compiler, bibtex, makeindex,
+                                  ..., and the time from the detection
+                                  of a change to the new preview.
+
+  --prometheus=file               Write histograms of the durations of
+                                  the stages and of the preview latency
+                                  to this file after every compilation,
+                                  in the format of the textfile collector
+                                  of the Prometheus node exporter.
+
+  --trace=file                    Write a timeline of the compilations
+                                  to this file (in the Chrome trace event
+                                  format, which can be opened in
+                                  chrome://tracing or ui.perfetto.dev):
+                                  the waiting for changes, the checks of
+                                  the watchfiles, the compile stages and
+                                  each run of an external program.
+
+  --profile=file                  Allow profiling the running program:
+                                  send SIGUSR1 to start or stop profiling
+                                  the compile loop and the compilations,
+                                  and SIGUSR2 to write the profile and the
+                                  memory usage to file.N.prof and
+                                  file.N.txt (N counts the dumps).
+
+  --outdir=directory              Write all files generated by the
+                                  compilers (aux, log, pdf, ...) into
+                                  this directory instead of next to the
+                                  tex-file. The '%' wildcard is replaced
+                                  by the name of the tex-file without
+                                  extension. With --outdir=tmpfs, the
+                                  directory is created in /dev/shm, i.e.
+                                  in RAM. The cleanup removes the whole
+                                  directory if texpreview created it,
+                                  otherwise only the cleanup files in it.
+                                  The preview pdf is still created next
+                                  to the tex-file.
+
+  -j 1                            Number of tex-files that are compiled
+  --jobs=1                        at the same time. The output of each
+                                  compilation is printed in one piece
+                                  when it is finished.
+
+  --settle=0.3                    Number of seconds without any further
+                                  change after which a burst of changes
+                                  (e.g. an editor saving a backup first,
+                                  or a 'git checkout') is considered to
+                                  be over. All changes from one burst
+                                  lead to a single recompile.
+
   --dumpconfig                    Print a config file with the
                                   standard options to STDOUT and exit.
 
@@ -162,7 +282,7 @@ the texfile, without extension.
 
 The default string for the --cleanup option is:
 '%.dvi %.backup %.blg %.log %.toc %.bbl %.out %.bak %.snm %.idx %.ilg
- %.ind %.nav %.aux %.lot %.lof %.preview.pdf'
+ %.ind %.nav %.aux %.lot %.lof %.fls %.bcf %.run.xml %.preview.pdf'
 
 
 Use of Config Files
@@ -190,10 +310,16 @@ If the global config file does not exist, it is automatically created
 Watchlist Cababilities
 ======================
 
-If any of the files on the watchlist changes, all tex-files are
-recompiled. Any files included in the tex-file via the \include or
-\input commands will be on the watchlist automatically, unless the
---noautowatch option is specified"
+If any of the files on the watchlist of a tex-file changes, that
+tex-file is recompiled (a file that is on the watchlists of several
+tex-files recompiles each of them, the others are left alone). All
+files the tex-file depends on will be on the watchlist automatically,
+unless the --noautowatch option is specified: files included via
+\include, \input, or \inputTikZ (and recursively the files they
+include), graphics included via \includegraphics, bibliographies
+(\bibliography, \addbibresource), and local packages and classes. The
+watchlist follows the changes of these commands while the program is
+running.
 
 The tex-file that is being compiled is also on the watchlist
 automatically.
@@ -269,7 +395,13 @@ import os
 import time
 import ConfigParser
 from Texpreview.Texfile import Texfile
+from Texpreview.Watcher import create_watcher, collect_changes
+from Texpreview.WorkerPool import WorkerPool
+from Texpreview.Dependencies import DependencyGraph
+from Texpreview.Metrics import Metrics
 import Texpreview.TexpreviewPrinter as Out
+import Texpreview.Trace as Trace
+import Texpreview.Profiler as Profiler
 VERB_SILENT = Out.VERB_SILENT
 VERB_ERR    = Out.VERB_ERR
 VERB_WARN   = Out.VERB_WARN
@@ -287,6 +419,10 @@ USE_GLOBAL_CONFIG = True
 # if you change this.
 CONFIGFILENAME = 'texpreview.cfg'
 
+# While a compilation is running, the compile loop checks at least this often
+# (in seconds) whether it has finished
+RUNNINGPOLLTIME = 0.2
+
 
 def samefile(file1, file2):
     """ Fallback replacement for os.path.samefile (e.g. on Windows) """
@@ -297,20 +433,40 @@ if not hasattr(os.path, 'samefile'):
     os.path.samefile = samefile
 
 
+def positive_integer(name, value):
+    """ Return value (a string, e.g. from the command line or a config
+        file) as an integer if it is positive. Otherwise, warn that the
+        option 'name' has to be a positive integer, and return None.
+    """
+    try:
+        number = int(value)
+        if number < 1:
+            raise ValueError
+        return number
+    except ValueError:
+        Out.write("%s has to be a positive integer\n" % name, VERB_WARN)
+        return None
+
+
 def cmdline_to_dict():
     """ Parse the command line options into a dictionary
     """
     Out.write("Entering cmdline_to_dict\n", VERB_DEBUG)
     try:
-        opts, files = getopt.getopt(sys.argv[1:], "hw:c:v:o:e",
+        opts, files = getopt.getopt(sys.argv[1:], "hw:c:v:o:ej:",
                       ["help", "watch=", "compiler=","viewer=", "makeindex",
                        "dvi", "options=", "exit", "nocleanup",
                        "dvipdf=", "config=", "noconfig", "dumpconfig",
                        "bibtex", "bibtexbin=", "makeindexbin=", "nomakeindex",
-                       "nobibtex", "precommand=", "postcommand=",
+                       "biberbin=", "nobibtex", "precommand=", "postcommand=",
                        'cleanup=', "noautowatch", "autowatch", "smart",
                        "stupid", "extracompiler=", "verbosity=", "debug",
-                       "cverbosity=", "color", "nocolor"])
+                       "cverbosity=", "color", "nocolor", "inotify",
+                       "noinotify", "settle=", "cache", "nocache",
+                       "maxpasses=", "jobs=", "precompile", "noprecompile",
+                       "recorder", "norecorder", "outdir=", "failfast",
+                       "nofailfast", "metrics=", "prometheus=",
+                       "trace=", "profile="])
     except getopt.GetoptError, details:
         Out.write(details + "\n", VERB_ERR)
         sys.exit(2)
@@ -324,12 +480,18 @@ def cmdline_to_dict():
                      '-v'              : 'viewer',
                      '--viewer'        : 'viewer',
                      '--bibtexbin'     : 'bibtexbin',
+                     '--biberbin'      : 'biberbin',
                      '--makeindexbin'  : 'makeindexbin',
                      '--dvipdf'        : 'dvipdf',
                      '--precommand'    : 'precommand',
                      '--postcommand'   : 'postcommand',
                      '--config'        : 'config',
-                     '--extracompiler' : 'extracompiler'
+                     '--extracompiler' : 'extracompiler',
+                     '--outdir'        : 'outdir',
+                     '--metrics'       : 'metrics',
+                     '--prometheus'    : 'prometheus',
+                     '--trace'         : 'trace',
+                     '--profile'       : 'profile'
                     }
     boolean_options = { '--dvi'          : ('dvi', True),
                         '--makeindex'    : ('makeindex', True),
@@ -346,7 +508,17 @@ def cmdline_to_dict():
                         '-h'             : ('help', True),
                         '--help'         : ('help', True),
                         '--color'        : ('color', True),
-                        '--nocolor'      : ('color', False)
+                        '--nocolor'      : ('color', False),
+                        '--inotify'      : ('inotify', True),
+                        '--noinotify'    : ('inotify', False),
+                        '--cache'        : ('cache', True),
+                        '--nocache'      : ('cache', False),
+                        '--precompile'   : ('precompile', True),
+                        '--noprecompile' : ('precompile', False),
+                        '--recorder'     : ('recorder', True),
+                        '--norecorder'   : ('recorder', False),
+                        '--failfast'     : ('failfast', True),
+                        '--nofailfast'   : ('failfast', False)
                       }
     for opt, value in opts:
         if value.startswith('-'):
@@ -381,6 +553,26 @@ def cmdline_to_dict():
                 Out.write("verbosity has to be an integer between %i and %i" \
                           % (VERB_SILENT, VERB_DEBUG), VERB_WARN)
             continue
+        if opt in ("-j", "--jobs"):
+            jobs = positive_integer('jobs', value)
+            if jobs is not None:
+                cmdlineoptions['jobs'] = jobs
+            continue
+        if opt == "--maxpasses":
+            maxpasses = positive_integer('maxpasses', value)
+            if maxpasses is not None:
+                cmdlineoptions['maxpasses'] = maxpasses
+            continue
+        if opt == "--settle":
+            try:
+                settle = float(value)
+                if settle < 0:
+                    raise ValueError
+                cmdlineoptions['settle'] = settle
+            except ValueError:
+                Out.write("settle has to be a non-negative number of " \
+                          "seconds\n", VERB_WARN)
+            continue
         if opt == "--cverbosity":
             try:
                 cverbosity = int(value)
@@ -433,36 +625,101 @@ def set_home_env():
 
 
 
-def run_compile_loop(texfileobjects):
-    """ Run the compile loop for an array of Texfile objects
+def run_compile_loop(texfileobjects, watcher, settle, pool):
+    """ Run the compile loop for an array of Texfile objects. The loop
+        sleeps until the watcher reports a change to one of the
+        watchfiles. Changes are collected until there has been no new
+        change for 'settle' seconds, and then each affected Texfile is
+        recompiled once. Texfiles are compiled in parallel through the
+        WorkerPool 'pool'. The loop keeps watching while compilations are
+        running: if the sources of a Texfile change during its compilation,
+        the compilation is cancelled and restarted. Each iteration of the
+        loop is a section of the Profiler, and starts by carrying out the
+        requests that the Profiler received by signal.
     """
     Out.write("Going into compile loop.\n", VERB_DEBUG)
     print_running_message()
+    running = {} # Texfile objects that are being compiled -> Job
+    restart = [] # cancelled Texfile objects that need to be recompiled
     while True:
+        Profiler.poll()
+        Profiler.begin()
         try:
-            time.sleep(1)
+            watchfiles = []
             for texfileobject in texfileobjects:
-                if texfileobject.has_changed():
-                    if texfileobject.options['smart']:
-                        texfileobject.smartcompile()
-                    else:
-                        Out.write("Recompiling in stupid mode\n")
-                        texfileobject.run_latex()
-                        if texfileobject.options['dvi']:
-                            texfileobject.convert_dvi()
-                        texfileobject.create_previewfile()
+                watchfiles += texfileobject.watchfilelist()
+            watcher.set_files(watchfiles)
+            Out.flush()
+            Trace.flush()
+            Trace.begin('collect_changes', 'wait', {'running' : len(running)})
+            try:
+                if len(running) > 0:
+                    changedfiles = collect_changes(watcher, settle,
+                                                   timeout=RUNNINGPOLLTIME)
+                else:
+                    changedfiles = collect_changes(watcher, settle)
+            finally:
+                Trace.end('collect_changes', 'wait')
+            if changedfiles:
+                for texfileobject in texfileobjects:
+                    if texfileobject.has_changed(changedfiles):
+                        if running.has_key(texfileobject):
+                            if texfileobject not in restart:
+                                Trace.instant('cancel', 'loop',
+                                        {'document' : texfileobject.filename})
+                                texfileobject.cancel()
+                                restart.append(texfileobject)
+                        else:
+                            Trace.instant('submit', 'loop',
+                                        {'document' : texfileobject.filename})
+                            running[texfileobject] = \
+                                            pool.submit(recompile, texfileobject)
+            if len(running) > 0:
+                for job in pool.wait(0):
+                    texfileobject = job.args[0]
+                    del running[texfileobject]
+                    if texfileobject in restart:
+                        restart.remove(texfileobject)
+                        Trace.instant('restart', 'loop',
+                                      {'document' : texfileobject.filename})
+                        running[texfileobject] = \
+                                            pool.submit(recompile, texfileobject)
+                if len(running) == 0:
                     print_running_message()
         except KeyboardInterrupt:
             try:
                 Out.write("Hit Ctrl+C again to quit\n", VERB_SILENT)
+                pool.wait_all()
+                running.clear()
+                del restart[:]
                 time.sleep(1)
-                for texfileobject in texfileobjects:
-                    texfileobject.fullcompile()
+                pool.map(fullcompile, texfileobjects)
                 print_running_message()
             except KeyboardInterrupt:
+                pool.wait_all()
                 for texfileobject in texfileobjects:
                     texfileobject.cleanup()
                 return True # Success
+        finally:
+            Profiler.end()
+
+
+def recompile(texfileobject):
+    """ Recompile a Texfile after a change, according to its mode """
+    if texfileobject.options['smart']:
+        return texfileobject.smartcompile()
+    else:
+        return texfileobject.simplecompile()
+
+
+def firstcompile(texfileobject):
+    """ Make the first compilation of a Texfile """
+    return texfileobject.firstcompile()
+
+
+def fullcompile(texfileobject):
+    """ Make a complete unconditional compilation of a Texfile """
+    return texfileobject.fullcompile()
 
 
 def clean_exit(texfileobjects, postcommand):
@@ -484,17 +741,17 @@ def configure_output(options_dict):
             Out.activate_color()
     if options_dict.has_key('verbosity'):
         try:
-            Out.streams['direct']['verbosity'] = int(options_dict['verbosity'])
-            Out.write("Set verbosity to %s\n" \
-                               % Out.streams['direct']['verbosity'], VERB_DEBUG)
+            Out.set_verbosity('direct', int(options_dict['verbosity']))
+            Out.write("Set verbosity to %s\n", VERB_DEBUG,
+                      args=(Out.streams['direct']['verbosity'],))
         except ValueError:
             Out.write("Verbosity was not an integer in configure_output\n", \
                       VERB_WARN)
     if options_dict.has_key('cverbosity'):
         try:
-            Out.streams['sub']['verbosity'] = int(options_dict['cverbosity'])
-            Out.write("Set cverbosity to %s\n" \
-                               % Out.streams['sub']['verbosity'], VERB_DEBUG)
+            Out.set_verbosity('sub', int(options_dict['cverbosity']))
+            Out.write("Set cverbosity to %s\n", VERB_DEBUG,
+                      args=(Out.streams['sub']['verbosity'],))
         except ValueError:
             Out.write("Cverbosity was not an integer in configure_output\n", \
                       VERB_WARN)
@@ -531,7 +788,20 @@ def main():
                   "Nothing to do. Exit.\n", VERB_ERR)
         sys.exit(2)
 
+    # Start the trace
+    if options['trace'] != '':
+        if not Trace.start(options['trace']):
+            Out.write("Can't write the trace to %s\n" % options['trace'],
+                      VERB_WARN)
+
+    # Install the profiling hooks
+    if options['profile'] != '':
+        if not Profiler.install(options['profile']):
+            Out.write("Profiling is not supported on this system\n",
+                      VERB_WARN)
+
     # Generate Texfile objects
+    metrics = Metrics(options['metrics'], options['prometheus'])
     texfileobjects = []
     for texfile in options['files']:
         if not texfile.endswith('.tex'):
@@ -545,6 +815,7 @@ def main():
                 texfileobject.add_watchfile(watchfile)
             texfileobject.options['cleanup'] \
                 = options['cleanup'].split()
+            texfileobject.set_metrics(metrics)
             texfileobjects.append(texfileobject)
         else:
             Out.write("The file %s that you want to compile does not exist.\n" \
@@ -552,31 +823,31 @@ def main():
 
     # autowatch
     if options['autowatch']:
+        graph = DependencyGraph()
         for texfileobject in texfileobjects:
-            includefiles = texfileobject.get_includes()
-            for includefile in includefiles:
-                if includefile not in texfileobject.watchfilelist():
-                    Out.write("autowatch: Adding %s to %s watchfilelist\n" \
-                         % (includefile, texfileobject.filename), VERB_DEBUG)
-                    texfileobject.add_watchfile(includefile)
+            texfileobject.set_dependency_graph(graph)
 
     # Precommand
     run_command(options['precommand'], description = 'precommand')
 
     # Initial compilation
+    pool = WorkerPool(options['jobs'])
+    results = pool.map(firstcompile, texfileobjects)
+    if False in results:
+        cleanup(texfileobjects)
+        Out.write("Initial compilation failed\n", VERB_ERR)
+        exit(2)
+    # open viewer
     for texfileobject in texfileobjects:
-        if not texfileobject.firstcompile():
-            cleanup(texfileobjects)
-            Out.write("Initial compilation failed\n", VERB_ERR)
-            exit(2)
-        # open viewer
         texfileobject.launch_viewer()
 
     # exit if --exit
     if options['exit_after_compile']:
         clean_exit(texfileobjects, options['postcommand'])
     # Go into compile loop
-    run_compile_loop(texfileobjects)
+    watcher = create_watcher(options['inotify'])
+    run_compile_loop(texfileobjects, watcher, options['settle'], pool)
+    watcher.close()
 
     # Finish
     clean_exit(texfileobjects, options['postcommand'])
@@ -605,7 +876,8 @@ def hard_defaults():
     options['makeindex'] = True
     options['bibtex'] = True
     options['makeindexbin'] = 'makeindex %'
-    options['bibtexbin'] = 'makeindex %'
+    options['bibtexbin'] = 'bibtex %'
+    options['biberbin'] = 'biber %'
     options['dvi'] = False
     options['exit_after_compile'] = False
     options['dvipdf'] = 'dvipdf %.dvi'
@@ -618,8 +890,22 @@ def hard_defaults():
     options['color'] = False
     options['cleanup'] = '%.dvi %.backup %.blg %.log %.toc %.bbl %.out ' \
                               + '%.bak %.snm %.idx %.ilg %.ind %.nav %.aux ' \
-                              + '%.lot %.lof %.preview.pdf'
+                              + '%.lot %.lof %.fls %.bcf %.run.xml ' \
+                              + '%.preview.pdf'
     options['autowatch'] = True
+    options['inotify'] = True
+    options['settle'] = 0.3
+    options['cache'] = True
+    options['maxpasses'] = 5
+    options['jobs'] = 1
+    options['precompile'] = False
+    options['recorder'] = False
+    options['outdir'] = ''
+    options['failfast'] = False
+    options['metrics'] = ''
+    options['prometheus'] = ''
+    options['trace'] = ''
+    options['profile'] = ''
     return options
 
 def create_configfile(configfilename=None):
@@ -648,17 +934,31 @@ def create_configfile(configfilename=None):
             configfile.write("makeindex = True\n")
             configfile.write("dvi = False\n")
             configfile.write("autowatch = True\n")
+            configfile.write("inotify = True\n")
+            configfile.write("settle = 0.3\n")
+            configfile.write("cache = True\n")
+            configfile.write("maxpasses = 5\n")
+            configfile.write("jobs = 1\n")
+            configfile.write("precompile = False\n")
+            configfile.write("recorder = False\n")
+            configfile.write("outdir = \n")
+            configfile.write("failfast = False\n")
+            configfile.write("metrics = \n")
+            configfile.write("prometheus = \n")
+            configfile.write("trace = \n")
+            configfile.write("profile = \n")
             configfile.write("color = False\n")
             configfile.write("verbosity = %s\n" % VERB_STATUS)
             configfile.write("cverbosity = %s\n" % VERB_WARN)
             configfile.write("exit_after_compile = False\n")
             configfile.write("cleanup = %.dvi %.backup %.blg %.log " \
                              + "%.bbl %.out %.bak %.snm %.idx %.ilg %.ind " \
-                             +  "%.nav %.aux %.lot %.lof %.toc "
-                             +  "%.preview.pdf\n")
+                             +  "%.nav %.aux %.lot %.lof %.toc %.fls "
+                             +  "%.bcf %.run.xml %.preview.pdf\n")
             configfile.write("dvipdf = dvipdf %.dvi\n")
             configfile.write("makeindexbin = makeindex %\n")
             configfile.write("bibtexbin = bibtex %\n")
+            configfile.write("biberbin = biber %\n")
             configfile.write("no_cleanup = False\n")
             configfile.write("precommand = \n")
             configfile.write("postcommand = \n")
@@ -716,6 +1016,7 @@ def read_configfiles(options, configfiles):
                 'bibtex' : parser.getboolean,
                 'makeindexbin' : parser.get,
                 'bibtexbin' : parser.get,
+                'biberbin' : parser.get,
                 'dvi' : parser.getboolean,
                 'exit_after_compile' : parser.getboolean,
                 'dvipdf' : parser.get,
@@ -723,6 +1024,19 @@ def read_configfiles(options, configfiles):
                 'postcommand' : parser.get,
                 'extracompiler' : parser.get,
                 'autowatch' : parser.getboolean,
+                'inotify' : parser.getboolean,
+                'settle' : parser.getfloat,
+                'cache' : parser.getboolean,
+                'maxpasses' : parser.get, # see positive_integer
+                'jobs' : parser.get,
+                'precompile' : parser.getboolean,
+                'recorder' : parser.getboolean,
+                'outdir' : parser.get,
+                'failfast' : parser.getboolean,
+                'metrics' : parser.get,
+                'prometheus' : parser.get,
+                'trace' : parser.get,
+                'profile' : parser.get,
                 'cleanup' : parser.get,
                 'smart' : parser.get,
                 'no_cleanup' : parser.getboolean,
@@ -733,7 +1047,12 @@ def read_configfiles(options, configfiles):
             for field in fields:
                 if parser.has_option('options', field):
                     getter = fields[field]
-                    result[field] = getter('options', field)
+                    value = getter('options', field)
+                    if field in ('maxpasses', 'jobs'):
+                        value = positive_integer(field, value)
+                        if value is None:
+                            continue
+                    result[field] = value
                     Out.write("read_configfiles: Set option " \
                               + "'%s' to '%s' " % (field, result[field]) \
                               +"from config file\n", VERB_DEBUG)
@@ -889,10 +1208,13 @@ def transfer_options(cmdlineoptions, options):
     """
     Out.write("Entering transfer_options\n", VERB_DEBUG)
     keys = ['watchfiles', 'texcompiler', 'compileroptions', 'dvi',
-            'makeindex', 'bibtex', 'makeindexbin', 'bibtexbin',
+            'makeindex', 'bibtex', 'makeindexbin', 'bibtexbin', 'biberbin',
             'no_cleanup', 'exit_after_compile', 'viewer', 'precommand',
             'postcommand', 'cleanup', 'autowatch', 'extracompiler', 'smart',
-            'cverbosity', 'verbosity', 'color']
+            'cverbosity', 'verbosity', 'color', 'inotify', 'settle',
+            'cache', 'maxpasses', 'jobs', 'precompile', 'recorder',
+            'outdir', 'failfast', 'metrics', 'prometheus',
+            'trace', 'profile']
     for key in keys:
         if cmdlineoptions.has_key(key):
             options[key] = cmdlineoptions[key]